@@ -0,0 +1,68 @@
+# Show what request coalescing saves: a batch where every prompt appears
+# several times, sent concurrently to the mock server, against a batch of
+# the same size with no duplicates. Reports wall time and how many image
+# requests reached the server.
+#
+# Run from the repository root:
+#     python -m benchmarks.bench_coalesce --prompts 8 --duplicates 4
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from imagegen.cache import configure_cache
+from imagegen.client import generate_images
+from imagegen.mockserver import MockConfig, start_mock_server
+from imagegen.providers import configure_provider
+from imagegen.session import ensure_pool_size
+from imagegen.singleflight import get_single_flight
+
+
+def run(name, jobs, stats):
+    before = stats["images"]
+    flight = get_single_flight().stats
+    coalesced_before = flight["coalesced"]
+    ensure_pool_size(len(jobs))
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        list(pool.map(lambda job: generate_images("", *job), jobs))
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:<12}{len(jobs):>6}{stats['images'] - before:>10}"
+        f"{flight['coalesced'] - coalesced_before:>11}{elapsed:>9.2f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark request coalescing")
+    parser.add_argument("--prompts", type=int, default=8)
+    parser.add_argument("--duplicates", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--size", type=int, default=512)
+    args = parser.parse_args()
+
+    server = start_mock_server(MockConfig(args.latency))
+    configure_provider(
+        "mock", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1"
+    )
+    configure_cache(enabled=False)  # Only coalescing may save requests
+    stats = server.RequestHandlerClass.stats
+    size = (args.size, args.size)
+
+    print(f"{'batch':<12}{'jobs':>6}{'requests':>10}{'coalesced':>11}{'s':>9}")
+    duplicated = [
+        (f"prompt {index}", *size, index)
+        for index in range(args.prompts)
+        for _ in range(args.duplicates)
+    ]
+    run("duplicated", duplicated, stats)
+    distinct = [
+        (f"prompt {index}", *size, 1000 + copy * args.prompts + index)
+        for index in range(args.prompts)
+        for copy in range(args.duplicates)
+    ]
+    run("distinct", distinct, stats)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# Compare the old PIL -> PNG -> QPixmap display path with the direct
+# decode -> QImage path for every preset image size. Each case runs in a
+# fresh interpreter so peak RSS is attributable to that case alone.
+#
+# Run from the repository root:
+#     python -m benchmarks.bench_decode --repeat 5
+import argparse
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from io import BytesIO
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+def make_png(width, height):
+    # Smooth gradients with noise compress roughly like generated images
+    from PIL import Image
+
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 48)
+    image = Image.merge(
+        "RGB", (gradient, noise, gradient.transpose(Image.FLIP_TOP_BOTTOM))
+    )
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def legacy_path(image_data):
+    from PIL import Image
+    from PyQt5.QtGui import QPixmap
+
+    pil_image = Image.open(BytesIO(image_data))
+    if pil_image.mode != "RGB":
+        pil_image = pil_image.convert("RGB")
+    img_buffer = BytesIO()
+    pil_image.save(img_buffer, format="PNG")
+    pixmap = QPixmap()
+    pixmap.loadFromData(img_buffer.getvalue())
+    return pixmap
+
+
+def direct_path(image_data):
+    from PyQt5.QtGui import QPixmap
+
+    from gui import qimage_from_data
+
+    return QPixmap.fromImage(qimage_from_data(image_data))
+
+
+PATHS = {"legacy": legacy_path, "direct": direct_path}
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def run_worker(path_name, width, height, repeat):
+    from PyQt5.QtWidgets import QApplication
+
+    import gui  # noqa: F401  Import cost is excluded from the measurement
+
+    app = QApplication([])
+    image_data = make_png(width, height)
+    baseline = peak_rss_mb()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        pixmap = PATHS[path_name](image_data)
+        timings.append(time.perf_counter() - start)
+        assert not pixmap.isNull()
+        del pixmap
+    print(f"{statistics.median(timings)} {peak_rss_mb() - baseline}")
+    del app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark image display decode")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--worker", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        path_name, width, height = args.worker
+        run_worker(path_name, int(width), int(height), args.repeat)
+        return
+
+    from gui import SIZE_PRESETS
+
+    print(
+        f"{'size':<28}{'legacy ms':>11}{'direct ms':>11}{'legacy MB':>11}{'direct MB':>11}"
+    )
+    for name, (width, height) in SIZE_PRESETS.items():
+        results = {}
+        for path_name in PATHS:
+            output = subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "benchmarks.bench_decode",
+                    "--repeat",
+                    str(args.repeat),
+                    "--worker",
+                    path_name,
+                    str(width),
+                    str(height),
+                ],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.split()
+            results[path_name] = float(output[-2]) * 1000, float(output[-1])
+        print(
+            f"{name:<28}"
+            f"{results['legacy'][0]:11.1f}{results['direct'][0]:11.1f}"
+            f"{results['legacy'][1]:11.1f}{results['direct'][1]:11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# Round trips and wall time to enhance many prompts against the mock
+# server: one prompt per chat completion request versus batches of prompts
+# per request with a JSON reply, both with the same number of requests in
+# flight. The mock server answers a batch more slowly the more prompts it
+# holds, like a model writing a longer reply.
+#
+# Run from the repository root:
+#     python -m benchmarks.bench_enhance_batch --prompts 200 --batch-size 16
+import argparse
+import time
+
+from imagegen.enhance import configure_memo, enhance_many
+from imagegen.mockserver import MockConfig, start_mock_server
+from imagegen.providers import configure_provider
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched enhancement")
+    parser.add_argument("--prompts", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--item-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    server = start_mock_server(
+        MockConfig(enhance_latency=args.latency, enhance_item_latency=args.item_latency)
+    )
+    configure_provider(
+        "mock", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1"
+    )
+    configure_memo(enabled=False)  # Every prompt must reach the server
+    stats = server.RequestHandlerClass.stats
+
+    print(f"{'prompts/request':<17}{'prompts':>8}{'requests':>10}{'s':>8}")
+    for batch_size in (1, args.batch_size):
+        prompts = [f"prompt {batch_size} {index}" for index in range(args.prompts)]
+        before = stats["enhancements"]
+        start = time.perf_counter()
+        enhance_many("", prompts, batch_size, args.concurrency)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{batch_size:<17}{len(prompts):>8}"
+            f"{stats['enhancements'] - before:>10}{elapsed:>8.2f}"
+        )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# How soon enhanced text appears: the time until the first piece of a
+# streamed enhancement versus the time until a non-streamed one returns,
+# against the mock server, which writes its reply word by word.
+#
+# Run from the repository root:
+#     python -m benchmarks.bench_enhance_stream --runs 10 --token-latency 0.03
+import argparse
+import statistics
+import time
+
+from imagegen.enhance import request_enhancements, stream_enhancement
+from imagegen.mockserver import MockConfig, start_mock_server
+from imagegen.providers import configure_provider
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streamed enhancement")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--token-latency", type=float, default=0.03)
+    args = parser.parse_args()
+
+    server = start_mock_server(
+        MockConfig(
+            enhance_latency=args.latency, enhance_token_latency=args.token_latency
+        )
+    )
+    configure_provider(
+        "mock", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1"
+    )
+    prompt = "a lighthouse on a cliff at dusk, waves below, " * 4
+    request_enhancements("", "warm up")  # Import openai and connect first
+
+    first, streamed, whole = [], [], []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        for index, _piece in enumerate(stream_enhancement("", prompt)):
+            if index == 0:
+                first.append(time.perf_counter() - start)
+        streamed.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        request_enhancements("", prompt)
+        whole.append(time.perf_counter() - start)
+
+    print(f"{'mode':<12}{'first text s':>14}{'complete s':>12}")
+    print(
+        f"{'streamed':<12}{statistics.median(first):>14.2f}"
+        f"{statistics.median(streamed):>12.2f}"
+    )
+    print(
+        f"{'whole':<12}{statistics.median(whole):>14.2f}"
+        f"{statistics.median(whole):>12.2f}"
+    )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
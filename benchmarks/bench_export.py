@@ -0,0 +1,52 @@
+# Time imagegen.export: encode time and output size per format for one
+# image, then bulk export of many images with one worker versus a pool.
+# The "raw" row is the old download path, which wrote the API's PNG bytes
+# whatever extension was chosen.
+#
+# Run from the repository root:
+#     python -m benchmarks.bench_export --size 1024 --count 32
+import argparse
+import os
+import tempfile
+import time
+
+from imagegen.export import available_formats, encode_image, export_many
+from imagegen.mockserver import synthetic_png
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark image export")
+    parser.add_argument("--size", type=int, default=1024, help="Image side in px")
+    parser.add_argument("--count", type=int, default=32, help="Images to bulk export")
+    parser.add_argument("--quality", type=int, default=90)
+    args = parser.parse_args()
+
+    source = synthetic_png(args.size, args.size, 3)
+    print(f"{'format':<8}{'ms':>9}{'KiB':>9}")
+    print(f"{'raw':<8}{0.0:9.1f}{len(source) / 1024:9.1f}")
+    formats = available_formats()
+    for fmt in formats:
+        start = time.perf_counter()
+        encoded = encode_image(source, fmt, args.quality, png_compression=6)
+        elapsed = time.perf_counter() - start
+        print(f"{fmt:<8}{elapsed * 1000:9.1f}{len(encoded) / 1024:9.1f}")
+
+    workers = os.cpu_count() or 4
+    items = [(f"image_{index:04d}", source) for index in range(args.count)]
+    print(f"\nbulk export of {args.count} images")
+    for fmt in ("jpeg", "webp"):
+        if fmt not in formats:
+            continue
+        for max_workers in sorted({1, workers}):
+            with tempfile.TemporaryDirectory() as output_dir:
+                start = time.perf_counter()
+                export_many(items, output_dir, fmt, max_workers, quality=args.quality)
+                elapsed = time.perf_counter() - start
+            print(
+                f"{fmt:<6}{max_workers:>3} workers {elapsed:7.2f} s "
+                f"{args.count / elapsed:7.1f} images/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
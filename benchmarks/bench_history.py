@@ -0,0 +1,88 @@
+# Time HistoryStore inserts and queries on a large history. Every entry
+# shares one tiny image (stored once, by content hash), so the run measures
+# the index rather than the disk. Queries are compared with the scans the
+# index replaces: LIKE over prompts and OFFSET paging.
+#
+# Run from the repository root:
+#     python -m benchmarks.bench_history --entries 200000
+import argparse
+import random
+import statistics
+import tempfile
+import time
+
+from imagegen.history import HistoryStore
+from imagegen.mockserver import synthetic_png
+
+WORDS = (
+    "fox cat dragon castle forest river neon city portrait sunset robot "
+    "ocean mountain watercolor oil painting cyberpunk medieval galaxy "
+    "flower garden desert storm lighthouse snow cozy cabin astronaut"
+).split()
+SIZES = [(512, 512), (768, 1024), (1024, 768), (1024, 1024), (1024, 1536)]
+
+
+def timed(function, repeat=20):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the history index")
+    parser.add_argument("--entries", type=int, default=200000)
+    args = parser.parse_args()
+
+    random.seed(1)
+    image = synthetic_png(64, 64, 1)
+    with tempfile.TemporaryDirectory() as root:
+        store = HistoryStore(root)
+        start = time.perf_counter()
+        for index in range(args.entries):
+            width, height = random.choice(SIZES)
+            prompt = " ".join(random.sample(WORDS, 6)) + f" #{index}"
+            store.add(image, prompt, width, height, index, 64, "bench")
+        elapsed = time.perf_counter() - start
+        print(f"insert   {args.entries / elapsed:9.0f} entries/s")
+
+        db = store._connect()
+        oldest_id = store.page(1)[0].id - args.entries + 1000
+        since = time.time() - 60
+        queries = [
+            ("count", lambda: store.count()),
+            ("first page", lambda: len(store.page(200))),
+            ("deep page", lambda: len(store.page(200, before_id=oldest_id))),
+            (
+                "deep page (OFFSET)",
+                lambda: len(
+                    db.execute(
+                        "SELECT * FROM generations ORDER BY id DESC"
+                        " LIMIT 200 OFFSET ?",
+                        (args.entries - 1000,),
+                    ).fetchall()
+                ),
+            ),
+            ("search 'dragon castle'", lambda: store.count(search="dragon castle")),
+            (
+                "search (LIKE)",
+                lambda: db.execute(
+                    "SELECT COUNT(*) FROM generations WHERE prompt LIKE ?"
+                    " AND prompt LIKE ?",
+                    ("%dragon%", "%castle%"),
+                ).fetchone()[0],
+            ),
+            ("search page", lambda: len(store.search("dragon castle", 200))),
+            ("last minute", lambda: store.count(since=since)),
+            ("size 768x1024", lambda: store.count(size=(768, 1024))),
+        ]
+        print(f"{'query':<24}{'ms':>9}{'rows':>9}")
+        for name, query in queries:
+            ms, rows = timed(query)
+            print(f"{name:<24}{ms:9.2f}{rows:>9}")
+
+
+if __name__ == "__main__":
+    main()
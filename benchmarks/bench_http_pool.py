@@ -0,0 +1,101 @@
+# Compare bare requests.post calls with the shared pooled session against a
+# local stub server.
+#
+# Run from the repository root:
+#     python -m benchmarks.bench_http_pool --requests 500 --concurrency 4
+import argparse
+import base64
+import json
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from imagegen.session import configure_session, get_timeout
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Allow keep-alive
+    payload = b"{}"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(self.payload)))
+        self.end_headers()
+        self.wfile.write(self.payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(payload_bytes):
+    image = base64.b64encode(os.urandom(payload_bytes)).decode("ascii")
+    StubHandler.payload = json.dumps({"data": [{"b64_json": image}]}).encode()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run(label, send, url, total, concurrency):
+    data = {"model": "stub", "prompt": "benchmark"}
+    latencies = []
+
+    def one(_):
+        start = time.perf_counter()
+        response = send(url, json=data, timeout=get_timeout())
+        response.content
+        latencies.append(time.perf_counter() - start)
+        return response.status_code
+
+    # Warm up so both modes start from the same state
+    for _ in range(min(10, total)):
+        one(None)
+    latencies.clear()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        statuses = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+
+    cuts = statistics.quantiles(latencies, n=100)
+    failures = sum(1 for status in statuses if status != 200)
+    print(
+        f"{label:<10} {total / elapsed:9.1f} req/s   "
+        f"p50 {cuts[49] * 1000:7.2f} ms   p95 {cuts[94] * 1000:7.2f} ms   "
+        f"failures {failures}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark pooled vs unpooled HTTP requests"
+    )
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--payload-bytes", type=int, default=64 * 1024)
+    parser.add_argument("--pool-maxsize", type=int, default=16)
+    args = parser.parse_args()
+
+    server = start_stub_server(args.payload_bytes)
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1/images/generations"
+    session = configure_session(pool_maxsize=args.pool_maxsize)
+
+    print(
+        f"{args.requests} requests, concurrency {args.concurrency}, "
+        f"{args.payload_bytes} byte images"
+    )
+    run("unpooled", requests.post, url, args.requests, args.concurrency)
+    run("pooled", session.post, url, args.requests, args.concurrency)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
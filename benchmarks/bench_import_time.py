@@ -0,0 +1,64 @@
+# Measure how long it takes to import the headless entry points compared
+# with the GUI module, using `python -X importtime` in fresh interpreters.
+#
+# Run from the repository root:
+#     python -m benchmarks.bench_import_time --runs 5
+import argparse
+import statistics
+import subprocess
+import sys
+
+
+TARGETS = ["imagegen", "imagegen.cli", "imagegen.batch", "gui"]
+
+
+def import_profile(module):
+    # Returns [(depth, name, cumulative_us)] for one fresh interpreter
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    profile = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, raw_name = line.split("|")
+        depth = len(raw_name) - len(raw_name.lstrip())
+        profile.append((depth, raw_name.strip(), int(cumulative_us)))
+    return profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark module import time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5, help="heaviest imports shown")
+    parser.add_argument("modules", nargs="*", default=TARGETS)
+    args = parser.parse_args()
+
+    for module in args.modules:
+        try:
+            profiles = [import_profile(module) for _ in range(args.runs)]
+        except subprocess.CalledProcessError as e:
+            print(f"{module:<16} failed to import: {e.stderr.strip().splitlines()[-1]}")
+            continue
+        totals = [dict((n, us) for _, n, us in p)[module] for p in profiles]
+        total_ms = statistics.median(totals) / 1000
+        # importtime lists a module's imports just before the module itself
+        profile = profiles[-1]
+        index = max(i for i, (_, n, _) in enumerate(profile) if n == module)
+        depth = profile[index][0]
+        children = []
+        for child_depth, name, us in reversed(profile[:index]):
+            if child_depth <= depth:
+                break
+            if child_depth == depth + 2:
+                children.append((us, name))
+        heaviest = sorted(children, reverse=True)[: args.top]
+        details = ", ".join(f"{n} {us / 1000:.1f}" for us, n in heaviest) or "-"
+        print(f"{module:<16} {total_ms:8.1f} ms   heaviest (ms): {details}")
+
+
+if __name__ == "__main__":
+    main()
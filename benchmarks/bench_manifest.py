@@ -0,0 +1,76 @@
+# What resumable manifest runs cost: the time to read a large manifest and
+# skip the jobs its checkpoint journal lists as finished (the work a resumed
+# run does before its first request), and the time to record one finished
+# job, which flushes the journal to disk.
+#
+# Run from the repository root:
+#     python -m benchmarks.bench_manifest --rows 100000 --done 0.5
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from imagegen.manifest import CheckpointJournal, read_manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark manifest resume")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument(
+        "--done", type=float, default=0.5, help="share of rows already finished"
+    )
+    parser.add_argument("--records", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        manifest = os.path.join(directory, "jobs.jsonl")
+        with open(manifest, "w") as f:
+            for index in range(args.rows):
+                row = {"prompt": f"prompt {index}", "size": "1024x1024", "seed": index}
+                f.write(json.dumps(row) + "\n")
+
+        journal = CheckpointJournal(os.path.join(directory, "checkpoint.jsonl"))
+        finished = int(args.rows * args.done)
+        start = time.perf_counter()
+        for entry in read_manifest(manifest):
+            if entry.index >= finished:
+                break
+            journal.record(entry.key)
+            if entry.index + 1 >= args.records:
+                break
+        recorded = len(journal)
+        per_record = (time.perf_counter() - start) / max(1, recorded)
+        journal.close()
+
+        # Fill in the rest of the journal without flushing, as a stand-in
+        # for a long run
+        with open(journal.path, "a") as f:
+            for entry in read_manifest(manifest):
+                if entry.index >= finished:
+                    break
+                if entry.index >= recorded:
+                    f.write(json.dumps({"key": entry.key}) + "\n")
+
+        start = time.perf_counter()
+        journal = CheckpointJournal(journal.path)
+        loaded = time.perf_counter() - start
+        skipped = pending = 0
+        for entry in read_manifest(manifest):
+            if entry.key in journal:
+                skipped += 1
+            else:
+                pending += 1
+        scanned = time.perf_counter() - start
+        journal.close()
+
+    print(f"record one finished job: {per_record * 1000:.2f} ms ({recorded} jobs)")
+    print(f"load journal of {finished} jobs: {loaded:.2f} s")
+    print(
+        f"resume scan: {args.rows} rows in {scanned:.2f} s "
+        f"({args.rows / scanned:,.0f} rows/s), {skipped} skipped, {pending} to run"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# Load-test the whole generation pipeline (pooled session, streaming
+# parser, retries, decode) against the bundled mock server, offline and
+# for free. Reports throughput, latency percentiles and failures per
+# concurrency level.
+#
+# Run from the repository root:
+#     python -m benchmarks.bench_pipeline --requests 200 --concurrency 1 4 16
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from imagegen.cache import configure_cache
+from imagegen.client import generate_image
+from imagegen.decode import decode_pixels
+from imagegen.mockserver import MockConfig, start_mock_server
+from imagegen.providers import configure_provider
+from imagegen.retry import configure_retry_policy
+from imagegen.session import ensure_pool_size
+
+
+def run(total, concurrency, size, decode):
+    latencies = []
+    failures = 0
+
+    def one(index):
+        start = time.perf_counter()
+        try:
+            status_code, _, image_data = generate_image(
+                "", f"benchmark {index}", size, size, seed=index
+            )
+            if decode and image_data:
+                decode_pixels(image_data)
+            ok = status_code == 200 and image_data is not None
+        except Exception:
+            ok = False
+        latencies.append(time.perf_counter() - start)
+        return ok
+
+    ensure_pool_size(concurrency)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+    failures = results.count(False)
+
+    cuts = statistics.quantiles(latencies, n=100)
+    print(
+        f"{concurrency:>11} {total / elapsed:9.1f} req/s   "
+        f"p50 {cuts[49] * 1000:7.1f} ms   p95 {cuts[94] * 1000:7.1f} ms   "
+        f"p99 {cuts[98] * 1000:7.1f} ms   failures {failures}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the client pipeline against the mock server"
+    )
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--size", type=int, default=1024, help="Image side in px")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--no-decode", action="store_true")
+    args = parser.parse_args()
+
+    config = MockConfig(args.latency, args.jitter, error_rate=args.error_rate)
+    server = start_mock_server(config)
+    configure_provider(
+        "mock", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1"
+    )
+    configure_cache(enabled=False)  # Every request must reach the server
+    configure_retry_policy(base_delay=0.05)
+
+    print(
+        f"{args.requests} requests of {args.size}x{args.size}, "
+        f"latency {args.latency}s ± {args.jitter}s, error rate {args.error_rate}"
+    )
+    print(f"{'concurrency':>11} {'throughput':>15}")
+    for concurrency in args.concurrency:
+        run(args.requests, concurrency, args.size, not args.no_decode)
+    stats = server.RequestHandlerClass.stats
+    print(f"server: {stats['images']} images, {stats['errors']} errors")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# Time and peak memory of local post-processing (Lanczos upscale plus
+# unsharp mask, encoded as PNG) for one image: the whole image at once in
+# one process versus tiles on the process pool. Each mode runs in a fresh
+# interpreter so its peak RSS is its own.
+#
+# Run from the repository root:
+#     python -m benchmarks.bench_postprocess --size 1024 --scale 4
+import argparse
+import json
+import subprocess
+import sys
+
+CHILD = """
+import json, resource, sys, time
+from io import BytesIO
+from PIL import Image
+from imagegen.export import encode_pil_image
+from imagegen.postprocess import PostProcess, get_process_pool, process_region
+
+mode, size, scale, tile_size = sys.argv[1], int(sys.argv[2]), float(sys.argv[3]), int(sys.argv[4])
+if __name__ == "__main__":
+    noise = Image.effect_noise((size, size), 64)
+    source = Image.merge("RGB", [noise, noise.transpose(Image.ROTATE_90), noise])
+    buffer = BytesIO()
+    source.save(buffer, "PNG", compress_level=1)
+    image_data = buffer.getvalue()
+    del noise, source, buffer
+    postprocess = PostProcess(scale, 1.0, png_compression=1, tile_size=tile_size)
+    if mode == "tiled":
+        get_process_pool().submit(int).result()  # Start the workers first
+    start = time.perf_counter()
+    if mode == "tiled":
+        output = postprocess.apply(image_data)
+    else:
+        source = Image.open(BytesIO(image_data))
+        width, height = postprocess.output_size(*source.size)
+        output = encode_pil_image(
+            process_region(source, (width, height), 1.0), "png", png_compression=1
+        )
+    elapsed = time.perf_counter() - start
+    get_process_pool().shutdown()
+    print(json.dumps({
+        "seconds": elapsed,
+        "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "worker_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+        "output_mb": len(output) / 2**20,
+    }))
+"""
+
+
+def run(mode, size, scale, tile_size):
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD, mode, str(size), str(scale), str(tile_size)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark image post-processing")
+    parser.add_argument("--size", type=int, default=1024, help="Source side in px")
+    parser.add_argument("--scale", type=float, default=4.0)
+    parser.add_argument("--tile-size", type=int, default=1024)
+    args = parser.parse_args()
+
+    side = round(args.size * args.scale)
+    print(f"{args.size}px -> {side}px, sharpened, PNG")
+    print(f"{'mode':<8}{'s':>8}{'peak RSS MB':>13}{'worker MB':>11}")
+    for mode in ("whole", "tiled"):
+        stats = run(mode, args.size, args.scale, args.tile_size)
+        print(
+            f"{mode:<8}{stats['seconds']:8.2f}{stats['rss_mb']:13.0f}"
+            f"{stats['worker_rss_mb']:11.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
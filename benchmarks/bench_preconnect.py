@@ -0,0 +1,56 @@
+# Show what pre-connecting saves: the first request on a fresh HTTP
+# session, cold versus after preconnect() has opened its connection. By
+# default against the mock server, where setup is only a local TCP
+# handshake; pass --base-url of a real endpoint to see DNS and TLS too
+# (no key needed, an error response is timed just the same).
+#
+# Run from the repository root:
+#     python -m benchmarks.bench_preconnect --rounds 20
+#     python -m benchmarks.bench_preconnect --base-url https://api.studio.nebius.com/v1
+import argparse
+import statistics
+import time
+
+from imagegen.mockserver import MockConfig, start_mock_server
+from imagegen.session import close_session, get_session, get_timeout, preconnect
+from imagegen.trace import Trace, tracing
+
+
+def first_request(url, warm):
+    close_session()  # Nothing left over from the previous round
+    if warm:
+        preconnect(url)
+    trace = Trace("bench")
+    start = time.perf_counter()
+    with tracing(trace):
+        get_session().get(url, timeout=get_timeout()).content
+    return time.perf_counter() - start, trace.connection_seconds()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pre-connecting")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--base-url", help="endpoint to time instead of the mock")
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server = start_mock_server(MockConfig())
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    url = base_url.rstrip("/") + "/models"
+
+    print(f"{'first request':<16}{'p50 ms':>9}{'max ms':>9}{'setup ms':>10}")
+    for name, warm in (("cold", False), ("pre-connected", True)):
+        times, setups = zip(*(first_request(url, warm) for _ in range(args.rounds)))
+        print(
+            f"{name:<16}{statistics.median(times) * 1000:9.2f}"
+            f"{max(times) * 1000:9.2f}{statistics.median(setups) * 1000:10.2f}"
+        )
+    close_session()
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# Time ImageLabel rescaling. "legacy" smooth-scales the full-resolution
+# original on every event like the old updateScaledPixmap, "current" is
+# ImageLabel as shipped. Three scenarios:
+#   drag    a splitter drag, simulated as a sweep of resize events
+#   layout  a few window layouts, each resize followed by the smooth pass
+#   repeat  the same layouts again, served from the scaled-size cache
+#
+# Run from the repository root:
+#     python -m benchmarks.bench_rescale --size 2000 --steps 60
+import argparse
+import os
+import statistics
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+def make_image(side):
+    from PyQt5.QtGui import QColor, QImage, QLinearGradient, QPainter
+
+    image = QImage(side, side, QImage.Format_RGB32)
+    painter = QPainter(image)
+    gradient = QLinearGradient(0, 0, side, side)
+    gradient.setColorAt(0, QColor(30, 60, 200))
+    gradient.setColorAt(1, QColor(240, 200, 40))
+    painter.fillRect(image.rect(), gradient)
+    painter.end()
+    return image
+
+
+def drag_sizes(steps):
+    # Left to right and back, like a splitter being dragged
+    widths = [400 + 500 * i // steps for i in range(steps)]
+    return [(width, 600) for width in widths + widths[::-1]]
+
+
+LAYOUT_SIZES = [(500, 500), (640, 480), (800, 600), (550, 700), (900, 650)]
+
+
+def run(label, sizes, app, settle=False):
+    timings = []
+    for width, height in sizes:
+        start = time.perf_counter()
+        label.resize(width, height)
+        if settle and label.smooth_timer.isActive():
+            # Run the debounced smooth pass now instead of waiting for it
+            label.smooth_timer.stop()
+            label.updateScaledPixmap()
+        app.processEvents()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark image label rescaling")
+    parser.add_argument("--size", type=int, default=2000, help="Image side in px")
+    parser.add_argument("--steps", type=int, default=60)
+    args = parser.parse_args()
+
+    from PyQt5.QtCore import Qt
+    from PyQt5.QtWidgets import QApplication
+
+    from gui import ImageLabel
+
+    class LegacyImageLabel(ImageLabel):
+        def updateScaledPixmap(self, smooth=True):
+            if self.original_pixmap:
+                self.setPixmap(
+                    self.original_pixmap.scaled(
+                        self.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation
+                    )
+                )
+
+    app = QApplication([])
+    image = make_image(args.size)
+    scenarios = [
+        ("drag", drag_sizes(args.steps), False),
+        ("layout", LAYOUT_SIZES, True),
+        ("repeat", LAYOUT_SIZES, True),
+    ]
+
+    print(f"{'label':<10}{'scenario':<10}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}")
+    for name, label_class in (("legacy", LegacyImageLabel), ("current", ImageLabel)):
+        label = label_class()
+        label.show()
+        label.setImage(image)
+        for scenario, sizes, settle in scenarios:
+            timings = sorted(t * 1000 for t in run(label, sizes, app, settle))
+            print(
+                f"{name:<10}{scenario:<10}"
+                f"{statistics.median(timings):9.2f}"
+                f"{timings[max(0, int(len(timings) * 0.95) - 1)]:9.2f}"
+                f"{timings[-1]:9.2f}"
+            )
+        label.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# Measure GUI startup in fresh interpreters: importing gui, building the
+# window, its first paint, and the API key arriving from the keyring. Runs
+# offscreen with a throwaway settings folder set to the mock provider, so
+# no display, key or network is needed. With --budget-ms, exits 1 when the
+# median time to first paint exceeds it, so CI can catch regressions.
+#
+# Run from the repository root:
+#     python -m benchmarks.bench_startup --runs 5 --budget-ms 800
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PHASES = ["import", "window", "first_paint", "api_key"]
+
+CHILD = """
+import json, time
+start = time.perf_counter()
+marks = {}
+import gui
+marks["import"] = time.perf_counter()
+from PyQt5.QtCore import QEvent, QObject, QTimer
+from PyQt5.QtWidgets import QApplication
+
+app = QApplication([])
+gui.app_settings().setValue("provider/name", "mock")
+
+
+class PaintWatcher(QObject):
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint and "first_paint" not in marks:
+            marks["first_paint"] = time.perf_counter()
+            finish()
+        return False
+
+
+def finish():
+    if "first_paint" in marks and "api_key" in marks:
+        print(json.dumps({name: (t - start) * 1000 for name, t in marks.items()}))
+        app.quit()
+
+
+window = gui.ImageGeneratorApp()
+marks["window"] = time.perf_counter()
+
+
+def on_api_key(api_key):
+    marks["api_key"] = time.perf_counter()
+    finish()
+
+
+window.startup_loader.loaded.connect(on_api_key)
+watcher = PaintWatcher()
+window.installEventFilter(watcher)
+window.show()
+QTimer.singleShot(10000, app.quit)
+app.exec_()
+"""
+
+
+def run_once(root):
+    env = dict(
+        os.environ,
+        QT_QPA_PLATFORM=os.environ.get("QT_QPA_PLATFORM", "offscreen"),
+        XDG_CONFIG_HOME=os.path.join(root, "config"),
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=env,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    for line in reversed(result.stdout.splitlines()):
+        if line.startswith("{"):
+            return json.loads(line)
+    raise RuntimeError(f"no timings from child: {result.stderr.strip()[-500:]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark GUI startup")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--budget-ms", type=float, help="fail if first paint takes longer"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        run_once(root)  # Warm the bytecode and OS file caches
+        runs = [run_once(root) for _ in range(args.runs)]
+    print(f"{'phase':<12}{'median ms':>10}{'max ms':>9}")
+    for phase in PHASES:
+        values = [run[phase] for run in runs if phase in run]
+        if values:
+            print(f"{phase:<12}{statistics.median(values):10.1f}{max(values):9.1f}")
+    first_paint = statistics.median(run["first_paint"] for run in runs)
+    if args.budget_ms and first_paint > args.budget_ms:
+        print(f"first paint {first_paint:.1f} ms is over budget ({args.budget_ms} ms)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
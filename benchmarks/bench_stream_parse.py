@@ -0,0 +1,67 @@
+# Peak Python heap used to turn a b64_json response body into image bytes:
+# the old response.json() + json.dumps + b64decode path versus
+# ImageStreamParser fed in network-sized chunks.
+#
+# Run from the repository root:
+#     python -m benchmarks.bench_stream_parse --sizes-mb 1 4 16
+import argparse
+import base64
+import json
+import os
+import time
+import tracemalloc
+
+from imagegen.client import parse_image_stream
+from imagegen.stream import STREAM_CHUNK_SIZE
+
+
+def legacy_parse(body):
+    response_json = json.loads(body)
+    json.dumps(response_json, indent=2)  # The old debug print
+    return base64.b64decode(response_json["data"][0]["b64_json"])
+
+
+def streaming_parse(body):
+    chunks = (
+        body[i : i + STREAM_CHUNK_SIZE] for i in range(0, len(body), STREAM_CHUNK_SIZE)
+    )
+    images, _, _ = parse_image_stream(chunks)
+    return images[0]
+
+
+def measure(parse, body):
+    tracemalloc.start()
+    start = time.perf_counter()
+    image = parse(body)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return image, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark response parsing")
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=[1, 4, 16])
+    args = parser.parse_args()
+
+    print(
+        f"{'image MB':>9}{'legacy MB':>11}{'stream MB':>11}{'legacy ms':>11}{'stream ms':>11}"
+    )
+    for size_mb in args.sizes_mb:
+        image = os.urandom(int(size_mb * 2**20))
+        body = json.dumps(
+            {"data": [{"b64_json": base64.b64encode(image).decode("ascii")}]}
+        ).encode()
+        results = {}
+        for name, parse in (("legacy", legacy_parse), ("stream", streaming_parse)):
+            decoded, elapsed, peak = measure(parse, body)
+            assert decoded == image
+            results[name] = elapsed * 1000, peak / 2**20
+        print(
+            f"{size_mb:9.1f}{results['legacy'][1]:11.1f}{results['stream'][1]:11.1f}"
+            f"{results['legacy'][0]:11.1f}{results['stream'][0]:11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# Memory and time to expand a prompt template: building the full list of
+# prompts and deduplicating it, as a hand-made matrix would, versus the
+# lazy generator the batch paths consume. Also times drawing a random
+# sample from a template far too large to list.
+#
+# Run from the repository root:
+#     python -m benchmarks.bench_template --options 10 --groups 6
+import argparse
+import time
+import tracemalloc
+
+from imagegen.template import PromptTemplate
+
+
+def measure(function):
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = function()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return count, elapsed, peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark prompt templates")
+    parser.add_argument("--options", type=int, default=10, help="options per group")
+    parser.add_argument("--groups", type=int, default=6)
+    parser.add_argument("--sample", type=int, default=1000)
+    args = parser.parse_args()
+
+    group = "{" + "|".join(f"option {i}" for i in range(args.options)) + "}"
+    template = PromptTemplate("a scene with " + ", ".join([group] * args.groups))
+    print(f"{template.count:,} prompts")
+    print(f"{'mode':<10}{'prompts':>12}{'s':>9}{'peak MB':>10}")
+
+    def eager():
+        return len(list(dict.fromkeys(list(template))))
+
+    def lazy():
+        return sum(1 for _ in template.expand())
+
+    def lazy_no_dedup():
+        return sum(1 for _ in template.expand(dedup=False))
+
+    for name, function in (
+        ("list", eager),
+        ("generator", lazy),
+        ("no dedup", lazy_no_dedup),
+    ):
+        count, elapsed, peak = measure(function)
+        print(f"{name:<10}{count:>12,}{elapsed:>9.2f}{peak:>10.1f}")
+
+    huge = PromptTemplate("a scene with " + ", ".join([group] * 30))
+    count, elapsed, peak = measure(
+        lambda: sum(1 for _ in huge.expand(sample=args.sample, seed=1))
+    )
+    print(
+        f"sample {count:,} of {huge.count:.0e} prompts: "
+        f"{elapsed:.2f} s, peak {peak:.1f} MB"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,12 @@
 import sys
-import requests
 import json
-import base64
 import os
 import random
 import string
-import keyring
+import time
 from pathlib import Path
-from io import BytesIO
 from datetime import datetime
+from collections import deque
 from PyQt5.QtWidgets import (
     QApplication,
     QMainWindow,
@@ -28,16 +26,157 @@ from PyQt5.QtWidgets import (
     QAction,
     QDialog,
     QFormLayout,
+    QListWidget,
+    QListWidgetItem,
+    QSpinBox,
+    QCheckBox,
+    QDoubleSpinBox,
+    QTableWidget,
+    QTableWidgetItem,
+    QHeaderView,
+    QInputDialog,
+    QListView,
+    QAbstractItemView,
 )
-from PyQt5.QtCore import QThread, pyqtSignal, Qt
-from PyQt5.QtGui import QFont, QPixmap, QPalette, QColor
-from PIL import Image
-from openai import OpenAI
-
-
-# Constants for keyring service and username
-KEYRING_SERVICE = "ai_image_generator"
-KEYRING_USERNAME = "api_key"
+from PyQt5.QtCore import (
+    QAbstractListModel,
+    QEvent,
+    QModelIndex,
+    QObject,
+    QRunnable,
+    QSettings,
+    QSize,
+    QThread,
+    QThreadPool,
+    QTimer,
+    pyqtSignal,
+    Qt,
+)
+from PyQt5.QtGui import QFont, QIcon, QImage, QPixmap, QPalette, QColor
+from imagegen.batch import FINISHED, BatchQueue, RUNNING, build_matrix, parse_seeds
+from imagegen.cache import DEFAULT_MAX_BYTES, get_cache
+from imagegen.client import (
+    CACHED_RESPONSE_TEXT,
+    DEFAULT_NUM_INFERENCE_STEPS,
+    PREVIEW_STEPS,
+    generate_images,
+    generate_seed_sweep,
+    preview_size,
+)
+from imagegen.credentials import KEYRING_SERVICE, get_api_key, set_api_key
+from imagegen.decode import decode_all, decode_pixels
+from imagegen.enhance import enhance_lazily, enhance_prompt_stream, get_memo
+from imagegen.export import (
+    DEFAULT_QUALITY,
+    FORMATS,
+    available_formats,
+    export_many,
+    format_for_path,
+    save_image,
+    with_extension,
+)
+from imagegen.history import FAILED as HISTORY_FAILED, THUMBNAIL_SIZE, get_history
+from imagegen.manifest import JOURNAL_NAME, CheckpointJournal, run_manifest
+from imagegen.postprocess import UPSCALE_FACTORS, PostProcess
+from imagegen.providers import (
+    DEFAULT_PROVIDER,
+    PROVIDERS,
+    configure_provider,
+    get_provider,
+)
+from imagegen.retry import DEFAULT_MAX_ATTEMPTS, configure_retry_policy
+from imagegen.session import CancelToken, Cancelled
+from imagegen.template import PromptTemplate, TemplateError, is_template
+from imagegen.timing import get_estimator
+from imagegen.trace import Trace, get_trace_log, tracing
+from imagegen.warmup import prewarm
+
+
+# Predefined image sizes shown in the size picker
+SIZE_PRESETS = {
+    "Square (512x512)": (512, 512),
+    "Square (1024x1024)": (1024, 1024),
+    "Square (2000x2000)": (2000, 2000),
+    "Portrait 3:4 (768x1024)": (768, 1024),
+    "Portrait 9:16 (576x1024)": (576, 1024),
+    "Landscape 4:3 (1024x768)": (1024, 768),
+    "Landscape 16:9 (1024x576)": (1024, 576),
+    "Landscape 16:9 (1280x720)": (1280, 720),
+    "Landscape 16:9 (1920x1080)": (1920, 1080),
+}
+
+DEFAULT_CACHE_MB = DEFAULT_MAX_BYTES // 2**20
+PROGRESS_INTERVAL_MS = 200
+RESULT_THUMBNAIL_SIZE = 96  # Longest side of an image in the results grid
+MAX_IMAGES_PER_REQUEST = 4
+MAX_SWEEP_SEEDS = 8
+SPECULATE_AFTER_MS = 1200  # Pause in typing before a background enhancement
+SPECULATE_MIN_WORDS = 3  # Shorter prompts are likely still being typed
+
+
+def format_progress(elapsed, estimate):
+    # "12s / ~30s" while a request runs
+    return f"{elapsed:.0f}s / ~{estimate:.0f}s"
+
+
+def app_settings():
+    # Non-secret preferences; the API key stays in the keyring
+    return QSettings(KEYRING_SERVICE, "AI Image Generator")
+
+
+def apply_storage_settings():
+    settings = app_settings()
+    cache = get_cache()
+    cache.enabled = settings.value("cache/enabled", True, type=bool)
+    cache.set_max_bytes(
+        settings.value("cache/size_mb", DEFAULT_CACHE_MB, type=int) * 2**20
+    )
+    get_history().enabled = settings.value("history/enabled", True, type=bool)
+
+
+def apply_network_settings():
+    settings = app_settings()
+    configure_retry_policy(
+        max_attempts=settings.value(
+            "network/max_attempts", DEFAULT_MAX_ATTEMPTS, type=int
+        ),
+        hedge_after=settings.value("network/hedge_after", 0.0, type=float),
+    )
+
+
+def apply_provider_settings():
+    settings = app_settings()
+    name = settings.value("provider/name", DEFAULT_PROVIDER)
+    if name not in PROVIDERS:
+        name = DEFAULT_PROVIDER
+    # Empty fields fall back to the provider's defaults
+    configure_provider(
+        name,
+        settings.value("provider/base_url", ""),
+        settings.value("provider/image_model", ""),
+        settings.value("provider/enhance_model", ""),
+    )
+
+
+def export_options():
+    # Keyword arguments for imagegen.export from the Saving settings
+    settings = app_settings()
+    png_compression = settings.value("export/png_compression", -1, type=int)
+    return {
+        "quality": settings.value("export/quality", DEFAULT_QUALITY, type=int),
+        "png_compression": None if png_compression < 0 else png_compression,
+    }
+
+
+def export_file_filters():
+    # "PNG files (*.png)" style filters for the formats Pillow can write,
+    # and a lookup from filter back to format name
+    filters = {}
+    for name in available_formats():
+        label, extensions = FORMATS[name][:2]
+        patterns = " ".join(f"*{extension}" for extension in extensions)
+        filters[f"{label} files ({patterns})"] = name
+    return filters
 
 
 class AboutDialog(QDialog):
@@ -134,33 +273,58 @@ class AboutDialog(QDialog):
 
 
 class SettingsDialog(QDialog):
-    def __init__(self, parent=None):
+    def __init__(self, api_key=None, parent=None):
         super().__init__(parent)
+        self.api_key = api_key
         self.setWindowTitle("Settings")
-        self.setFixedSize(400, 300)
         self.setWindowFlags(self.windowFlags() & ~Qt.WindowContextHelpButtonHint)
+        self.init_ui()
+        self.resize(self.minimumSizeHint().width(), 640)
 
         # Center the dialog on the parent window
         if parent:
             parent_geometry = parent.geometry()
-            x = parent_geometry.x() + (parent_geometry.width() - 400) // 2
-            y = parent_geometry.y() + (parent_geometry.height() - 300) // 2
+            x = parent_geometry.x() + (parent_geometry.width() - self.width()) // 2
+            y = parent_geometry.y() + max(
+                0, (parent_geometry.height() - self.height()) // 2
+            )
             self.move(x, y)
 
-        self.init_ui()
-
     def init_ui(self):
+        # The settings scroll when the screen is too short for all of them;
+        # the buttons below stay in view
         layout = QVBoxLayout()
+        settings_widget = QWidget()
+        settings_layout = QVBoxLayout(settings_widget)
+        scroll_area = QScrollArea()
+        scroll_area.setWidgetResizable(True)
+        scroll_area.setFrameShape(QScrollArea.NoFrame)
+        scroll_area.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        scroll_area.setWidget(settings_widget)
+        layout.addWidget(scroll_area)
 
         # Title
         title_label = QLabel("🔑 API Key Configuration")
         title_label.setFont(QFont("Arial", 14, QFont.Bold))
         title_label.setAlignment(Qt.AlignCenter)
-        layout.addWidget(title_label)
+        settings_layout.addWidget(title_label)
 
         # Form layout for settings
         form_layout = QFormLayout()
 
+        # Provider, with optional overrides of its endpoint and models
+        self.provider_input = QComboBox()
+        for provider in PROVIDERS.values():
+            self.provider_input.addItem(provider.label, provider.name)
+        self.provider_input.currentIndexChanged.connect(self.on_provider_changed)
+        form_layout.addRow("Provider:", self.provider_input)
+        self.base_url_input = QLineEdit()
+        form_layout.addRow("Endpoint:", self.base_url_input)
+        self.image_model_input = QLineEdit()
+        form_layout.addRow("Image model:", self.image_model_input)
+        self.enhance_model_input = QLineEdit()
+        form_layout.addRow("Prompt model:", self.enhance_model_input)
+
         # API Key field
         self.api_key_input = QLineEdit()
         self.api_key_input.setPlaceholderText("Enter your Nebius AI API key")
@@ -168,7 +332,7 @@ class SettingsDialog(QDialog):
         form_layout.addRow("API Key:", self.api_key_input)
 
         # Add form layout to main layout
-        layout.addLayout(form_layout)
+        settings_layout.addLayout(form_layout)
         help_label = QLabel(
             "• Get your API key from Nebius AI Studio\n"
             "• Your key is securely stored in macOS Keychain\n"
@@ -178,7 +342,101 @@ class SettingsDialog(QDialog):
         help_label.setStyleSheet(
             "color: #666666; background-color: #f8f9fa; padding: 10px; border-radius: 5px;"
         )
-        layout.addWidget(help_label)
+        settings_layout.addWidget(help_label)
+
+        # Prompt enhancement
+        enhance_form = QFormLayout()
+        self.variants_input = QSpinBox()
+        self.variants_input.setRange(1, 5)
+        self.variants_input.setToolTip(
+            "Clicking Enhance again on the same prompt cycles through this many "
+            "remembered variants"
+        )
+        enhance_form.addRow("Enhanced variants per prompt:", self.variants_input)
+        self.speculative_input = QCheckBox("Enhance in the background while typing")
+        self.speculative_input.setToolTip(
+            "Enhances the prompt whenever you pause typing, so Enhance is "
+            "usually instant (uses API credits for prompts you never enhance)"
+        )
+        enhance_form.addRow(self.speculative_input)
+        self.history_enabled_input = QCheckBox("Keep every generated image in History")
+        enhance_form.addRow(self.history_enabled_input)
+        settings_layout.addLayout(enhance_form)
+
+        # Result cache
+        cache_title = QLabel("🗄 Result Cache")
+        cache_title.setFont(QFont("Arial", 12, QFont.Bold))
+        settings_layout.addWidget(cache_title)
+
+        cache_form = QFormLayout()
+        self.cache_enabled_input = QCheckBox("Reuse images for repeated requests")
+        cache_form.addRow(self.cache_enabled_input)
+        self.cache_size_input = QSpinBox()
+        self.cache_size_input.setRange(16, 1024 * 1024)
+        self.cache_size_input.setSuffix(" MB")
+        cache_form.addRow("Size limit:", self.cache_size_input)
+        settings_layout.addLayout(cache_form)
+
+        cache_stats_layout = QHBoxLayout()
+        self.cache_stats_label = QLabel()
+        self.cache_stats_label.setFont(QFont("Arial", 10))
+        self.cache_stats_label.setStyleSheet("color: #666666;")
+        self.cache_stats_label.setWordWrap(True)  # Counts grow; the dialog does not
+        cache_stats_layout.addWidget(self.cache_stats_label)
+        clear_cache_button = QPushButton("Clear Cache")
+        clear_cache_button.setToolTip("Also forgets remembered prompt enhancements")
+        clear_cache_button.clicked.connect(self.clear_cache)
+        cache_stats_layout.addWidget(clear_cache_button)
+        settings_layout.addLayout(cache_stats_layout)
+
+        # Network
+        network_title = QLabel("🌐 Network")
+        network_title.setFont(QFont("Arial", 12, QFont.Bold))
+        settings_layout.addWidget(network_title)
+
+        network_form = QFormLayout()
+        self.max_attempts_input = QSpinBox()
+        self.max_attempts_input.setRange(1, 10)
+        self.max_attempts_input.setToolTip(
+            "Timeouts and 5xx errors are retried with exponential backoff"
+        )
+        network_form.addRow("Attempts per request:", self.max_attempts_input)
+        self.hedge_after_input = QDoubleSpinBox()
+        self.hedge_after_input.setRange(0, 600)
+        self.hedge_after_input.setDecimals(1)
+        self.hedge_after_input.setSuffix(" s")
+        self.hedge_after_input.setSpecialValueText("Off")
+        self.hedge_after_input.setToolTip(
+            "Send a duplicate request when the first has not answered after "
+            "this long and keep whichever finishes first (may double the cost)"
+        )
+        network_form.addRow("Hedge slow requests after:", self.hedge_after_input)
+        self.preconnect_input = QCheckBox("Connect to the API ahead of requests")
+        self.preconnect_input.setToolTip(
+            "Opens connections at startup and when you start typing a prompt, "
+            "so the first request skips connection setup"
+        )
+        network_form.addRow(self.preconnect_input)
+        settings_layout.addLayout(network_form)
+
+        # Saving and exporting
+        export_title = QLabel("💾 Saving")
+        export_title.setFont(QFont("Arial", 12, QFont.Bold))
+        settings_layout.addWidget(export_title)
+
+        export_form = QFormLayout()
+        self.export_quality_input = QSpinBox()
+        self.export_quality_input.setRange(1, 100)
+        self.export_quality_input.setToolTip("Used for JPEG, WebP and AVIF")
+        export_form.addRow("Lossy quality:", self.export_quality_input)
+        self.png_compression_input = QSpinBox()
+        self.png_compression_input.setRange(-1, 9)
+        self.png_compression_input.setSpecialValueText("Keep original")
+        self.png_compression_input.setToolTip(
+            "Higher levels make smaller PNGs but take longer to save"
+        )
+        export_form.addRow("PNG compression:", self.png_compression_input)
+        settings_layout.addLayout(export_form)
 
         # Buttons
         button_layout = QHBoxLayout()
@@ -229,173 +487,1354 @@ class SettingsDialog(QDialog):
 
         layout.addLayout(button_layout)
         self.setLayout(layout)
+        # Wide enough that only vertical scrolling is ever needed
+        scroll_area.setMinimumWidth(
+            settings_widget.minimumSizeHint().width()
+            + scroll_area.verticalScrollBar().sizeHint().width()
+        )
 
         # Load current settings
         self.load_settings()
 
     def load_settings(self):
-        # Retrieve API key from keyring
-        api_key = keyring.get_password(KEYRING_SERVICE, KEYRING_USERNAME)
-        if api_key:
-            self.api_key_input.setText(api_key)
+        # The main window has already read the key from the keyring
+        if self.api_key:
+            self.api_key_input.setText(self.api_key)
+
+        settings = app_settings()
+        index = self.provider_input.findData(
+            settings.value("provider/name", DEFAULT_PROVIDER)
+        )
+        self.provider_input.setCurrentIndex(max(0, index))
+        self.on_provider_changed()
+        self.base_url_input.setText(settings.value("provider/base_url", ""))
+        self.image_model_input.setText(settings.value("provider/image_model", ""))
+        self.enhance_model_input.setText(settings.value("provider/enhance_model", ""))
+        self.cache_enabled_input.setChecked(
+            settings.value("cache/enabled", True, type=bool)
+        )
+        self.cache_size_input.setValue(
+            settings.value("cache/size_mb", DEFAULT_CACHE_MB, type=int)
+        )
+        self.variants_input.setValue(settings.value("enhance/variants", 1, type=int))
+        self.speculative_input.setChecked(
+            settings.value("enhance/speculative", False, type=bool)
+        )
+        self.history_enabled_input.setChecked(
+            settings.value("history/enabled", True, type=bool)
+        )
+        self.max_attempts_input.setValue(
+            settings.value("network/max_attempts", DEFAULT_MAX_ATTEMPTS, type=int)
+        )
+        self.hedge_after_input.setValue(
+            settings.value("network/hedge_after", 0.0, type=float)
+        )
+        self.preconnect_input.setChecked(
+            settings.value("network/preconnect", True, type=bool)
+        )
+        self.export_quality_input.setValue(
+            settings.value("export/quality", DEFAULT_QUALITY, type=int)
+        )
+        self.png_compression_input.setValue(
+            settings.value("export/png_compression", -1, type=int)
+        )
+        self.update_cache_stats()
+
+    def on_provider_changed(self):
+        # Blank fields use the provider's defaults, shown as placeholders
+        provider = PROVIDERS[self.provider_input.currentData()]
+        self.base_url_input.setPlaceholderText(provider.base_url)
+        self.image_model_input.setPlaceholderText(provider.image_model)
+        self.enhance_model_input.setPlaceholderText(provider.enhance_model)
+
+    def update_cache_stats(self):
+        cache = get_cache()
+        self.cache_stats_label.setText(
+            f"{len(cache)} images, {cache.total_bytes / 2**20:.1f} MB · "
+            f"{cache.stats['hits']} hits, {cache.stats['misses']} misses, "
+            f"{cache.stats['evictions']} evictions"
+        )
+
+    def clear_cache(self):
+        get_cache().clear()
+        get_memo().clear()
+        self.update_cache_stats()
 
     def save_settings(self):
         api_key = self.api_key_input.text().strip()
+        provider_name = self.provider_input.currentData()
 
-        if not api_key:
+        if not api_key and PROVIDERS[provider_name].requires_key:
             QMessageBox.warning(self, "Warning", "Please enter an API key")
             return
 
         # Save API key to keyring
-        keyring.set_password(KEYRING_SERVICE, KEYRING_USERNAME, api_key)
+        if api_key:
+            set_api_key(api_key)
+            self.api_key = api_key
+
+        settings = app_settings()
+        settings.setValue("provider/name", provider_name)
+        settings.setValue("provider/base_url", self.base_url_input.text().strip())
+        settings.setValue("provider/image_model", self.image_model_input.text().strip())
+        settings.setValue(
+            "provider/enhance_model", self.enhance_model_input.text().strip()
+        )
+        settings.setValue("cache/enabled", self.cache_enabled_input.isChecked())
+        settings.setValue("cache/size_mb", self.cache_size_input.value())
+        settings.setValue("enhance/variants", self.variants_input.value())
+        settings.setValue("enhance/speculative", self.speculative_input.isChecked())
+        settings.setValue("history/enabled", self.history_enabled_input.isChecked())
+        settings.setValue("network/max_attempts", self.max_attempts_input.value())
+        settings.setValue("network/hedge_after", self.hedge_after_input.value())
+        settings.setValue("network/preconnect", self.preconnect_input.isChecked())
+        settings.setValue("export/quality", self.export_quality_input.value())
+        settings.setValue("export/png_compression", self.png_compression_input.value())
+        apply_storage_settings()
+        apply_network_settings()
+        apply_provider_settings()
 
         QMessageBox.information(self, "Success", "Settings saved successfully")
         self.accept()
 
 
+class StartupLoader(QThread):
+    # Startup work that can be slow, done while the window paints: reading
+    # the API key (keyring may wait on a locked desktop keyring) and
+    # indexing the result cache folder. Emits the key, or None.
+    loaded = pyqtSignal(object)
+
+    def run(self):
+        # The window waits for `loaded` to enable itself, so it is emitted
+        # whatever goes wrong here
+        api_key = None
+        try:
+            try:
+                apply_storage_settings()
+            except Exception as e:
+                print(f"Could not apply storage settings: {e}")
+            api_key = get_api_key(environment=False)
+        except Exception as e:
+            print(f"Could not read API key: {e}")
+        finally:
+            self.loaded.emit(api_key)
+
+
 class PromptEnhancerWorker(QThread):
+    # Streams the enhanced prompt: `token` fires with (index, piece) for
+    # every piece as the model writes it, then `finished` with the whole
+    # prompt. `pieces` holds those written so far, so a window that starts
+    # listening late can catch up.
     finished = pyqtSignal(str)
+    token = pyqtSignal(int, str)
     error = pyqtSignal(str)
+    cancelled = pyqtSignal()
 
-    def __init__(self, api_key, original_prompt):
+    def __init__(self, api_key, original_prompt, variant=0, speculative=False):
         super().__init__()
         self.api_key = api_key
         self.original_prompt = original_prompt
+        self.variant = variant
+        self.pieces = []
+        self.cancel_token = CancelToken()
+        if speculative:
+            self.trace = Trace("enhance", variant=variant, speculative=True)
+        else:
+            self.trace = Trace("enhance", variant=variant)
+
+    def cancel(self):
+        # Takes effect at the next piece; the caller need not wait for it
+        self.cancel_token.cancel()
 
     def run(self):
         try:
-            client = OpenAI(
-                base_url="https://api.studio.nebius.com/v1", api_key=self.api_key
-            )
-            response = client.chat.completions.create(
-                model="microsoft/phi-4",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": f"Rewrite the following image generation prompt to be more detailed, vivid, and creative, while keeping its core idea. Respond only with the enhanced prompt—no explanations, no headers, just the prompt. Limit the enhanced prompt to 100 words:\n{self.original_prompt}",
-                            }
-                        ],
-                    }
-                ],
-            )
-            enhanced_prompt = response.choices[0].message.content.strip()
-            self.finished.emit(enhanced_prompt)
+            with tracing(self.trace):
+                for piece in enhance_prompt_stream(
+                    self.api_key,
+                    self.original_prompt,
+                    self.variant,
+                    cancel_token=self.cancel_token,
+                ):
+                    self.pieces.append(piece)
+                    self.token.emit(len(self.pieces) - 1, piece)
+            self.trace.finish(status="ok")
+            self.finished.emit("".join(self.pieces).strip())
+        except Cancelled:
+            self.trace.finish(status="cancelled")
+            self.cancelled.emit()
         except Exception as e:
+            if self.cancel_token.cancelled:
+                self.trace.finish(status="cancelled")
+                self.cancelled.emit()
+                return
             print(f"PromptEnhancerWorker error: {e}")
+            self.trace.finish(status="failed")
             self.error.emit(str(e))
 
 
 class APIWorker(QThread):
+    # Emits (status_code, response_text, results) where results is a list of
+    # (seed, image_data, image, thumbnail), one per image that decoded
     finished = pyqtSignal(int, str, object)
     error = pyqtSignal(str)
-
-    def __init__(self, api_key, prompt, width=1024, height=1024):
+    cancelled = pyqtSignal()
+
+    def __init__(
+        self,
+        api_key,
+        prompt,
+        width=1024,
+        height=1024,
+        seed=None,
+        steps=DEFAULT_NUM_INFERENCE_STEPS,
+        count=1,
+        sweep=1,
+        original_prompt=None,
+        postprocess=None,
+    ):
         super().__init__()
         self.api_key = api_key
         self.prompt = prompt
+        self.original_prompt = original_prompt  # What was typed, if enhanced
+        self.postprocess = postprocess  # imagegen.postprocess.PostProcess
         self.width = width
         self.height = height
+        self.seed = seed
+        self.steps = steps
+        self.count = count  # Images per request
+        self.sweep = sweep  # Requests, with consecutive seeds from `seed`
+        self.cancel_token = CancelToken()
+        self.history_entries = []
+        # Finished by the GUI thread once the image is on screen
+        self.trace = Trace(
+            "generate", width=width, height=height, steps=steps, images=count * sweep
+        )
+
+    def cancel(self):
+        # Safe to call from the GUI thread; aborts the request's connection
+        self.cancel_token.cancel()
 
     def run(self):
         try:
-            url = "https://api.studio.nebius.com/v1/images/generations"
-            headers = {
-                "Content-Type": "application/json",
-                "Accept": "*/*",
-                "Authorization": f"Bearer {self.api_key}",
-            }
-            data = {
-                "model": "black-forest-labs/flux-dev",
-                "prompt": self.prompt,
-                "width": self.width,
-                "height": self.height,
-                "response_extension": "png",
-                "num_inference_steps": 64,
-                "negative_prompt": "blurry, distorted",
-            }
+            with tracing(self.trace):
+                if self.sweep > 1:
+                    seeds = [self.seed + offset for offset in range(self.sweep)]
+                    responses = generate_seed_sweep(
+                        self.api_key,
+                        self.prompt,
+                        self.width,
+                        self.height,
+                        seeds,
+                        self.count,
+                        steps=self.steps,
+                        cancel_token=self.cancel_token,
+                    )
+                else:
+                    responses = [
+                        (
+                            self.seed,
+                            *generate_images(
+                                self.api_key,
+                                self.prompt,
+                                self.width,
+                                self.height,
+                                self.seed,
+                                self.count,
+                                steps=self.steps,
+                                cancel_token=self.cancel_token,
+                            ),
+                        )
+                    ]
+            items = [
+                (seed, image_data)
+                for seed, _, _, images in responses
+                for image_data in images
+            ]
+            processed = [image_data for _, image_data in items]
+            if self.postprocess is not None and not self.postprocess.is_noop:
+                with self.trace.span("postprocess"):
+                    processed = [
+                        self.postprocess.apply(image_data) for image_data in processed
+                    ]
+                self.cancel_token.raise_if_cancelled()
+            # Decode every image at once, here rather than on the GUI thread
+            with self.trace.span("image_decode"):
+                decoded = decode_all(processed, decode_with_thumbnail)
+            self.cancel_token.raise_if_cancelled()
+            results = [
+                (seed, image_data, image, thumbnail)
+                for (seed, _), image_data, (image, thumbnail) in zip(
+                    items, processed, decoded
+                )
+                if image is not None
+            ]
+            # Report the first request that produced images, or the first one
+            seed, status_code, response_text, _ = next(
+                (response for response in responses if response[3]), responses[0]
+            )
+            if status_code is None:
+                raise RuntimeError(response_text)
+            if not results:
+                self.record_failure(f"HTTP {status_code}: {response_text[:200]}")
+            # Cached only if images came back and all of them from the cache;
+            # a failed request keeps the API's error text
+            with_images = [response for response in responses if response[3]]
+            cached = bool(with_images) and all(
+                response[2] == CACHED_RESPONSE_TEXT for response in with_images
+            )
+            if not cached:
+                # History keeps what the API returned, before post-processing
+                for (seed, image_data), (image, _) in zip(items, decoded):
+                    if image is None:
+                        continue
+                    entry = get_history().add(
+                        image_data,
+                        self.prompt,
+                        self.width,
+                        self.height,
+                        seed,
+                        self.steps,
+                        get_provider().image_model,
+                        self.original_prompt,
+                        self.trace.elapsed(),
+                        self.trace.spans,
+                    )
+                    if entry is not None:
+                        self.history_entries.append(entry)
+            self.finished.emit(
+                status_code, CACHED_RESPONSE_TEXT if cached else response_text, results
+            )
+        except Cancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            print(f"APIWorker error: {e}")
+            self.record_failure(str(e))
+            self.error.emit(str(e))
 
-            response = requests.post(url, headers=headers, json=data)
-            image_data = None
+    def record_failure(self, error):
+        # Failed generations are kept too, without an image, so they can be
+        # searched and retried from the history
+        try:
+            get_history().add(
+                None,
+                self.prompt,
+                self.width,
+                self.height,
+                self.seed,
+                self.steps,
+                get_provider().image_model,
+                self.original_prompt,
+                self.trace.elapsed(),
+                self.trace.spans,
+                status=HISTORY_FAILED,
+                error=error,
+            )
+        except Exception as e:
+            print(f"Failed to record failure in history: {e}")
+
+
+class BatchSignals(QObject):
+    # Bridges BatchQueue callbacks from pool threads onto the GUI thread
+    job_updated = pyqtSignal(object)
+
+
+class ManifestFeeder(QThread):
+    # Streams a manifest file's jobs into a batch queue, a few at a time,
+    # until the manifest ends or the queue is shut down
+    finished_feeding = pyqtSignal(int, int, int)  # Submitted, skipped, bad rows
+    bad_row = pyqtSignal(str)
+
+    def __init__(self, queue, path):
+        super().__init__()
+        self.queue = queue
+        self.path = path
+        self.bad_rows = 0
+
+    def on_error(self, error):
+        self.bad_rows += 1
+        self.bad_row.emit(str(error))
+
+    def run(self):
+        try:
+            submitted, skipped = run_manifest(
+                self.queue, self.path, on_error=self.on_error
+            )
+        except (OSError, UnicodeDecodeError) as e:
+            self.bad_row.emit(f"Cannot read manifest: {e}")
+            submitted, skipped = 0, 0
+        self.finished_feeding.emit(submitted, skipped, self.bad_rows)
+
+
+class JobFeeder(QThread):
+    # Submits jobs from a generator, such as an expanded prompt template, to
+    # a batch queue as it drains, until they run out or the queue is shut
+    # down
+    finished_feeding = pyqtSignal(int)  # Jobs submitted
+
+    def __init__(self, queue, jobs):
+        super().__init__()
+        self.queue = queue
+        self.jobs = jobs
+
+    def run(self):
+        self.finished_feeding.emit(self.queue.submit_all(self.jobs))
+
+
+class BatchDialog(QDialog):
+    LARGE_BATCH = 10000  # Jobs; asks before starting a batch this big
+    COLUMNS = ["#", "Prompt", "Size", "Seed", "Status", "Time"]
+    history_entry_added = pyqtSignal(object)
 
-            if response.status_code == 200:
-                try:
-                    response_json = response.json()
-                    print(
-                        f"API Response: {json.dumps(response_json, indent=2)}"
-                    )  # Log response for debugging
-
-                    if "data" in response_json and response_json["data"]:
-                        first_item = response_json["data"][0]
-                        if "b64_json" in first_item and first_item["b64_json"]:
-                            try:
-                                image_data = base64.b64decode(first_item["b64_json"])
-                            except Exception as e:
-                                print(f"Failed to decode b64_json: {e}")
-                        elif "url" in first_item and first_item["url"]:
-                            try:
-                                img_response = requests.get(first_item["url"])
-                                if img_response.status_code == 200:
-                                    image_data = img_response.content
-                                else:
-                                    print(
-                                        f"Failed to download image from URL: {img_response.status_code}"
-                                    )
-                            except Exception as e:
-                                print(f"Failed to fetch URL: {e}")
-                    elif "image" in response_json and response_json["image"]:
-                        image_str = response_json["image"]
-                        if image_str and isinstance(image_str, str):
-                            if image_str.startswith("data:image"):
-                                image_str = image_str.split(",", 1)[1]
-                            try:
-                                image_data = base64.b64decode(image_str)
-                            except Exception as e:
-                                print(f"Failed to decode image field: {e}")
-                        else:
-                            print("Image field is not a valid string")
-                    elif "images" in response_json and response_json["images"]:
-                        first_image = response_json["images"][0]
-                        if isinstance(first_image, str):
-                            if first_image.startswith("data:image"):
-                                first_image = first_image.split(",", 1)[1]
-                            try:
-                                image_data = base64.b64decode(first_image)
-                            except Exception as e:
-                                print(f"Failed to decode images field: {e}")
-                        elif isinstance(first_image, dict) and "url" in first_image:
-                            try:
-                                img_response = requests.get(first_image["url"])
-                                if img_response.status_code == 200:
-                                    image_data = img_response.content
-                                else:
-                                    print(
-                                        f"Failed to download image from URL: {img_response.status_code}"
-                                    )
-                            except Exception as e:
-                                print(f"Failed to fetch URL: {e}")
-                    elif response.headers.get("content-type", "").startswith("image/"):
-                        image_data = response.content
-                    else:
-                        print("No valid image data found in response")
-                except json.JSONDecodeError:
-                    print("Failed to parse JSON response")
-                    if response.headers.get("content-type", "").startswith("image/"):
-                        image_data = response.content
+    def __init__(self, api_key, parent=None):
+        super().__init__(parent)
+        self.api_key = api_key
+        self.queue = None
+        self.journal = None
+        self.feeder = None
+        self.feed_summary = ""
+        # Job id -> the "#" item of its table row. Only the last
+        # queue.keep_finished finished jobs keep a row, so a template with
+        # millions of combinations does not fill the table.
+        self.job_rows = {}
+        self.finished_rows = deque()
+        self.removed_rows = 0
+        self.signals = BatchSignals()
+        self.signals.job_updated.connect(self.on_job_updated)
+        # Keeps the elapsed / ETA column of running jobs ticking
+        self.elapsed_timer = QTimer(self)
+        self.elapsed_timer.setInterval(1000)
+        self.elapsed_timer.timeout.connect(self.refresh_running_jobs)
+        # Recounts the jobs once typing pauses; wildcards read files
+        self.count_timer = QTimer(self)
+        self.count_timer.setSingleShot(True)
+        self.count_timer.setInterval(300)
+        self.count_timer.timeout.connect(self.update_job_count)
+        self.setWindowTitle("Batch Generate")
+        self.resize(800, 600)
+        self.setWindowFlags(self.windowFlags() & ~Qt.WindowContextHelpButtonHint)
+        self.init_ui()
+
+    def init_ui(self):
+        layout = QVBoxLayout()
+        form_layout = QFormLayout()
+
+        self.prompts_input = QTextEdit()
+        self.prompts_input.setFixedHeight(100)
+        self.prompts_input.setPlaceholderText(
+            "One prompt per line... {a|b} tries both, __name__ each line of "
+            "~/.ai_image_generator/wildcards/name.txt"
+        )
+        self.prompts_input.textChanged.connect(self.count_timer.start)
+        form_layout.addRow("Prompts:", self.prompts_input)
+
+        limit_layout = QHBoxLayout()
+        self.limit_input = QSpinBox()
+        self.limit_input.setRange(0, 1000000)
+        self.limit_input.setSpecialValueText("All")
+        self.limit_input.valueChanged.connect(self.on_limit_changed)
+        limit_layout.addWidget(self.limit_input)
+        self.sample_checkbox = QCheckBox("Random sample")
+        self.sample_checkbox.setToolTip(
+            "Pick the prompts at random from all combinations instead of "
+            "taking the first ones"
+        )
+        self.sample_checkbox.setEnabled(False)
+        limit_layout.addWidget(self.sample_checkbox)
+        self.enhance_checkbox = QCheckBox("Enhance first")
+        self.enhance_checkbox.setToolTip(
+            "Enhance every prompt before generating; many prompts go in each "
+            "request to the language model"
+        )
+        limit_layout.addWidget(self.enhance_checkbox)
+        limit_layout.addStretch()
+        form_layout.addRow("Prompts to use:", limit_layout)
+
+        self.sizes_list = QListWidget()
+        self.sizes_list.setFixedHeight(100)
+        for name in SIZE_PRESETS:
+            item = QListWidgetItem(name)
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(
+                Qt.Checked if name == "Square (1024x1024)" else Qt.Unchecked
+            )
+            self.sizes_list.addItem(item)
+        self.sizes_list.itemChanged.connect(self.count_timer.start)
+        form_layout.addRow("Sizes:", self.sizes_list)
+
+        self.seeds_input = QLineEdit()
+        self.seeds_input.setPlaceholderText("e.g., 1, 2, 10-20 (blank for random)")
+        self.seeds_input.textChanged.connect(self.count_timer.start)
+        form_layout.addRow("Seeds:", self.seeds_input)
+
+        self.job_count_label = QLabel("0 jobs")
+        form_layout.addRow("Jobs:", self.job_count_label)
+
+        self.engine_combo = QComboBox()
+        self.engine_combo.addItems(["Threads", "asyncio"])
+        self.engine_combo.currentTextChanged.connect(self.on_engine_changed)
+        form_layout.addRow("Engine:", self.engine_combo)
+
+        self.concurrency_input = QSpinBox()
+        self.concurrency_input.setRange(1, 32)
+        self.concurrency_input.setValue(4)
+        form_layout.addRow("Concurrent requests:", self.concurrency_input)
+
+        self.rate_input = QDoubleSpinBox()
+        self.rate_input.setRange(0, 100)
+        self.rate_input.setDecimals(1)
+        self.rate_input.setSpecialValueText("Unlimited")
+        self.rate_input.setSuffix(" req/s")
+        self.rate_input.setEnabled(False)
+        form_layout.addRow("Rate limit:", self.rate_input)
+
+        output_layout = QHBoxLayout()
+        self.output_input = QLineEdit(
+            str(Path.home() / "Downloads" / "ai_image_batches")
+        )
+        browse_button = QPushButton("Browse...")
+        browse_button.clicked.connect(self.choose_output_dir)
+        output_layout.addWidget(self.output_input)
+        output_layout.addWidget(browse_button)
+        form_layout.addRow("Output folder:", output_layout)
+
+        layout.addLayout(form_layout)
+
+        self.jobs_table = QTableWidget(0, len(self.COLUMNS))
+        self.jobs_table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.jobs_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.jobs_table.verticalHeader().setVisible(False)
+        self.jobs_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.jobs_table.setSelectionBehavior(QTableWidget.SelectRows)
+        layout.addWidget(self.jobs_table)
+
+        self.summary_label = QLabel("No jobs submitted")
+        layout.addWidget(self.summary_label)
+
+        button_layout = QHBoxLayout()
+        self.start_button = QPushButton("🚀 Start Batch")
+        self.start_button.clicked.connect(self.start_batch)
+        button_layout.addWidget(self.start_button)
+
+        self.manifest_button = QPushButton("Load Manifest...")
+        self.manifest_button.setToolTip(
+            "Run a JSONL or CSV file of jobs; loading it again into the same "
+            "output folder resumes where it stopped"
+        )
+        self.manifest_button.clicked.connect(self.load_manifest)
+        button_layout.addWidget(self.manifest_button)
+
+        self.cancel_selected_button = QPushButton("Cancel Selected")
+        self.cancel_selected_button.clicked.connect(self.cancel_selected)
+        button_layout.addWidget(self.cancel_selected_button)
+
+        self.cancel_all_button = QPushButton("Cancel All")
+        self.cancel_all_button.clicked.connect(self.cancel_all)
+        button_layout.addWidget(self.cancel_all_button)
+
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.close)
+        button_layout.addWidget(close_button)
+
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+    def on_engine_changed(self, text):
+        # One event loop can keep far more requests in flight than threads
+        use_asyncio = text == "asyncio"
+        self.concurrency_input.setMaximum(256 if use_asyncio else 32)
+        self.rate_input.setEnabled(use_asyncio)
+
+    def choose_output_dir(self):
+        directory = QFileDialog.getExistingDirectory(
+            self, "Output Folder", self.output_input.text()
+        )
+        if directory:
+            self.output_input.setText(directory)
+
+    def on_limit_changed(self, value):
+        # Sampling everything would only shuffle it
+        self.sample_checkbox.setEnabled(value > 0)
+        self.count_timer.start()
+
+    def prompt_lines(self):
+        return [
+            line.strip()
+            for line in self.prompts_input.toPlainText().splitlines()
+            if line.strip()
+        ]
+
+    def count_jobs(self, template, sizes, seeds):
+        prompts = template.count
+        if self.limit_input.value():
+            prompts = min(prompts, self.limit_input.value())
+        return prompts * len(sizes) * len(seeds)
+
+    def update_job_count(self):
+        try:
+            template = PromptTemplate(self.prompt_lines())
+            seeds = parse_seeds(self.seeds_input.text())
+        except (TemplateError, ValueError) as e:
+            self.job_count_label.setText(str(e))
+            return
+        jobs = self.count_jobs(template, self.selected_sizes(), seeds)
+        self.job_count_label.setText(
+            f"{jobs:,} jobs" + (f" from {template.count:,} prompts" if jobs else "")
+        )
+
+    def selected_sizes(self):
+        sizes = []
+        for row in range(self.sizes_list.count()):
+            item = self.sizes_list.item(row)
+            if item.checkState() == Qt.Checked:
+                sizes.append(SIZE_PRESETS[item.text()])
+        return sizes
+
+    def start_batch(self):
+        lines = self.prompt_lines()
+        sizes = self.selected_sizes()
+        if not lines or not sizes:
+            QMessageBox.warning(
+                self, "Warning", "Please enter at least one prompt and size"
+            )
+            return
+        try:
+            seeds = parse_seeds(self.seeds_input.text())
+        except ValueError:
+            QMessageBox.warning(self, "Warning", "Please enter seeds like 1, 2, 10-20")
+            return
+        try:
+            template = PromptTemplate(lines)
+        except TemplateError as e:
+            QMessageBox.warning(self, "Warning", f"Invalid prompt template: {e}")
+            return
+        jobs = self.count_jobs(template, sizes, seeds)
+        if jobs >= self.LARGE_BATCH:
+            reply = QMessageBox.question(
+                self,
+                "Large Batch",
+                f"This batch has {jobs:,} jobs. Start it?",
+            )
+            if reply != QMessageBox.Yes:
+                return
+
+        if not self.new_queue():
+            return
+        # Expanded as the queue drains, so even a huge template costs no
+        # memory up front
+        limit = self.limit_input.value() or None
+        prompts = template.expand(
+            limit=limit, sample=limit if self.sample_checkbox.isChecked() else None
+        )
+        if self.enhance_checkbox.isChecked():
+            prompts = enhance_lazily(
+                self.api_key, prompts, on_error=self.on_enhance_error
+            )
+        self.feeder = JobFeeder(self.queue, build_matrix(prompts, sizes, seeds))
+        self.feeder.finished_feeding.connect(self.on_jobs_fed)
+        self.feeder.start()
+        self.elapsed_timer.start()
+
+    def new_queue(self, journal=None):
+        # Replaces the current batch with an empty queue; False on failure
+        self.stop_batch()
+        self.jobs_table.setRowCount(0)
+        self.job_rows = {}
+        self.finished_rows = deque()
+        self.removed_rows = 0
+        self.feed_summary = ""
+        try:
+            if self.engine_combo.currentText() == "asyncio":
+                # asyncio is slow to import, so only load it when chosen
+                from imagegen.aio import AsyncBatchQueue
+
+                self.queue = AsyncBatchQueue(
+                    self.api_key,
+                    self.output_input.text(),
+                    max_in_flight=self.concurrency_input.value(),
+                    on_update=self.signals.job_updated.emit,
+                    requests_per_second=self.rate_input.value() or None,
+                    history=get_history(),
+                    journal=journal,
+                )
             else:
-                print(
-                    f"API request failed with status {response.status_code}: {response.text}"
+                self.queue = BatchQueue(
+                    self.api_key,
+                    self.output_input.text(),
+                    max_in_flight=self.concurrency_input.value(),
+                    on_update=self.signals.job_updated.emit,
+                    history=get_history(),
+                    journal=journal,
                 )
+        except OSError as e:
+            QMessageBox.critical(self, "Error", f"Cannot use output folder: {e}")
+            return False
+        self.journal = journal
+        return True
 
-            self.finished.emit(response.status_code, response.text, image_data)
+    def stop_batch(self):
+        # Cancels the current batch, if any, and waits for its feeder
+        if self.queue:
+            self.queue.shutdown()
+            self.queue = None
+        if self.feeder:
+            self.feeder.wait()
+            self.feeder = None
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+
+    def load_manifest(self):
+        path, _ = QFileDialog.getOpenFileName(
+            self,
+            "Load Manifest",
+            "",
+            "Manifests (*.jsonl *.csv *.tsv);;All Files (*)",
+        )
+        if not path:
+            return
+        output_dir = self.output_input.text()
+        try:
+            os.makedirs(output_dir, exist_ok=True)
+            journal = CheckpointJournal(os.path.join(output_dir, JOURNAL_NAME))
+        except OSError as e:
+            QMessageBox.critical(self, "Error", f"Cannot use output folder: {e}")
+            return
+        if not self.new_queue(journal):
+            journal.close()
+            return
+        self.feeder = ManifestFeeder(self.queue, path)
+        self.feeder.bad_row.connect(self.on_manifest_error)
+        self.feeder.finished_feeding.connect(self.on_manifest_loaded)
+        self.feeder.start()
+        self.summary_label.setText(
+            f"Loading {os.path.basename(path)}: "
+            f"{len(journal)} jobs already done in this folder"
+        )
+        self.elapsed_timer.start()
+
+    def on_manifest_error(self, message):
+        print(f"Skipping manifest row: {message}")
+
+    def is_current_feeder(self):
+        # False for signals from the feeder of a batch that has been replaced
+        return self.feeder is not None and self.sender() is self.feeder
+
+    def on_jobs_fed(self, submitted):
+        if self.is_current_feeder():
+            self.feed_summary = f"{submitted:,} jobs submitted"
+            self.update_summary()
+
+    def on_manifest_loaded(self, submitted, skipped, bad_rows):
+        if not self.is_current_feeder():
+            return
+        self.feed_summary = (
+            f"Manifest: {submitted} submitted, {skipped} already done"
+            + (f", {bad_rows} bad rows skipped (see log)" if bad_rows else "")
+        )
+        self.update_summary()
+
+    def on_enhance_error(self, prompt, error):
+        # Runs on the feeder thread
+        print(f"Enhancement failed, using original prompt: {error}")
+        return prompt
+
+    def on_job_updated(self, job):
+        # Ignore late updates from a batch that has been replaced
+        if not self.queue:
+            return
+        if self.queue.jobs.get(job.job_id) is not job:
+            if job.job_id in self.job_rows and job.status in FINISHED:
+                # Finished long enough ago that the queue no longer keeps it
+                self.remove_job_row(job.job_id)
+            return
+        if job.history_entry is not None:
+            self.history_entry_added.emit(job.history_entry)
+        item = self.job_rows.get(job.job_id)
+        if item is None:
+            row = self.jobs_table.rowCount()
+            self.jobs_table.insertRow(row)
+            item = QTableWidgetItem()
+            item.setData(Qt.UserRole, job.job_id)
+            self.jobs_table.setItem(row, 0, item)
+            self.job_rows[job.job_id] = item
+        row = item.row()
+        values = [
+            str(job.number + 1),
+            job.prompt,
+            f"{job.width}x{job.height}",
+            "random" if job.seed is None else str(job.seed),
+            job.status if not job.error else f"{job.status}: {job.error}",
+            self.job_time_text(job),
+        ]
+        item.setText(values[0])
+        for column, value in enumerate(values[1:], 1):
+            self.jobs_table.setItem(row, column, QTableWidgetItem(value))
+        if job.status in FINISHED and job.job_id not in self.finished_rows:
+            self.finished_rows.append(job.job_id)
+            while len(self.finished_rows) > self.queue.keep_finished:
+                self.remove_job_row(self.finished_rows.popleft())
+
+        self.update_summary()
+
+    def remove_job_row(self, job_id):
+        item = self.job_rows.pop(job_id, None)
+        if item is not None:
+            self.jobs_table.removeRow(item.row())
+            self.removed_rows += 1
+
+    def update_summary(self):
+        counts = self.queue.counts()
+        summary = ", ".join(f"{count} {status}" for status, count in counts.items())
+        if self.feed_summary:
+            summary = f"{self.feed_summary} | {summary}"
+        if self.removed_rows:
+            summary += f" | {self.removed_rows:,} older finished jobs not listed"
+        self.summary_label.setText(summary)
+
+    def job_time_text(self, job):
+        if job.elapsed is None:
+            return f"~{job.estimate:.0f}s"
+        if job.status == RUNNING:
+            return format_progress(job.elapsed, job.estimate)
+        return f"{job.elapsed:.1f}s"
+
+    def refresh_running_jobs(self):
+        if not self.queue:
+            self.elapsed_timer.stop()
+            return
+        for job in self.queue.current_jobs():
+            item = self.job_rows.get(job.job_id)
+            if job.status == RUNNING and item is not None:
+                self.jobs_table.setItem(
+                    item.row(), 5, QTableWidgetItem(self.job_time_text(job))
+                )
+
+    def cancel_selected(self):
+        if not self.queue:
+            return
+        rows = {index.row() for index in self.jobs_table.selectedIndexes()}
+        for row in rows:
+            self.queue.cancel(self.jobs_table.item(row, 0).data(Qt.UserRole))
+
+    def cancel_all(self):
+        if self.queue:
+            self.queue.cancel_all()
+
+    def closeEvent(self, event):
+        if self.queue and self.queue.counts()[RUNNING]:
+            reply = QMessageBox.question(
+                self,
+                "Batch Running",
+                "Cancel the remaining jobs and close?",
+            )
+            if reply != QMessageBox.Yes:
+                event.ignore()
+                return
+        self.stop_batch()
+        self.elapsed_timer.stop()
+        super().closeEvent(event)
+
+
+class ThumbnailSignals(QObject):
+    loaded = pyqtSignal(int, object)  # Entry id, QImage or None
+    image_loaded = pyqtSignal(object, object, object)  # Entry, bytes, QImage
+
+
+class ThumbnailTask(QRunnable):
+    # Makes (on first use) and decodes one thumbnail on the thread pool
+    def __init__(self, store, entry, signals):
+        super().__init__()
+        self.store = store
+        self.entry = entry
+        self.signals = signals
+
+    def run(self):
+        try:
+            image = QImage(str(self.store.thumbnail(self.entry)))
         except Exception as e:
-            print(f"APIWorker error: {e}")
-            self.error.emit(str(e))
+            print(f"Failed to load thumbnail {self.entry.id}: {e}")
+            image = None
+        self.signals.loaded.emit(self.entry.id, image)
+
+
+class ImageLoadTask(QRunnable):
+    # Reads and decodes a full-size history image on the thread pool
+    def __init__(self, store, entry, signals):
+        super().__init__()
+        self.store = store
+        self.entry = entry
+        self.signals = signals
+
+    def run(self):
+        try:
+            image_data = self.store.read_image(self.entry)
+        except OSError as e:
+            print(f"Failed to read history image {self.entry.id}: {e}")
+            image_data = None
+        image = qimage_from_data(image_data) if image_data else None
+        self.signals.image_loaded.emit(self.entry, image_data, image)
+
+
+class ExportSignals(QObject):
+    saved = pyqtSignal(str)  # Path of a single saved image
+    progress = pyqtSignal(int, int, int)  # Done, failed, total
+    failed = pyqtSignal(str)
+
+
+class SaveImageTask(QRunnable):
+    # Encodes and writes one image on a thread pool so saving never blocks
+    # the GUI
+    def __init__(self, image_data, path, fmt, options, signals):
+        super().__init__()
+        self.image_data = image_data
+        self.path = path
+        self.fmt = fmt
+        self.options = options
+        self.signals = signals
+
+    def run(self):
+        try:
+            save_image(self.image_data, self.path, self.fmt, **self.options)
+        except Exception as e:
+            print(f"Failed to save image: {e}")
+            self.signals.failed.emit(str(e))
+            return
+        self.signals.saved.emit(self.path)
+
+
+class BulkExportTask(QRunnable):
+    # Exports many (name, loader) items in parallel, reporting progress
+    def __init__(self, items, output_dir, fmt, options, signals):
+        super().__init__()
+        self.items = items
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.options = options
+        self.signals = signals
+
+    def run(self):
+        total = len(self.items)
+        counts = {"done": 0, "failed": 0}
+
+        def on_done(name, path, error):
+            counts["failed" if error else "done"] += 1
+            if error:
+                print(f"Failed to export {name}: {error}")
+            self.signals.progress.emit(counts["done"], counts["failed"], total)
+
+        try:
+            export_many(
+                self.items, self.output_dir, self.fmt, on_done=on_done, **self.options
+            )
+        except Exception as e:
+            print(f"Export failed: {e}")
+            self.signals.failed.emit(str(e))
+
+
+class HistoryModel(QAbstractListModel):
+    # Rows are paged in from the history index as the view scrolls, and
+    # thumbnails are decoded on a thread pool only when the view asks for
+    # them, i.e. when they are about to be painted. At most
+    # THUMBNAIL_CACHE_SIZE thumbnails are held in memory.
+    PAGE_SIZE = 200
+    THUMBNAIL_CACHE_SIZE = 300
+
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.entries = []
+        self.filters = {}  # HistoryStore.count()/page() keyword arguments
+        self.total = store.count()
+        self.thumbnails = {}  # Entry id -> QPixmap, insertion order is recency
+        self.pending = set()
+        self.request_count = 0
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(min(4, max(1, QThread.idealThreadCount())))
+        self.signals = ThumbnailSignals()
+        self.signals.loaded.connect(self.on_thumbnail_loaded)
+        self.placeholder = QPixmap(THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+        self.placeholder.fill(QColor(230, 230, 230))
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.entries)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and len(self.entries) < self.total
+
+    def fetchMore(self, parent=QModelIndex()):
+        before_id = self.entries[-1].id if self.entries else None
+        entries = self.store.page(self.PAGE_SIZE, before_id, **self.filters)
+        if not entries:
+            self.total = len(self.entries)
+            return
+        start = len(self.entries)
+        self.beginInsertRows(QModelIndex(), start, start + len(entries) - 1)
+        self.entries.extend(entries)
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        entry = self.entries[index.row()]
+        if role == Qt.DisplayRole:
+            return f"{entry.width}x{entry.height}"
+        if role == Qt.ToolTipRole:
+            created = datetime.fromtimestamp(entry.created_at)
+            seed = "random" if entry.seed is None else entry.seed
+            return (
+                f"{entry.prompt}\n\n{entry.width}x{entry.height}, seed {seed}, "
+                f"{entry.steps} steps\n{created:%Y-%m-%d %H:%M}"
+            )
+        if role == Qt.DecorationRole:
+            pixmap = self.thumbnails.pop(entry.id, None)
+            if pixmap is not None:
+                self.thumbnails[entry.id] = pixmap  # Mark as recently used
+                return pixmap
+            self.request_thumbnail(entry)
+            return self.placeholder
+        return None
+
+    def request_thumbnail(self, entry):
+        if entry.id in self.pending:
+            return
+        self.pending.add(entry.id)
+        # Later requests get higher priority so the rows on screen now are
+        # decoded before ones that were scrolled past
+        self.request_count += 1
+        self.pool.start(
+            ThumbnailTask(self.store, entry, self.signals), self.request_count
+        )
+
+    def on_thumbnail_loaded(self, entry_id, image):
+        self.pending.discard(entry_id)
+        if image is None or image.isNull():
+            return
+        self.thumbnails[entry_id] = QPixmap.fromImage(image)
+        while len(self.thumbnails) > self.THUMBNAIL_CACHE_SIZE:
+            del self.thumbnails[next(iter(self.thumbnails))]
+        row = self.row_of(entry_id)
+        if row is not None:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+    def row_of(self, entry_id):
+        for row, entry in enumerate(self.entries):
+            if entry.id == entry_id:
+                return row
+        return None
+
+    def set_filters(self, **filters):
+        # Starts over with only the entries matching `filters`
+        self.beginResetModel()
+        self.filters = {name: value for name, value in filters.items() if value}
+        self.entries = []
+        self.total = self.store.count(**self.filters)
+        self.endResetModel()
+
+    def prepend(self, entry):
+        if self.filters:
+            return  # May not match; shown once the search is cleared
+        self.beginInsertRows(QModelIndex(), 0, 0)
+        self.entries.insert(0, entry)
+        self.total += 1
+        self.endInsertRows()
+
+    def remove_rows(self, rows):
+        ids = [self.entries[row].id for row in rows]
+        self.store.delete(ids)
+        for row in sorted(rows, reverse=True):
+            self.beginRemoveRows(QModelIndex(), row, row)
+            entry = self.entries.pop(row)
+            self.thumbnails.pop(entry.id, None)
+            self.total -= 1
+            self.endRemoveRows()
+
+    def shutdown(self):
+        self.pool.clear()
+        self.pool.waitForDone()
+
+
+class HistoryDialog(QDialog):
+    entry_opened = pyqtSignal(object, object, object)  # Entry, bytes, QImage
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.store = get_history()
+        self.model = HistoryModel(self.store, self)
+        self.model.signals.image_loaded.connect(self.entry_opened)
+        self.setWindowTitle("History")
+        self.resize(820, 600)
+        self.setWindowFlags(self.windowFlags() & ~Qt.WindowContextHelpButtonHint)
+        self.init_ui()
+
+    def init_ui(self):
+        layout = QVBoxLayout()
+
+        filter_layout = QHBoxLayout()
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Search prompts...")
+        self.search_input.setStyleSheet("border: 1px solid #666666;")
+        self.search_input.textChanged.connect(self.search_timer_start)
+        filter_layout.addWidget(self.search_input)
+        self.size_filter = QComboBox()
+        self.size_filter.addItem("Any size", None)
+        for name, size in SIZE_PRESETS.items():
+            self.size_filter.addItem(name, size)
+        self.size_filter.currentIndexChanged.connect(self.apply_filters)
+        filter_layout.addWidget(self.size_filter)
+        layout.addLayout(filter_layout)
+
+        # Search once typing pauses rather than on every keystroke
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(250)
+        self.search_timer.timeout.connect(self.apply_filters)
+
+        self.view = QListView()
+        self.view.setViewMode(QListView.IconMode)
+        self.view.setIconSize(QSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        self.view.setGridSize(QSize(THUMBNAIL_SIZE + 20, THUMBNAIL_SIZE + 36))
+        self.view.setResizeMode(QListView.Adjust)
+        self.view.setMovement(QListView.Static)
+        # Every cell has the same size, so the view can lay out thousands of
+        # rows without asking each one for its size hint
+        self.view.setUniformItemSizes(True)
+        self.view.setLayoutMode(QListView.Batched)
+        self.view.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.view.setModel(self.model)
+        self.view.doubleClicked.connect(self.open_selected)
+        layout.addWidget(self.view)
+
+        self.summary_label = QLabel()
+        layout.addWidget(self.summary_label)
+        self.model.rowsInserted.connect(self.update_summary)
+        self.model.rowsRemoved.connect(self.update_summary)
+        self.update_summary()
+
+        button_layout = QHBoxLayout()
+        open_button = QPushButton("Open")
+        open_button.clicked.connect(self.open_selected)
+        button_layout.addWidget(open_button)
+
+        self.export_button = QPushButton("Export...")
+        self.export_button.setToolTip("Save the selected images to a folder")
+        self.export_button.clicked.connect(self.export_selected)
+        button_layout.addWidget(self.export_button)
+
+        delete_button = QPushButton("Delete")
+        delete_button.clicked.connect(self.delete_selected)
+        button_layout.addWidget(delete_button)
+
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.close)
+        button_layout.addWidget(close_button)
+
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+    def search_timer_start(self):
+        self.search_timer.start()
+
+    def apply_filters(self):
+        self.search_timer.stop()
+        self.model.set_filters(
+            search=self.search_input.text().strip(),
+            size=self.size_filter.currentData(),
+        )
+        self.update_summary()
+
+    def update_summary(self):
+        matching = " matching" if self.model.filters else ""
+        self.summary_label.setText(f"{self.model.total}{matching} images")
+
+    def add_entry(self, entry):
+        self.model.prepend(entry)
+
+    def open_selected(self):
+        indexes = self.view.selectedIndexes()
+        if not indexes:
+            return
+        entry = self.model.entries[indexes[0].row()]
+        self.model.pool.start(
+            ImageLoadTask(self.store, entry, self.model.signals), 2**30
+        )
+
+    def export_selected(self):
+        rows = sorted({index.row() for index in self.view.selectedIndexes()})
+        if not rows:
+            QMessageBox.information(self, "Export", "Select the images to export")
+            return
+        labels = {FORMATS[name][0]: name for name in available_formats()}
+        label, ok = QInputDialog.getItem(
+            self, "Export", "Format:", list(labels), 0, False
+        )
+        if not ok:
+            return
+        output_dir = QFileDialog.getExistingDirectory(
+            self, "Export To", str(Path.home() / "Downloads")
+        )
+        if not output_dir:
+            return
+        # Files are read by the export threads, not here
+        items = [
+            (
+                Path(entry.filename).stem,
+                lambda entry=entry: self.store.read_image(entry),
+            )
+            for entry in (self.model.entries[row] for row in rows)
+        ]
+        self.export_button.setEnabled(False)
+        self.export_signals = ExportSignals()
+        self.export_signals.progress.connect(self.on_export_progress)
+        self.export_signals.failed.connect(self.on_export_failed)
+        self.export_output_dir = output_dir
+        self.model.pool.start(
+            BulkExportTask(
+                items, output_dir, labels[label], export_options(), self.export_signals
+            ),
+            2**30,
+        )
+
+    def on_export_progress(self, done, failed, total):
+        text = f"Exported {done} of {total}"
+        if failed:
+            text += f", {failed} failed"
+        if done + failed == total:
+            text += f" to {self.export_output_dir}"
+            self.export_button.setEnabled(True)
+        self.summary_label.setText(text)
+
+    def on_export_failed(self, error_message):
+        self.export_button.setEnabled(True)
+        QMessageBox.critical(self, "Error", f"Export failed: {error_message}")
+
+    def delete_selected(self):
+        rows = sorted({index.row() for index in self.view.selectedIndexes()})
+        if not rows:
+            return
+        reply = QMessageBox.question(
+            self, "Delete Images", f"Delete {len(rows)} image(s) from history?"
+        )
+        if reply == QMessageBox.Yes:
+            self.model.remove_rows(rows)
+
+
+class TimingStatsDialog(QDialog):
+    # Percentiles of every traced request phase, refreshed while open
+    COLUMNS = ["Kind", "Phase", "Count", "p50 ms", "p95 ms", "p99 ms"]
+    REFRESH_MS = 2000
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Timing Stats")
+        self.resize(560, 420)
+        self.setWindowFlags(self.windowFlags() & ~Qt.WindowContextHelpButtonHint)
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(self.REFRESH_MS)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.init_ui()
+
+    def init_ui(self):
+        layout = QVBoxLayout()
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        self.saved_label = QLabel()
+        self.saved_label.setFont(QFont("Arial", 10))
+        layout.addWidget(self.saved_label)
+
+        path_label = QLabel(f"Every request is logged to {get_trace_log().path}")
+        path_label.setFont(QFont("Arial", 10))
+        path_label.setStyleSheet("color: #666666;")
+        path_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        layout.addWidget(path_label)
+
+        button_layout = QHBoxLayout()
+        refresh_button = QPushButton("Refresh")
+        refresh_button.clicked.connect(self.refresh)
+        button_layout.addWidget(refresh_button)
+
+        clear_button = QPushButton("Clear")
+        clear_button.clicked.connect(self.clear)
+        button_layout.addWidget(clear_button)
+
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.close)
+        button_layout.addWidget(close_button)
+
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+    def refresh(self):
+        log = get_trace_log()
+        self.saved_label.setText(
+            f"Requests saved: {log.saved['cached']} cache hits, "
+            f"{log.saved['coalesced']} joined an identical request in flight"
+        )
+        rows = log.summary()
+        self.table.setRowCount(len(rows))
+        for row, (kind, name, count, p50, p95, p99) in enumerate(rows):
+            values = [kind, name, str(count)] + [f"{ms:.1f}" for ms in (p50, p95, p99)]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if column >= 2:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(row, column, item)
+
+    def clear(self):
+        reply = QMessageBox.question(
+            self, "Clear Timings", "Delete the recorded timings and the log file?"
+        )
+        if reply == QMessageBox.Yes:
+            get_trace_log().clear()
+            self.refresh()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+        self.refresh_timer.start()
+
+    def hideEvent(self, event):
+        self.refresh_timer.stop()
+        super().hideEvent(event)
+
+
+def qimage_from_data(image_data):
+    # Decodes straight into a QImage that wraps the decoded pixel buffer, so
+    # no intermediate re-encode is needed. Safe to call off the GUI thread;
+    # returns None when the data cannot be decoded.
+    try:
+        pixels, width, height, has_alpha = decode_pixels(image_data)
+    except Exception as e:
+        print(f"Failed to decode image: {e}")
+        return None
+    image_format = QImage.Format_ARGB32 if has_alpha else QImage.Format_RGB32
+    image = QImage(pixels, width, height, width * 4, image_format)
+    image.pixels = pixels  # QImage does not own the buffer; keep it alive
+    return image
+
+
+def decode_with_thumbnail(image_data, size=RESULT_THUMBNAIL_SIZE):
+    # (image, thumbnail) for the results grid, or (None, None)
+    image = qimage_from_data(image_data)
+    if image is None or image.isNull():
+        return None, None
+    return image, image.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
 
 
 class ImageLabel(QLabel):
+    # Shows the image scaled to fit. Downscaling starts from a pyramid of
+    # pre-halved copies instead of the full-resolution original; while the
+    # label is being resized a fast transform is used, and the smooth pass
+    # runs once resizing pauses. Smooth results are cached by target size.
+    SMOOTH_DELAY_MS = 150
+    SCALED_CACHE_SIZE = 8
+
     def __init__(self):
         super().__init__()
         self.setAlignment(Qt.AlignCenter)
@@ -411,54 +1850,145 @@ class ImageLabel(QLabel):
         )
         self.setText("Generated image will appear here")
         self.original_pixmap = None
+        self.levels = []  # original_pixmap, then successive halvings
+        self.scaled_cache = {}  # (width, height) -> QPixmap, oldest first
+        self.smooth_timer = QTimer(self)
+        self.smooth_timer.setSingleShot(True)
+        self.smooth_timer.setInterval(self.SMOOTH_DELAY_MS)
+        self.smooth_timer.timeout.connect(self.updateScaledPixmap)
 
     def setImageFromData(self, image_data):
         if not image_data:
             return False
-        try:
-            pil_image = Image.open(BytesIO(image_data))
-            if pil_image.mode != "RGB":
-                pil_image = pil_image.convert("RGB")
-            img_buffer = BytesIO()
-            pil_image.save(img_buffer, format="PNG")
-            img_buffer.seek(0)
-            pixmap = QPixmap()
-            pixmap.loadFromData(img_buffer.getvalue())
-            if pixmap.isNull():
-                return False
-            self.original_pixmap = pixmap
-            self.updateScaledPixmap()
-            return True
-        except Exception:
+        return self.setImage(qimage_from_data(image_data))
+
+    def setImage(self, image):
+        if image is None or image.isNull():
+            return False
+        pixmap = QPixmap.fromImage(image)
+        if pixmap.isNull():
             return False
+        self.original_pixmap = pixmap
+        self.levels = [pixmap]
+        self.scaled_cache = {}
+        self.updateScaledPixmap()
+        return True
 
-    def updateScaledPixmap(self):
-        if self.original_pixmap:
-            scaled_pixmap = self.original_pixmap.scaled(
-                self.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation
+    def levelFor(self, size):
+        # Smallest pyramid level that is still at least `size`; levels are
+        # added on demand, each one a smooth halving of the previous one
+        while True:
+            last = self.levels[-1]
+            half = QSize(last.width() // 2, last.height() // 2)
+            if half.width() < size.width() or half.height() < size.height():
+                break
+            self.levels.append(
+                last.scaled(half, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
             )
-            self.setPixmap(scaled_pixmap)
+        for level in reversed(self.levels):
+            if level.width() >= size.width() and level.height() >= size.height():
+                return level
+        return self.levels[0]
+
+    def updateScaledPixmap(self, smooth=True):
+        if not self.original_pixmap:
+            return
+        size = self.original_pixmap.size().scaled(self.size(), Qt.KeepAspectRatio)
+        if size.isEmpty():
+            return
+        key = (size.width(), size.height())
+        scaled_pixmap = self.scaled_cache.pop(key, None)
+        if scaled_pixmap is not None:
+            self.scaled_cache[key] = scaled_pixmap  # Mark as recently used
+        elif smooth:
+            scaled_pixmap = self.levelFor(size).scaled(
+                size, Qt.IgnoreAspectRatio, Qt.SmoothTransformation
+            )
+            self.scaled_cache[key] = scaled_pixmap
+            while len(self.scaled_cache) > self.SCALED_CACHE_SIZE:
+                del self.scaled_cache[next(iter(self.scaled_cache))]
+        else:
+            scaled_pixmap = self.levelFor(size).scaled(
+                size, Qt.IgnoreAspectRatio, Qt.FastTransformation
+            )
+            self.smooth_timer.start()
+        self.setPixmap(scaled_pixmap)
 
     def resizeEvent(self, event):
         super().resizeEvent(event)
-        self.updateScaledPixmap()
+        self.updateScaledPixmap(smooth=False)
 
 
 class ImageGeneratorApp(QMainWindow):
     def __init__(self):
         super().__init__()
         self.current_image_data = None
+        self.batch_dialog = None
+        self.history_dialog = None
+        self.stats_dialog = None
+        self.last_enhanced_original = None
+        self.enhance_variant = 0
+        self.prompt_enhancer = None
+        # Enhances the prompt while the user pauses typing, if enabled
+        self.speculative_enhancer = None
+        self.speculation_timer = QTimer(self)
+        self.speculation_timer.setSingleShot(True)
+        self.speculation_timer.setInterval(SPECULATE_AFTER_MS)
+        self.speculation_timer.timeout.connect(self.start_speculation)
+        # Pieces of the enhancement already in the box
+        self.enhance_shown = 0
+        # Cancelled enhancers still waiting for their next piece
+        self.retired_enhancers = []
+        self.worker = None
+        self.generation_started = None
+        self.generation_estimate = 0.0
+        # (prompt, width, height, seed, count, sweep)
+        self.pending_full_render = None
+        self.results = []  # (seed, image_data, image, thumbnail)
+        self.is_preview = False
         self.api_key = None  # Will be loaded from keyring
+        self.startup_loader = None
+        # Encodes and writes downloads off the GUI thread
+        self.save_pool = QThreadPool(self)
+        self.save_signals = ExportSignals()
+        self.save_signals.saved.connect(self.on_image_saved)
+        self.save_signals.failed.connect(self.on_image_save_failed)
         self.init_ui()
+        apply_network_settings()
+        apply_provider_settings()
         self.load_api_key()
 
     def load_api_key(self):
-        # Load API key from keyring
-        self.api_key = keyring.get_password(KEYRING_SERVICE, KEYRING_USERNAME)
-        if not self.api_key:
+        # Load API key from keyring, in the background so the window shows
+        # at once
+        self.startup_loader = StartupLoader(self)
+        self.startup_loader.loaded.connect(self.on_api_key_loaded)
+        self.startup_loader.start()
+
+    def on_api_key_loaded(self, api_key):
+        self.startup_loader.wait()  # Already returning from run()
+        self.startup_loader = None
+        self.api_key = api_key
+        self.warm_up_connections()
+        if not self.api_key and get_provider().requires_key:
             # Prompt user to enter API key if not already set
             self.show_settings_dialog()
 
+    def warm_up_connections(self, force=False):
+        # Connects to the API in the background so the first generation or
+        # enhancement does not wait for DNS, TCP and TLS; prewarm() skips
+        # endpoints it warmed recently
+        if self.startup_loader is not None:
+            return  # on_api_key_loaded() warms up with the key
+        if app_settings().value("network/preconnect", True, type=bool):
+            prewarm(self.api_key, force=force)
+
+    def eventFilter(self, watched, event):
+        # Starting to type a prompt is a good sign a request will follow
+        if watched is self.prompt_input and event.type() == QEvent.FocusIn:
+            self.warm_up_connections()
+        return super().eventFilter(watched, event)
+
     def init_ui(self):
         self.setWindowTitle("AI Image Generator")
         self.setFixedSize(900, 700)  # Increased size to accommodate new elements
@@ -569,6 +2099,8 @@ class ImageGeneratorApp(QMainWindow):
         self.prompt_input.setPlaceholderText(
             "Describe the image you want to generate..."
         )
+        self.prompt_input.textChanged.connect(self.on_prompt_edited)
+        self.prompt_input.installEventFilter(self)
         left_layout.addWidget(self.prompt_input)
 
         # Enhance prompt button
@@ -595,20 +2127,7 @@ class ImageGeneratorApp(QMainWindow):
         left_layout.addWidget(size_label)
 
         self.size_combo = QComboBox()
-        self.size_combo.addItems(
-            [
-                "Square (512x512)",
-                "Square (1024x1024)",
-                "Square (2000x2000)",
-                "Portrait 3:4 (768x1024)",
-                "Portrait 9:16 (576x1024)",
-                "Landscape 4:3 (1024x768)",
-                "Landscape 16:9 (1024x576)",
-                "Landscape 16:9 (1280x720)",
-                "Landscape 16:9 (1920x1080)",
-                "Custom Size",
-            ]
-        )
+        self.size_combo.addItems(list(SIZE_PRESETS) + ["Custom Size"])
         self.size_combo.setCurrentIndex(1)
         self.size_combo.currentTextChanged.connect(self.on_size_changed)
         left_layout.addWidget(self.size_combo)
@@ -623,14 +2142,65 @@ class ImageGeneratorApp(QMainWindow):
         self.custom_size_input.setVisible(False)
         left_layout.addWidget(self.custom_size_input)
 
+        # Several images per request, and/or one request per consecutive seed
+        variants_layout = QHBoxLayout()
+        variants_layout.addWidget(QLabel("Images per request:"))
+        self.count_spin = QSpinBox()
+        self.count_spin.setRange(1, MAX_IMAGES_PER_REQUEST)
+        variants_layout.addWidget(self.count_spin)
+        variants_layout.addWidget(QLabel("Seeds:"))
+        self.sweep_spin = QSpinBox()
+        self.sweep_spin.setRange(1, MAX_SWEEP_SEEDS)
+        self.sweep_spin.setToolTip("Sweep this many consecutive seeds in parallel")
+        variants_layout.addWidget(self.sweep_spin)
+        variants_layout.addStretch()
+        left_layout.addLayout(variants_layout)
+
+        # Local post-processing of full renders; cheaper than a larger render
+        postprocess_layout = QHBoxLayout()
+        postprocess_layout.addWidget(QLabel("Upscale:"))
+        self.upscale_combo = QComboBox()
+        for factor in UPSCALE_FACTORS:
+            self.upscale_combo.addItem("Off" if factor == 1 else f"{factor:g}x", factor)
+        self.upscale_combo.setToolTip(
+            "Enlarge results on this computer (Lanczos), beyond the API's 2048 px"
+        )
+        postprocess_layout.addWidget(self.upscale_combo)
+        self.sharpen_checkbox = QCheckBox("Sharpen")
+        postprocess_layout.addWidget(self.sharpen_checkbox)
+        postprocess_layout.addStretch()
+        left_layout.addLayout(postprocess_layout)
+
+        self.preview_checkbox = QCheckBox("Quick preview first (smaller, fewer steps)")
+        left_layout.addWidget(self.preview_checkbox)
+
         self.generate_btn = QPushButton("🚀 Generate Image")
         self.generate_btn.clicked.connect(self.generate_image)
         self.generate_btn.setFixedHeight(40)
         left_layout.addWidget(self.generate_btn)
 
+        # Shown once a preview is on screen; renders it at full quality
+        self.render_full_btn = QPushButton("🖼 Render Full Size")
+        self.render_full_btn.clicked.connect(self.render_full_size)
+        self.render_full_btn.setFixedHeight(40)
+        self.render_full_btn.setVisible(False)
+        left_layout.addWidget(self.render_full_btn)
+
+        progress_layout = QHBoxLayout()
         self.progress_bar = QProgressBar()
         self.progress_bar.setVisible(False)
-        left_layout.addWidget(self.progress_bar)
+        progress_layout.addWidget(self.progress_bar)
+
+        self.cancel_btn = QPushButton("✖ Cancel")
+        self.cancel_btn.clicked.connect(self.cancel_generation)
+        self.cancel_btn.setVisible(False)
+        progress_layout.addWidget(self.cancel_btn)
+        left_layout.addLayout(progress_layout)
+
+        # Advances the progress bar against the estimated duration
+        self.progress_timer = QTimer(self)
+        self.progress_timer.setInterval(PROGRESS_INTERVAL_MS)
+        self.progress_timer.timeout.connect(self.update_generation_progress)
 
         self.download_btn = QPushButton("💾 Download Image")
         self.download_btn.setObjectName("downloadButton")
@@ -656,6 +2226,21 @@ class ImageGeneratorApp(QMainWindow):
         scroll_area.setWidget(self.image_label)
         right_layout.addWidget(scroll_area)
 
+        # All images of the last generation when there is more than one;
+        # clicking one shows it above
+        self.result_grid = QListWidget()
+        self.result_grid.setViewMode(QListView.IconMode)
+        self.result_grid.setFlow(QListView.LeftToRight)
+        self.result_grid.setWrapping(False)
+        self.result_grid.setMovement(QListView.Static)
+        self.result_grid.setIconSize(
+            QSize(RESULT_THUMBNAIL_SIZE, RESULT_THUMBNAIL_SIZE)
+        )
+        self.result_grid.setFixedHeight(RESULT_THUMBNAIL_SIZE + 40)
+        self.result_grid.currentRowChanged.connect(self.show_result)
+        self.result_grid.setVisible(False)
+        right_layout.addWidget(self.result_grid)
+
         splitter.addWidget(left_panel)
         splitter.addWidget(right_panel)
         splitter.setSizes([350, 550])
@@ -665,6 +2250,23 @@ class ImageGeneratorApp(QMainWindow):
     def create_menu_bar(self):
         menubar = self.menuBar()
 
+        # Tools menu
+        tools_menu = menubar.addMenu("Tools")
+        batch_action = QAction("Batch Generate...", self)
+        batch_action.setStatusTip("Generate many prompt, size and seed combinations")
+        batch_action.triggered.connect(self.show_batch_dialog)
+        tools_menu.addAction(batch_action)
+
+        history_action = QAction("History...", self)
+        history_action.setStatusTip("Browse every image generated so far")
+        history_action.triggered.connect(self.show_history_dialog)
+        tools_menu.addAction(history_action)
+
+        stats_action = QAction("Timing Stats...", self)
+        stats_action.setStatusTip("Where the time goes in each request phase")
+        stats_action.triggered.connect(self.show_stats_dialog)
+        tools_menu.addAction(stats_action)
+
         # Help menu
         help_menu = menubar.addMenu("Help")
 
@@ -689,18 +2291,64 @@ class ImageGeneratorApp(QMainWindow):
         about_dialog = AboutDialog(self)
         about_dialog.exec_()
 
+    def show_batch_dialog(self):
+        if not self.check_api_key():
+            return
+        # Reuse the dialog so reopening it shows the last batch
+        if self.batch_dialog is None:
+            self.batch_dialog = BatchDialog(self.api_key, self)
+            self.batch_dialog.history_entry_added.connect(self.on_history_entry_added)
+        self.batch_dialog.api_key = self.api_key
+        self.batch_dialog.show()
+        self.batch_dialog.raise_()
+
+    def show_history_dialog(self):
+        if self.history_dialog is None:
+            self.history_dialog = HistoryDialog(self)
+            self.history_dialog.entry_opened.connect(self.on_history_entry_opened)
+        self.history_dialog.show()
+        self.history_dialog.raise_()
+
+    def show_stats_dialog(self):
+        if self.stats_dialog is None:
+            self.stats_dialog = TimingStatsDialog(self)
+        self.stats_dialog.show()
+        self.stats_dialog.raise_()
+
+    def on_history_entry_added(self, entry):
+        if self.history_dialog is not None:
+            self.history_dialog.add_entry(entry)
+
+    def on_history_entry_opened(self, entry, image_data, image):
+        if not image_data or not self.image_label.setImage(image):
+            QMessageBox.warning(self, "Warning", "Could not open the image")
+            return
+        self.show_results([(entry.seed, image_data, image, None)])
+        self.download_btn.setEnabled(True)
+        self.prompt_input.setPlainText(entry.prompt)
+        self.enhanced_prompt_input.clear()
+        self.statusBar().showMessage(
+            f"Opened image from history ({entry.width}x{entry.height})"
+        )
+
     def show_settings_dialog(self):
-        dialog = SettingsDialog(self)
+        dialog = SettingsDialog(self.api_key, self)
         if dialog.exec_():
-            # Reload API key after settings dialog closes
-            self.load_api_key()
+            self.api_key = dialog.api_key
+            # The endpoint or key may have changed
+            self.warm_up_connections(force=True)
 
     def on_size_changed(self, text):
         self.custom_size_label.setVisible(text == "Custom Size")
         self.custom_size_input.setVisible(text == "Custom Size")
 
     def check_api_key(self):
-        if not self.api_key:
+        if self.startup_loader is not None:
+            self.statusBar().showMessage(
+                "Still reading the API key from the keyring..."
+            )
+            return False
+        if not self.api_key and get_provider().requires_key:
             QMessageBox.warning(
                 self,
                 "API Key Required",
@@ -711,18 +2359,6 @@ class ImageGeneratorApp(QMainWindow):
         return True
 
     def get_image_size(self):
-        size_map = {
-            "Square (512x512)": (512, 512),
-            "Square (1024x1024)": (1024, 1024),
-            "Square (2000x2000)": (2000, 2000),
-            "Portrait 3:4 (768x1024)": (768, 1024),
-            "Portrait 9:16 (576x1024)": (576, 1024),
-            "Landscape 4:3 (1024x768)": (1024, 768),
-            "Landscape 16:9 (1024x576)": (1024, 576),
-            "Landscape 16:9 (1280x720)": (1280, 720),
-            "Landscape 16:9 (1920x1080)": (1920, 1080),
-        }
-
         if self.size_combo.currentText() == "Custom Size":
             try:
                 width, height = map(
@@ -732,7 +2368,7 @@ class ImageGeneratorApp(QMainWindow):
             except ValueError:
                 return None, None
 
-        return size_map.get(self.size_combo.currentText(), (1024, 1024))
+        return SIZE_PRESETS.get(self.size_combo.currentText(), (1024, 1024))
 
     def enhance_prompt(self):
         if not self.check_api_key():
@@ -748,21 +2384,163 @@ class ImageGeneratorApp(QMainWindow):
         self.progress_bar.setRange(0, 0)
         self.statusBar().showMessage("Enhancing prompt...")
 
-        self.prompt_enhancer = PromptEnhancerWorker(self.api_key, original_prompt)
+        # Clicking again on the same prompt cycles through its variants;
+        # variants already in the memo come back without a request
+        variants = app_settings().value("enhance/variants", 1, type=int)
+        if original_prompt == self.last_enhanced_original:
+            self.enhance_variant = (self.enhance_variant + 1) % variants
+        else:
+            self.enhance_variant = 0
+        self.last_enhanced_original = original_prompt
+
+        speculative = self.speculative_enhancer
+        if (
+            speculative is not None
+            and speculative.isRunning()
+            and speculative.original_prompt == original_prompt
+            and speculative.variant == self.enhance_variant
+        ):
+            # Already being enhanced in the background: show what it has
+            # written so far and let it carry on. A finished one has left
+            # its result in the memo, which the new worker below finds.
+            self.speculative_enhancer = None
+            self.prompt_enhancer = speculative
+            pieces = list(speculative.pieces)
+            self.enhanced_prompt_input.setPlainText("".join(pieces))
+            self.enhance_shown = len(pieces)
+            if pieces:
+                self.on_enhancement_writing()
+            return
+
+        self.enhanced_prompt_input.clear()
+        self.enhance_shown = 0
+        self.prompt_enhancer = PromptEnhancerWorker(
+            self.api_key, original_prompt, self.enhance_variant
+        )
+        self.prompt_enhancer.token.connect(self.on_enhance_token)
         self.prompt_enhancer.finished.connect(self.on_prompt_enhanced)
         self.prompt_enhancer.error.connect(self.on_prompt_enhancement_error)
+        self.prompt_enhancer.cancelled.connect(self.on_prompt_enhancement_cancelled)
         self.prompt_enhancer.start()
 
+    def retire_enhancer(self, enhancer):
+        # Cancels a running enhancer and keeps it referenced until its
+        # thread notices and ends
+        if not enhancer.isRunning():
+            return
+        enhancer.cancel()
+        self.retired_enhancers = [
+            worker for worker in self.retired_enhancers if worker.isRunning()
+        ]
+        self.retired_enhancers.append(enhancer)
+
+    def on_prompt_edited(self):
+        # Editing the prompt makes a running enhancement stale, so stop it
+        # rather than let it fill the box with text for the old prompt
+        prompt = self.prompt_input.toPlainText().strip()
+        speculative = self.speculative_enhancer
+        if speculative is not None and speculative.original_prompt != prompt:
+            self.retire_enhancer(speculative)
+            self.speculative_enhancer = None
+        if app_settings().value("enhance/speculative", False, type=bool):
+            self.speculation_timer.start()  # Restarts the wait if running
+        enhancer = self.prompt_enhancer
+        if (
+            enhancer is None
+            or not enhancer.isRunning()
+            or prompt == enhancer.original_prompt
+        ):
+            return
+        self.retire_enhancer(enhancer)
+        self.prompt_enhancer = None
+        self.last_enhanced_original = None
+        self.enhanced_prompt_input.clear()
+        self.enhance_btn.setEnabled(self.generate_btn.isEnabled())
+        if not (self.worker and self.worker.isRunning()):
+            self.progress_bar.setVisible(False)
+        self.statusBar().showMessage("Enhancement cancelled: the prompt changed")
+
+    def start_speculation(self):
+        # The user stopped typing for a moment: enhance the prompt in the
+        # background, so Enhance finds it under way or already in the memo.
+        # Nothing is shown unless Enhance is clicked.
+        prompt = self.prompt_input.toPlainText().strip()
+        if (
+            not app_settings().value("enhance/speculative", False, type=bool)
+            or self.startup_loader is not None
+            or (not self.api_key and get_provider().requires_key)
+            or len(prompt.split()) < SPECULATE_MIN_WORDS
+            or is_template(prompt)  # Enhanced per combination, if at all
+            or prompt == self.last_enhanced_original
+            or (self.prompt_enhancer is not None and self.prompt_enhancer.isRunning())
+            or (
+                self.speculative_enhancer is not None
+                and self.speculative_enhancer.isRunning()
+            )
+        ):
+            return
+        self.speculative_enhancer = PromptEnhancerWorker(
+            self.api_key, prompt, speculative=True
+        )
+        # Connected up front so nothing is missed if Enhance adopts it; the
+        # handlers ignore it until then
+        self.speculative_enhancer.token.connect(self.on_enhance_token)
+        self.speculative_enhancer.finished.connect(self.on_prompt_enhanced)
+        self.speculative_enhancer.error.connect(self.on_prompt_enhancement_error)
+        self.speculative_enhancer.cancelled.connect(
+            self.on_prompt_enhancement_cancelled
+        )
+        self.speculative_enhancer.start()
+
+    def on_enhancement_writing(self):
+        # The text itself shows progress from here on
+        if not (self.worker and self.worker.isRunning()):
+            self.progress_bar.setVisible(False)
+        first_token = self.prompt_enhancer.trace.spans.get("first_token")
+        if first_token is not None:
+            self.statusBar().showMessage(
+                f"Enhancing prompt... first words after {first_token:.2f}s"
+            )
+
+    def on_enhance_token(self, index, piece):
+        if self.sender() is not self.prompt_enhancer:
+            return  # From a cancelled or background enhancement
+        if index < self.enhance_shown:
+            return  # Shown when the background enhancement was adopted
+        if index == 0:
+            self.on_enhancement_writing()
+        cursor = self.enhanced_prompt_input.textCursor()
+        cursor.movePosition(cursor.End)
+        cursor.insertText(piece)
+        self.enhanced_prompt_input.setTextCursor(cursor)
+
     def on_prompt_enhanced(self, enhanced_prompt):
+        if self.sender() is not self.prompt_enhancer:
+            return
         self.enhance_btn.setEnabled(True)
-        self.progress_bar.setVisible(False)
+        if not (self.worker and self.worker.isRunning()):
+            self.progress_bar.setVisible(False)
         self.enhanced_prompt_input.setPlainText(enhanced_prompt)
-        self.statusBar().showMessage("Prompt enhanced successfully")
+        first_token = self.prompt_enhancer.trace.spans.get("first_token")
+        if first_token is None:
+            self.statusBar().showMessage("Prompt enhanced successfully")
+        else:
+            self.statusBar().showMessage(
+                f"Prompt enhanced successfully (first words after "
+                f"{first_token:.2f}s, done after "
+                f"{self.prompt_enhancer.trace.spans['total']:.2f}s)"
+            )
         # QMessageBox.information(
         #     self, "Success", "Prompt enhanced successfully! You can edit it if needed."
         # )
 
+    def on_prompt_enhancement_cancelled(self):
+        if self.sender() is self.prompt_enhancer:
+            self.prompt_enhancer = None
+
     def on_prompt_enhancement_error(self, error_message):
+        if self.sender() is not self.prompt_enhancer:
+            return
         self.enhance_btn.setEnabled(True)
         self.progress_bar.setVisible(False)
         self.statusBar().showMessage("Prompt enhancement failed")
@@ -798,30 +2576,190 @@ class ImageGeneratorApp(QMainWindow):
             )
             return
 
-        self.generate_btn.setEnabled(False)
-        self.download_btn.setEnabled(False)
-        self.enhance_btn.setEnabled(False)
-        self.progress_bar.setVisible(True)
-        self.progress_bar.setRange(0, 0)
-        self.image_label.setText("Generating image...")
-        self.statusBar().showMessage("Generating image...")
+        count = self.count_spin.value()
+        sweep = self.sweep_spin.value()
+        seed = None
+        if self.preview_checkbox.isChecked() or sweep > 1:
+            # A preview fixes the seed so the full render matches its prompt
+            # interpretation as closely as the model allows; a sweep needs
+            # a first seed to count up from
+            seed = random.randint(0, 2**31 - MAX_SWEEP_SEEDS)
+        if not enhanced_prompt:
+            original_prompt = None  # Only kept when it differs from `prompt`
+        if is_template(prompt):
+            # Each click renders one random combination of the template;
+            # history keeps the template as the original prompt
+            try:
+                template = PromptTemplate(prompt)
+            except TemplateError as e:
+                QMessageBox.warning(self, "Warning", f"Invalid prompt template: {e}")
+                return
+            original_prompt = original_prompt or prompt
+            prompt = template.random_prompt()
+            print(f"Template expanded to: {prompt}")
+        if self.preview_checkbox.isChecked():
+            self.pending_full_render = (
+                prompt,
+                width,
+                height,
+                seed,
+                count,
+                sweep,
+                original_prompt,
+            )
+            preview_width, preview_height = preview_size(width, height)
+            self.start_generation(
+                prompt,
+                preview_width,
+                preview_height,
+                seed,
+                PREVIEW_STEPS,
+                count,
+                sweep,
+                original_prompt,
+            )
+        else:
+            self.pending_full_render = None
+            self.start_generation(
+                prompt,
+                width,
+                height,
+                seed,
+                count=count,
+                sweep=sweep,
+                original_prompt=original_prompt,
+            )
+
+    def render_full_size(self):
+        if not self.pending_full_render or not self.check_api_key():
+            return
+        prompt, width, height, seed, count, sweep, original_prompt = (
+            self.pending_full_render
+        )
+        self.pending_full_render = None
+        self.start_generation(
+            prompt,
+            width,
+            height,
+            seed,
+            count=count,
+            sweep=sweep,
+            original_prompt=original_prompt,
+        )
 
-        self.worker = APIWorker(self.api_key, prompt, width, height)
+    def start_generation(
+        self,
+        prompt,
+        width,
+        height,
+        seed=None,
+        steps=DEFAULT_NUM_INFERENCE_STEPS,
+        count=1,
+        sweep=1,
+        original_prompt=None,
+    ):
+        self.is_preview = steps != DEFAULT_NUM_INFERENCE_STEPS
+        self.set_generating(True)
+        label = "preview" if self.is_preview else "image"
+        if count * sweep > 1:
+            label = f"{count * sweep} {label}s"
+        self.image_label.setText(f"Generating {label}...")
+        self.statusBar().showMessage(f"Generating {label} ({width}x{height})...")
+
+        self.generation_started = time.monotonic()
+        # Seeds are requested in parallel, so only images per request add up
+        self.generation_estimate = get_estimator().estimate(width, height, steps, count)
+        self.update_generation_progress()
+        self.progress_timer.start()
+
+        postprocess = None
+        if not self.is_preview:
+            postprocess = PostProcess(
+                self.upscale_combo.currentData(),
+                1.0 if self.sharpen_checkbox.isChecked() else 0.0,
+            )
+        self.worker = APIWorker(
+            self.api_key,
+            prompt,
+            width,
+            height,
+            seed,
+            steps,
+            count,
+            sweep,
+            original_prompt,
+            postprocess,
+        )
         self.worker.finished.connect(self.on_generation_finished)
         self.worker.error.connect(self.on_generation_error)
+        self.worker.cancelled.connect(self.on_generation_cancelled)
         self.worker.start()
 
-    def on_generation_finished(self, status_code, response_text, image_data):
-        self.generate_btn.setEnabled(True)
-        self.enhance_btn.setEnabled(True)
-        self.progress_bar.setVisible(False)
-
-        if image_data and self.image_label.setImageFromData(image_data):
-            self.current_image_data = image_data
+    def set_generating(self, generating):
+        self.generate_btn.setEnabled(not generating)
+        self.enhance_btn.setEnabled(not generating)
+        self.render_full_btn.setVisible(
+            not generating and self.pending_full_render is not None
+        )
+        if generating:
+            self.download_btn.setEnabled(False)
+            self.cancel_btn.setEnabled(True)
+            self.progress_bar.setRange(0, 100)
+        else:
+            self.progress_timer.stop()
+        self.progress_bar.setVisible(generating)
+        self.cancel_btn.setVisible(generating)
+
+    def update_generation_progress(self):
+        elapsed = time.monotonic() - self.generation_started
+        estimate = max(self.generation_estimate, 1.0)
+        # Never show 100% until the image has actually arrived
+        self.progress_bar.setValue(min(99, int(elapsed / estimate * 100)))
+        self.progress_bar.setFormat(format_progress(elapsed, estimate))
+
+    def cancel_generation(self):
+        if self.worker and self.worker.isRunning():
+            self.cancel_btn.setEnabled(False)
+            self.statusBar().showMessage("Cancelling...")
+            self.worker.cancel()
+
+    def on_generation_cancelled(self):
+        self.worker.trace.finish(status="cancelled")
+        self.set_generating(False)
+        self.download_btn.setEnabled(self.current_image_data is not None)
+        if self.image_label.original_pixmap:
+            self.image_label.updateScaledPixmap()
+        else:
+            self.image_label.setText("Generated image will appear here")
+        self.statusBar().showMessage("Generation cancelled")
+
+    def on_generation_finished(self, status_code, response_text, results):
+        self.set_generating(False)
+
+        trace = self.worker.trace
+        with trace.span("display"):
+            displayed = bool(results) and self.image_label.setImage(results[0][2])
+            if displayed:
+                self.show_results(results)
+        trace.finish(status="ok" if displayed else "failed", status_code=status_code)
+        if displayed:
             self.download_btn.setEnabled(True)
-            self.statusBar().showMessage("Image generated successfully")
+            for entry in self.worker.history_entries:
+                self.on_history_entry_added(entry)
+            count = f"{len(results)} images" if len(results) > 1 else "Image"
+            if self.is_preview:
+                self.statusBar().showMessage(
+                    "Preview ready - click Render Full Size to render it at full quality"
+                )
+            elif response_text == CACHED_RESPONSE_TEXT:
+                self.statusBar().showMessage(f"{count} loaded from cache")
+            else:
+                self.statusBar().showMessage(f"{count} generated successfully")
             # QMessageBox.information(self, "Success", "Image generated successfully")
         else:
+            self.pending_full_render = None
+            self.render_full_btn.setVisible(False)
+            self.result_grid.setVisible(False)
             self.image_label.setText("Failed to generate image")
             self.statusBar().showMessage("Image generation failed")
             try:
@@ -841,10 +2779,32 @@ class ImageGeneratorApp(QMainWindow):
                     f"Request failed with status {status_code}: {response_text}",
                 )
 
+    def show_results(self, results):
+        # Fills the results grid; the first image is already on screen
+        self.results = results
+        self.current_image_data = results[0][1]
+        self.result_grid.blockSignals(True)
+        self.result_grid.clear()
+        if len(results) > 1:
+            for index, (seed, _, _, thumbnail) in enumerate(results):
+                item = QListWidgetItem(QIcon(QPixmap.fromImage(thumbnail)), "")
+                item.setToolTip(f"Image {index + 1}, seed {seed}")
+                self.result_grid.addItem(item)
+            self.result_grid.setCurrentRow(0)
+        self.result_grid.blockSignals(False)
+        self.result_grid.setVisible(len(results) > 1)
+
+    def show_result(self, row):
+        if 0 <= row < len(self.results):
+            _, image_data, image, _ = self.results[row]
+            if self.image_label.setImage(image):
+                self.current_image_data = image_data
+
     def on_generation_error(self, error_message):
-        self.generate_btn.setEnabled(True)
-        self.enhance_btn.setEnabled(True)
-        self.progress_bar.setVisible(False)
+        self.worker.trace.finish(status="failed")
+        self.pending_full_render = None
+        self.set_generating(False)
+        self.result_grid.setVisible(False)
         self.image_label.setText("Error occurred during generation")
         self.statusBar().showMessage("Generation failed")
         QMessageBox.critical(
@@ -863,23 +2823,64 @@ class ImageGeneratorApp(QMainWindow):
         default_filename = f"ai_image_{timestamp}_{random_str}.png"
         downloads_path = str(Path.home() / "Downloads")
 
-        filename, _ = QFileDialog.getSaveFileName(
+        filters = export_file_filters()
+        filename, selected_filter = QFileDialog.getSaveFileName(
             self,
             "Save Image",
             os.path.join(downloads_path, default_filename),
-            "PNG files (*.png);;JPEG files (*.jpg);;All files (*.*)",
+            ";;".join(filters),
         )
 
         if filename:
-            try:
-                with open(filename, "wb") as f:
-                    f.write(self.current_image_data)
-                self.statusBar().showMessage(f"Image saved to {filename}")
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Failed to save image: {e}")
+            # A typed extension wins over the filter, so "x.jpg" is a JPEG
+            fmt = format_for_path(filename, filters.get(selected_filter, "png"))
+            filename = with_extension(filename, fmt)
+            self.statusBar().showMessage(f"Saving {filename}...")
+            self.save_pool.start(
+                SaveImageTask(
+                    self.current_image_data,
+                    filename,
+                    fmt,
+                    export_options(),
+                    self.save_signals,
+                )
+            )
+
+    def on_image_saved(self, filename):
+        self.statusBar().showMessage(f"Image saved to {filename}")
+
+    def on_image_save_failed(self, error_message):
+        self.statusBar().showMessage("Saving failed")
+        QMessageBox.critical(self, "Error", f"Failed to save image: {error_message}")
+
+    def closeEvent(self, event):
+        # Abort an in-flight request so its thread can finish before exit
+        if self.worker and self.worker.isRunning():
+            self.worker.cancel()
+            self.worker.wait()
+        if self.startup_loader is not None:
+            self.startup_loader.wait()
+        self.speculation_timer.stop()
+        enhancers = self.retired_enhancers + [
+            self.prompt_enhancer,
+            self.speculative_enhancer,
+        ]
+        for enhancer in enhancers:
+            if enhancer is not None:
+                enhancer.cancel()
+                enhancer.wait()
+        if self.history_dialog is not None:
+            self.history_dialog.model.shutdown()
+        self.save_pool.waitForDone()  # Let pending saves reach the disk
+        super().closeEvent(event)
 
 
 def main():
+    import multiprocessing
+
+    # In the frozen app the post-processing pool's spawned workers start
+    # this executable; this runs their task instead of another window
+    multiprocessing.freeze_support()
 
     app = QApplication(sys.argv)
     # Force light palette for consistent appearance, so it doesnt default to dark mode
@@ -0,0 +1,18 @@
+# Qt-free building blocks shared by the GUI and headless tools. The public
+# helpers below are loaded on first access so `import imagegen` stays cheap.
+
+_LAZY_EXPORTS = {
+    "generate_image": "imagegen.client",
+    "generate_images": "imagegen.client",
+    "generate_seed_sweep": "imagegen.client",
+    "enhance_prompt": "imagegen.enhance",
+    "BatchQueue": "imagegen.batch",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_EXPORTS:
+        import importlib
+
+        return getattr(importlib.import_module(_LAZY_EXPORTS[name]), name)
+    raise AttributeError(f"module 'imagegen' has no attribute {name!r}")
@@ -0,0 +1,6 @@
+import sys
+
+from imagegen.cli import main
+
+
+sys.exit(main())
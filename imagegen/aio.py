@@ -0,0 +1,450 @@
+import asyncio
+import threading
+import time
+
+from imagegen.batch import BatchQueue
+from imagegen.cache import get_cache
+from imagegen.client import (
+    CACHED_RESPONSE_TEXT,
+    DEFAULT_NUM_INFERENCE_STEPS,
+    build_headers,
+    find_image_url,
+    finish_image_stream,
+    is_image_content,
+)
+from imagegen.enhance import build_messages, get_memo
+from imagegen.providers import get_provider
+from imagegen.retry import SAFE, UNSAFE, get_retry_policy, parse_retry_after
+from imagegen.session import get_timeout
+from imagegen.stream import STREAM_CHUNK_SIZE, log_preview
+from imagegen.timing import get_estimator
+from imagegen.trace import current_trace, timed_achunks, tracing
+
+
+DEFAULT_MAX_CONCURRENCY = 32
+DEFAULT_RATE_LIMIT_RETRIES = 5
+
+
+def classify_httpx_failure(error):
+    # SAFE when the request cannot have reached the server, UNSAFE when it
+    # may have been processed, None for errors a retry will not fix
+    import httpx
+
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return SAFE
+    if isinstance(error, httpx.TransportError):
+        return UNSAFE
+    return None
+
+
+# httpcore trace steps recorded as spans
+HTTPCORE_SPANS = {"connect_tcp": "connect", "start_tls": "tls"}
+
+
+def httpcore_trace_extension(trace):
+    # Callback for httpx's "trace" request extension. httpcore reports
+    # events such as "connection.connect_tcp.started"; pairs of started and
+    # complete events become spans on `trace`.
+    marks = {}
+
+    async def on_event(event_name, info):
+        now = time.perf_counter()
+        step, phase = event_name.split(".")[-2:]
+        if phase == "started":
+            marks[step] = now
+        elif phase == "complete":
+            if step in HTTPCORE_SPANS and step in marks:
+                trace.add(HTTPCORE_SPANS[step], now - marks[step])
+            elif step == "receive_response_headers" and "send_request_headers" in marks:
+                trace.add("ttfb", now - marks["send_request_headers"])
+
+    return on_event
+
+
+class TokenBucket:
+    # Classic token bucket: `rate` tokens per second, bursts up to `capacity`
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AsyncEngine:
+    # Drives the images/generations and chat/completions endpoints from one
+    # asyncio loop. Concurrency is capped by a semaphore, an optional token
+    # bucket spaces requests out, and a 429 pauses every request until the
+    # server's Retry-After has passed.
+
+    def __init__(
+        self,
+        api_key,
+        max_concurrency=DEFAULT_MAX_CONCURRENCY,
+        requests_per_second=None,
+        burst=None,
+        max_rate_limit_retries=DEFAULT_RATE_LIMIT_RETRIES,
+        provider=None,
+    ):
+        # `provider` defaults to the configured one
+        self.api_key = api_key
+        self.provider = provider or get_provider()
+        self.base_url = self.provider.base_url
+        self.max_concurrency = max_concurrency
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.bucket = (
+            TokenBucket(requests_per_second, burst) if requests_per_second else None
+        )
+        self.stats = {"requests": 0, "rate_limited": 0, "in_flight": 0, "coalesced": 0}
+        self._generations = {}  # cache key -> [task, waiter count]
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._resume_at = 0.0
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            import httpx
+
+            connect_timeout, read_timeout = get_timeout()
+            # No default headers: the key is only sent to the API (see
+            # request()), never to hosts that serve linked images
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+            )
+        return self._client
+
+    async def _wait_for_rate_limit(self):
+        while True:
+            delay = self._resume_at - time.monotonic()
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        if self.bucket:
+            await self.bucket.acquire()
+
+    async def request(
+        self, method, url, stream=False, idempotent=None, authorized=True, **kwargs
+    ):
+        # With stream=True the caller must close the response. 429s pause
+        # every request; other transient failures are retried per the shared
+        # RetryPolicy, which only repeats idempotent requests (GETs unless
+        # told otherwise) once they may have reached the server. Only
+        # `authorized` requests carry the API key.
+        client = self._get_client()
+        if authorized:
+            kwargs["headers"] = build_headers(self.api_key)
+        policy = get_retry_policy()
+        if idempotent is None:
+            idempotent = method == "GET"
+        trace = current_trace()
+        if trace is not None:
+            kwargs["extensions"] = {"trace": httpcore_trace_extension(trace)}
+        rate_limited = 0
+        attempt = 1
+        while True:
+            await self._wait_for_rate_limit()
+            async with self._semaphore:
+                self.stats["requests"] += 1
+                self.stats["in_flight"] += 1
+                try:
+                    response = await client.send(
+                        client.build_request(method, url, **kwargs), stream=stream
+                    )
+                except Exception as e:
+                    kind = classify_httpx_failure(e)
+                    if not policy.should_retry_failure(kind, attempt, idempotent):
+                        raise
+                    response = None
+                    error = e
+                finally:
+                    self.stats["in_flight"] -= 1
+
+            if response is None:
+                delay = policy.delay(attempt)
+                print(f"Request failed ({error!r}), retrying in {delay:.1f}s")
+            elif response.status_code == 429:
+                if rate_limited == self.max_rate_limit_retries:
+                    return response
+                rate_limited += 1
+                self.stats["rate_limited"] += 1
+                delay = parse_retry_after(response.headers.get("retry-after"))
+                print(f"Rate limited, pausing requests for {delay:.1f}s")
+                self._resume_at = max(self._resume_at, time.monotonic() + delay)
+                delay = 0.0  # _wait_for_rate_limit does the waiting
+            elif policy.should_retry_status(response.status_code, attempt, idempotent):
+                delay = policy.delay(
+                    attempt,
+                    parse_retry_after(response.headers.get("retry-after"), None),
+                )
+                print(f"API returned {response.status_code}, retrying in {delay:.1f}s")
+            else:
+                return response
+
+            if response is not None and stream:
+                await response.aclose()
+            if response is None or response.status_code != 429:
+                attempt += 1
+                policy.count("retries")
+            await asyncio.sleep(delay)
+
+    async def generate(
+        self,
+        prompt,
+        width=1024,
+        height=1024,
+        seed=None,
+        use_cache=True,
+        steps=DEFAULT_NUM_INFERENCE_STEPS,
+    ):
+        # Same contract as imagegen.client.generate_image; cancel the task
+        # to abort the request
+        payload = self.provider.build_payload(prompt, width, height, seed, steps)
+        # Only a seed makes the result repeatable, so only then is it cached
+        cache = get_cache() if use_cache and seed is not None else None
+        key = self.provider.cache_key(payload)
+        if cache is not None:
+            cached = await asyncio.to_thread(cache.get, key)
+            if cached is not None:
+                trace = current_trace()
+                if trace is not None:
+                    trace.attrs["cached"] = True
+                return 200, CACHED_RESPONSE_TEXT, cached
+        if seed is None:
+            # Each caller expects an image of its own
+            return await self._generate_and_store(
+                payload, key, cache, width, height, steps
+            )
+
+        # Identical requests in flight share one task; the engine's key and
+        # provider are the same for all of them. It is only cancelled once
+        # every caller waiting on it has been.
+        flight = self._generations.get(key)
+        if flight is None:
+            flight = [
+                asyncio.ensure_future(
+                    self._generate_and_store(payload, key, cache, width, height, steps)
+                ),
+                0,
+            ]
+            self._generations[key] = flight
+            flight[0].add_done_callback(lambda _: self._forget_generation(key, flight))
+        else:
+            self.stats["coalesced"] += 1
+            trace = current_trace()
+            if trace is not None:
+                trace.attrs["coalesced"] = True
+        flight[1] += 1
+        try:
+            return await asyncio.shield(flight[0])
+        except asyncio.CancelledError:
+            flight[1] -= 1
+            if flight[1] == 0:
+                self._forget_generation(key, flight)  # Later callers start anew
+                flight[0].cancel()
+            raise
+
+    def _forget_generation(self, key, flight):
+        if self._generations.get(key) is flight:
+            del self._generations[key]
+
+    async def _generate_and_store(self, payload, key, cache, width, height, steps):
+        started = time.monotonic()
+        status_code, response_text, image_data = await self._generate(payload)
+        if image_data:
+            get_estimator().observe(width, height, steps, time.monotonic() - started)
+        if cache is not None and image_data:
+            await asyncio.to_thread(cache.put, key, image_data)
+        return status_code, response_text, image_data
+
+    async def _generate(self, payload):
+        # Generating creates nothing server-side, so repeating it is safe
+        response = await self.request(
+            "POST",
+            self.provider.image_url,
+            stream=True,
+            idempotent=True,
+            json=payload,
+        )
+        try:
+            if response.status_code != 200:
+                await response.aread()
+                print(
+                    f"API request failed with status {response.status_code}: "
+                    f"{log_preview(response.text)}"
+                )
+                return response.status_code, response.text, None
+
+            chunks = timed_achunks(response.aiter_bytes(STREAM_CHUNK_SIZE))
+            if is_image_content(response.headers):
+                return response.status_code, "", b"".join([c async for c in chunks])
+            parser = self.provider.new_parser()
+            async for chunk in chunks:
+                parser.feed(chunk)
+        finally:
+            await response.aclose()
+
+        images, response_json, summary_text = finish_image_stream(parser)
+        if images:
+            return response.status_code, summary_text, images[0]
+        image_url = find_image_url(response_json) if response_json else None
+        image_data = None
+        if image_url:
+            # The URL may point anywhere, so it gets no credentials
+            image_response = await self.request("GET", image_url, authorized=False)
+            if image_response.status_code == 200:
+                image_data = image_response.content
+            else:
+                print(
+                    "Failed to download image from URL: "
+                    f"{image_response.status_code}"
+                )
+        else:
+            print("No valid image data found in response")
+        return response.status_code, summary_text, image_data
+
+    async def enhance(self, original_prompt, use_memo=True):
+        memo = get_memo() if use_memo else None
+        if memo is not None:
+            variants = await asyncio.to_thread(memo.variants, original_prompt)
+            if variants:
+                memo.stats["hits"] += 1
+                return variants[0]
+            memo.stats["misses"] += 1
+
+        response = await self.request(
+            "POST",
+            f"{self.base_url}/chat/completions",
+            json={
+                "model": self.provider.enhance_model,
+                "messages": build_messages(original_prompt),
+            },
+        )
+        response.raise_for_status()
+        enhanced = response.json()["choices"][0]["message"]["content"].strip()
+        if memo is not None:
+            await asyncio.to_thread(memo.add, original_prompt, [enhanced])
+        return enhanced
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class EventLoopThread:
+    # Runs an asyncio loop on a daemon thread so synchronous code, including
+    # the Qt GUI thread, can hand it coroutines and get back
+    # concurrent.futures.Future objects. Cancelling such a future cancels the
+    # task, which closes its connection.
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name="asyncio-engine", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call(self, func, *args):
+        # Runs a plain callable on the loop thread and waits for its result
+        async def runner():
+            return func(*args)
+
+        return self.submit(runner()).result()
+
+
+_loop_thread = None
+_loop_lock = threading.Lock()
+
+
+def get_loop_thread():
+    global _loop_thread
+    with _loop_lock:
+        if _loop_thread is None:
+            _loop_thread = EventLoopThread()
+        return _loop_thread
+
+
+class AsyncBatchQueue(BatchQueue):
+    # BatchQueue driven by an AsyncEngine on the shared loop thread instead
+    # of one OS thread per in-flight request. Cancelling a running job
+    # aborts its request.
+
+    def __init__(
+        self,
+        api_key,
+        output_dir,
+        max_in_flight=DEFAULT_MAX_CONCURRENCY,
+        on_update=None,
+        requests_per_second=None,
+        history=None,
+        postprocess=None,
+        journal=None,
+    ):
+        self.requests_per_second = requests_per_second
+        super().__init__(
+            api_key, output_dir, max_in_flight, on_update, history, postprocess, journal
+        )
+
+    def _start(self):
+        self._loop_thread = get_loop_thread()
+        # Build the engine on the loop thread so its primitives bind there
+        self.engine = self._loop_thread.call(
+            AsyncEngine,
+            self.api_key,
+            self.max_in_flight,
+            self.requests_per_second,
+        )
+
+    def _schedule(self, job):
+        return self._loop_thread.submit(self._run_async(job))
+
+    def _stop(self, cancel_pending):
+        self._loop_thread.submit(self._close_when_idle())
+
+    async def _close_when_idle(self):
+        while any(not future.done() for future in list(self._futures.values())):
+            await asyncio.sleep(0.1)
+        await self.engine.aclose()
+
+    async def _run_async(self, job):
+        if not self._begin(job):
+            return
+        try:
+            with tracing(job.trace):
+                status_code, response_text, image_data = await self.engine.generate(
+                    job.prompt, job.width, job.height, job.seed, steps=job.steps
+                )
+        except asyncio.CancelledError:
+            job.finished_at = time.monotonic()
+            job.trace.finish(status="cancelled")
+            raise
+        except Exception as e:
+            print(f"Batch job {job.job_id} error: {e}")
+            # Finishing writes the journal and runs callbacks, which must not
+            # stall the loop that every other job shares
+            await asyncio.to_thread(self._finish, job, None, "", None, error=str(e))
+            return
+        await asyncio.to_thread(
+            self._finish, job, status_code, response_text, image_data
+        )
@@ -0,0 +1,429 @@
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from imagegen.client import (
+    CACHED_RESPONSE_TEXT,
+    DEFAULT_NUM_INFERENCE_STEPS,
+    generate_image,
+)
+from imagegen.history import FAILED as HISTORY_FAILED
+from imagegen.providers import get_provider
+from imagegen.session import CancelToken, Cancelled, ensure_pool_size
+from imagegen.timing import get_estimator
+from imagegen.trace import Trace, tracing
+
+
+# Job states
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+# Finished jobs a queue keeps for inspection; older ones are only counted,
+# so a queue fed millions of jobs holds a bounded number of them
+DEFAULT_KEEP_FINISHED = 1000
+
+
+def parse_seeds(text):
+    # "1, 5-8" -> [1, 5, 6, 7, 8]; an empty string means one random seed
+    seeds = []
+    for part in text.replace(" ", "").split(","):
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            seeds.extend(range(int(start), int(end) + 1))
+        else:
+            seeds.append(int(part))
+    return seeds or [None]
+
+
+def build_matrix(prompts, sizes, seeds=(None,)):
+    # Yields (prompt, width, height, seed) for every combination
+    for prompt, (width, height), seed in itertools.product(prompts, sizes, seeds):
+        yield prompt, width, height, seed
+
+
+class BatchJob:
+    def __init__(
+        self,
+        job_id,
+        prompt,
+        width,
+        height,
+        seed=None,
+        steps=DEFAULT_NUM_INFERENCE_STEPS,
+        key=None,
+        number=None,
+    ):
+        self.job_id = job_id
+        # Names the output file; the manifest row number for manifest jobs,
+        # so a resumed run never overwrites the files of an earlier one
+        self.number = job_id if number is None else number
+        self.prompt = prompt
+        self.width = width
+        self.height = height
+        self.seed = seed
+        self.steps = steps
+        self.key = key  # Checkpoint journal key, for manifest jobs
+        self.status = PENDING
+        self.status_code = None
+        self.error = None
+        self.output_path = None
+        self.history_entry = None
+        self.trace = None
+        self.started_at = None
+        self.finished_at = None
+        self.estimate = get_estimator().estimate(width, height, steps)
+        self.cancel_token = CancelToken()
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def remaining(self):
+        # Estimated seconds left while running, None otherwise
+        if self.status != RUNNING:
+            return None
+        return max(0.0, self.estimate - self.elapsed)
+
+    def filename(self, extension=".png"):
+        seed = "random" if self.seed is None else self.seed
+        return f"{self.number:05d}_{self.width}x{self.height}_seed{seed}{extension}"
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "prompt": self.prompt,
+            "width": self.width,
+            "height": self.height,
+            "seed": self.seed,
+            "steps": self.steps,
+            "status": self.status,
+            "status_code": self.status_code,
+            "error": self.error,
+            "output_path": self.output_path,
+            "elapsed": self.elapsed,
+        }
+
+
+def _was_coalesced(job):
+    return bool(job.trace and job.trace.attrs.get("coalesced"))
+
+
+class BatchQueue:
+    # Runs generation jobs on a bounded thread pool so that at most
+    # `max_in_flight` requests are outstanding at any time. Each finished
+    # image is written to `output_dir` immediately and recorded in
+    # results.jsonl there, and also added to `history` (a HistoryStore) when
+    # one is given. A `postprocess` (imagegen.postprocess.PostProcess) is
+    # applied before saving; history keeps the image as generated. Jobs
+    # with a key are also recorded in `journal` (an
+    # imagegen.manifest.CheckpointJournal) once saved. `jobs` maps job ids
+    # to the unfinished jobs and the last `keep_finished` finished ones.
+    # Subclasses can swap the execution strategy by overriding _start,
+    # _schedule and _stop.
+
+    def __init__(
+        self,
+        api_key,
+        output_dir,
+        max_in_flight=4,
+        on_update=None,
+        history=None,
+        postprocess=None,
+        journal=None,
+        keep_finished=DEFAULT_KEEP_FINISHED,
+    ):
+        self.api_key = api_key
+        self.output_dir = output_dir
+        self.max_in_flight = max_in_flight
+        self.on_update = on_update
+        self.history = history
+        self.postprocess = postprocess
+        self.journal = journal
+        self.keep_finished = keep_finished
+        self.jobs = {}
+        self.closed = False
+        self._next_id = 0
+        self._futures = {}  # Of unfinished jobs only
+        self._finished_ids = deque()  # Oldest first
+        # Statuses and coalesced count of finished jobs no longer in `jobs`
+        self._dropped = {DONE: 0, FAILED: 0, CANCELLED: 0}
+        self._dropped_coalesced = 0
+        self._lock = threading.Lock()
+        # Signalled whenever a job finishes, for wait_for_capacity()
+        self._job_ended = threading.Condition(self._lock)
+        self._unfinished = 0
+        os.makedirs(output_dir, exist_ok=True)
+        self._start()
+
+    def _start(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_in_flight, thread_name_prefix="batch"
+        )
+        ensure_pool_size(self.max_in_flight)
+
+    def _schedule(self, job):
+        # Must return a concurrent.futures.Future for the job
+        return self._executor.submit(self._run, job)
+
+    def _stop(self, cancel_pending):
+        self._executor.shutdown(wait=False, cancel_futures=cancel_pending)
+
+    def submit(
+        self,
+        prompt,
+        width,
+        height,
+        seed=None,
+        steps=DEFAULT_NUM_INFERENCE_STEPS,
+        key=None,
+        number=None,
+    ):
+        # Returns the new BatchJob, or None once the queue is shut down
+        with self._lock:
+            if self.closed:
+                return None
+            job = BatchJob(
+                self._next_id, prompt, width, height, seed, steps, key, number
+            )
+            self._next_id += 1
+            self.jobs[job.job_id] = job
+            self._unfinished += 1
+            future = self._futures[job.job_id] = self._schedule(job)
+        # Outside the lock: an already finished future calls back at once
+        future.add_done_callback(lambda _: self._forget_future(job.job_id))
+        self._notify(job)
+        return job
+
+    def _forget_future(self, job_id):
+        with self._lock:
+            self._futures.pop(job_id, None)
+
+    def submit_matrix(self, prompts, sizes, seeds=(None,)):
+        return [self.submit(*combo) for combo in build_matrix(prompts, sizes, seeds)]
+
+    def submit_all(self, jobs, window=None):
+        # Submits every tuple of submit() arguments from `jobs`, which may be
+        # a generator of any length: at most `window` (default twice the
+        # concurrency) jobs wait in the queue at once, so it is consumed as
+        # the queue drains rather than up front. Returns how many were
+        # submitted; stops early if the queue is shut down.
+        window = window or 2 * self.max_in_flight
+        submitted = 0
+        for args in jobs:
+            if not self.wait_for_capacity(window) or self.submit(*args) is None:
+                break
+            submitted += 1
+        return submitted
+
+    def cancel(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status not in (PENDING, RUNNING):
+                return False
+            job.status = CANCELLED
+            future = self._futures.get(job_id)
+        # Pending jobs never start and running ones have their connection
+        # aborted; any late result is discarded. Outside the lock, as
+        # cancelling a future runs its callbacks.
+        if future is not None:
+            future.cancel()
+        job.cancel_token.cancel()
+        self._notify(job)
+        return True
+
+    def cancel_all(self):
+        for job in self.current_jobs():
+            if job.status in (PENDING, RUNNING):
+                self.cancel(job.job_id)
+
+    def current_jobs(self):
+        # The jobs still kept, in the order they were submitted
+        with self._lock:
+            return list(self.jobs.values())
+
+    def counts(self):
+        # Of every job submitted, including those no longer kept
+        with self._lock:
+            counts = {PENDING: 0, RUNNING: 0, **self._dropped}
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            counts[job.status] += 1
+        return counts
+
+    def coalesced(self):
+        # Jobs that shared an identical job's request instead of sending one
+        with self._lock:
+            coalesced = self._dropped_coalesced
+            jobs = list(self.jobs.values())
+        return coalesced + sum(1 for job in jobs if _was_coalesced(job))
+
+    def wait(self):
+        with self._lock:
+            futures = list(self._futures.values())
+        wait(futures)
+
+    def wait_for_capacity(self, limit):
+        # Blocks until fewer than `limit` jobs are pending or running, so a
+        # producer can feed a long stream of jobs without queueing them all.
+        # False if the queue was shut down meanwhile.
+        with self._job_ended:
+            while self._unfinished >= limit and not self.closed:
+                self._job_ended.wait()
+            return not self.closed
+
+    def shutdown(self, cancel_pending=True):
+        with self._job_ended:
+            self.closed = True
+            self._job_ended.notify_all()
+        if cancel_pending:
+            self.cancel_all()
+        self._stop(cancel_pending)
+
+    def _notify(self, job):
+        if job.status in FINISHED:
+            with self._job_ended:
+                self._unfinished -= 1
+                self._finished_ids.append(job.job_id)
+                while len(self._finished_ids) > self.keep_finished:
+                    dropped = self.jobs.pop(self._finished_ids.popleft())
+                    self._dropped[dropped.status] += 1
+                    self._dropped_coalesced += _was_coalesced(dropped)
+                self._job_ended.notify_all()
+        if self.on_update:
+            self.on_update(job)
+
+    def _set_status(self, job, status):
+        with self._lock:
+            if job.status == CANCELLED:
+                return False
+            job.status = status
+        self._notify(job)
+        return True
+
+    def _begin(self, job):
+        job.started_at = time.monotonic()
+        job.trace = Trace(
+            "batch",
+            job_id=job.job_id,
+            width=job.width,
+            height=job.height,
+            steps=job.steps,
+        )
+        return self._set_status(job, RUNNING)
+
+    def _discard_if_cancelled(self, job):
+        # True if the job was cancelled while its request was finishing; its
+        # result is then dropped without saving or recording anything
+        with self._lock:
+            if job.status != CANCELLED:
+                return False
+        job.finished_at = time.monotonic()
+        job.trace.finish(status="cancelled")
+        return True
+
+    def _finish(self, job, status_code, response_text, image_data, error=None):
+        if self._discard_if_cancelled(job):
+            return
+        job.status_code = status_code
+        if image_data:
+            output_data, extension = image_data, ".png"
+            if self.postprocess is not None and not self.postprocess.is_noop:
+                try:
+                    with job.trace.span("postprocess"):
+                        output_data = self.postprocess.apply(image_data)
+                    extension = self.postprocess.extension
+                except Exception as e:
+                    print(f"Post-processing failed, saving the original: {e}")
+                if self._discard_if_cancelled(job):
+                    return  # Cancelled during post-processing
+            path = os.path.join(self.output_dir, job.filename(extension))
+            try:
+                with job.trace.span("save"):
+                    with open(path + ".part", "wb") as f:
+                        f.write(output_data)
+                    os.replace(path + ".part", path)
+                job.output_path = path
+                status = DONE
+                if self.history is not None and response_text != CACHED_RESPONSE_TEXT:
+                    job.history_entry = self.history.add(
+                        image_data,
+                        job.prompt,
+                        job.width,
+                        job.height,
+                        job.seed,
+                        job.steps,
+                        get_provider().image_model,
+                        duration=job.trace.elapsed(),
+                        timings=job.trace.spans,
+                    )
+            except OSError as e:
+                job.error = f"Failed to save image: {e}"
+                status = FAILED
+        else:
+            job.error = error or f"HTTP {status_code}: {response_text[:200]}"
+            status = FAILED
+            if self.history is not None:
+                self.history.add(
+                    None,
+                    job.prompt,
+                    job.width,
+                    job.height,
+                    job.seed,
+                    job.steps,
+                    get_provider().image_model,
+                    duration=job.trace.elapsed(),
+                    timings=job.trace.spans,
+                    status=HISTORY_FAILED,
+                    error=job.error,
+                )
+        job.finished_at = time.monotonic()
+        job.trace.finish(status="ok" if status == DONE else "failed")
+        if status == DONE and job.key is not None and self.journal is not None:
+            # Before anyone hears the job is done, so a crash can at worst
+            # repeat it, never lose it
+            self.journal.record(job.key, job.output_path)
+        if self._set_status(job, status):
+            self._record(job)
+
+    def _run(self, job):
+        if not self._begin(job):
+            return
+        try:
+            with tracing(job.trace):
+                status_code, response_text, image_data = generate_image(
+                    self.api_key,
+                    job.prompt,
+                    job.width,
+                    job.height,
+                    job.seed,
+                    steps=job.steps,
+                    cancel_token=job.cancel_token,
+                )
+        except Cancelled:
+            job.finished_at = time.monotonic()
+            job.trace.finish(status="cancelled")
+            return
+        except Exception as e:
+            print(f"Batch job {job.job_id} error: {e}")
+            self._finish(job, None, "", None, error=str(e))
+            return
+        self._finish(job, status_code, response_text, image_data)
+
+    def _record(self, job):
+        line = json.dumps(job.to_dict()) + "\n"
+        with self._lock:
+            with open(os.path.join(self.output_dir, "results.jsonl"), "a") as f:
+                f.write(line)
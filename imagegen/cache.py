@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from imagegen.paths import DATA_DIR
+
+
+DEFAULT_CACHE_DIR = DATA_DIR / "cache"
+DEFAULT_MAX_BYTES = 2 * 1024**3
+
+# Generation parameters that decide what image comes back
+KEY_FIELDS = (
+    "model",
+    "prompt",
+    "width",
+    "height",
+    "num_inference_steps",
+    "negative_prompt",
+    "seed",
+)
+# Only hashed when present, so keys made before they existed stay valid:
+# "n" images per request, the "index" of one image among them, the "size"
+# string some providers use instead of width and height, and the
+# "provider" and "url" that keep non-default providers' results apart
+OPTIONAL_KEY_FIELDS = ("n", "index", "size", "provider", "url")
+
+
+def cache_key(payload):
+    # Stable hash of the generation parameters in an API payload
+    fields = {field: payload.get(field) for field in KEY_FIELDS}
+    fields.update(
+        {field: payload[field] for field in OPTIONAL_KEY_FIELDS if field in payload}
+    )
+    canonical = json.dumps(fields, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    # Content-addressed image cache on disk. Entries live at
+    # <root>/<key[:2]>/<key> and the least recently used ones are evicted once
+    # the total size exceeds max_bytes. Recency survives restarts through
+    # file modification times.
+
+    def __init__(
+        self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, enabled=True
+    ):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._entries = OrderedDict()  # key -> size, least recent first
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._load_index()
+
+    def _path(self, key):
+        return self.root / key[:2] / key
+
+    def _load_index(self):
+        entries = []
+        if self.root.is_dir():
+            for shard in self.root.iterdir():
+                if not shard.is_dir():
+                    continue
+                for path in shard.iterdir():
+                    if path.suffix == ".part":
+                        continue
+                    stat = path.stat()
+                    entries.append((stat.st_mtime, path.name, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    @property
+    def total_bytes(self):
+        return self._total_bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            known = key in self._entries
+        if known:
+            path = self._path(key)
+            try:
+                data = path.read_bytes()
+                os.utime(path)
+            except OSError:
+                self._forget(key)
+            else:
+                with self._lock:
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                return data
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, key, data):
+        if not self.enabled or len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            part = path.with_name(f"{key}.{threading.get_ident()}.part")
+            part.write_bytes(data)
+            os.replace(part, path)
+        except OSError as e:
+            print(f"Failed to write cache entry: {e}")
+            return
+        with self._lock:
+            self._total_bytes += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            evicted = self._evict_locked()
+        self._unlink(evicted)
+
+    def set_max_bytes(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            evicted = self._evict_locked()
+        self._unlink(evicted)
+
+    def _evict_locked(self):
+        evicted = []
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.stats["evictions"] += 1
+            evicted.append(key)
+        return evicted
+
+    def _forget(self, key):
+        with self._lock:
+            self._total_bytes -= self._entries.pop(key, 0)
+
+    def clear(self):
+        with self._lock:
+            keys = list(self._entries)
+            self._entries.clear()
+            self._total_bytes = 0
+        self._unlink(keys)
+
+    def _unlink(self, keys):
+        for key in keys:
+            try:
+                self._path(key).unlink()
+            except OSError:
+                pass
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def configure_cache(root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, enabled=True):
+    global _cache
+    with _cache_lock:
+        _cache = ResultCache(root, max_bytes, enabled)
+        return _cache
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+        return _cache
@@ -0,0 +1,546 @@
+import argparse
+import sys
+
+
+def read_prompts(path):
+    # One prompt per line; blank lines and "#" comments are skipped
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    with stream:
+        for line in stream:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+
+
+def parse_size(text):
+    try:
+        width, height = map(int, text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size {text!r}, expected WxH")
+    if not (64 <= width <= 2048 and 64 <= height <= 2048):
+        raise argparse.ArgumentTypeError(
+            "image size must be between 64x64 and 2048x2048"
+        )
+    return width, height
+
+
+def parse_shard(text):
+    from imagegen.template import parse_shard
+
+    try:
+        return parse_shard(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def expand_prompts(args, lines):
+    # Generator of the prompts that the template lines and options ask for
+    from imagegen.template import PromptTemplate
+
+    return PromptTemplate(lines, args.wildcards).expand(
+        limit=args.limit,
+        sample=args.sample,
+        shard=args.shard,
+        seed=args.sample_seed,
+        dedup=args.dedup,
+    )
+
+
+def on_enhance_error(prompt, error):
+    print(f"Enhancement failed, using original prompt: {error}", file=sys.stderr)
+    return prompt
+
+
+def enhance_all(api_key, prompts, concurrency, variants=1, batch_size=1):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from imagegen.enhance import enhance_many, enhance_variants
+
+    if variants == 1 and batch_size > 1:
+        enhanced = enhance_many(
+            api_key, prompts, batch_size, concurrency, on_error=on_enhance_error
+        )
+        return [[prompt] for prompt in enhanced]
+
+    def enhance_one(prompt):
+        try:
+            return enhance_variants(api_key, prompt, variants)
+        except Exception as e:
+            return [on_enhance_error(prompt, e)]
+
+    # Duplicate prompts share one lookup so they never race to the model
+    unique = list(dict.fromkeys(prompts))
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = dict(zip(unique, pool.map(enhance_one, unique)))
+    return [results[prompt] for prompt in prompts]
+
+
+def report_job(job):
+    from imagegen.batch import DONE, FAILED
+
+    if job.status == DONE:
+        print(f"[{job.number + 1}] saved {job.output_path}")
+    elif job.status == FAILED:
+        print(f"[{job.number + 1}] failed: {job.error}", file=sys.stderr)
+
+
+def make_queue(args, api_key, **options):
+    # BatchQueue or AsyncBatchQueue per --async, with the options shared by
+    # the generate and run commands; None (after printing why) on bad ones
+    from imagegen.batch import BatchQueue
+
+    postprocess = None
+    if args.upscale != 1 or args.sharpen or args.format != "png":
+        from imagegen.postprocess import PostProcess
+
+        try:
+            postprocess = PostProcess(args.upscale, args.sharpen, args.format)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return None
+
+    if args.use_async:
+        from imagegen.aio import AsyncBatchQueue
+
+        return AsyncBatchQueue(
+            api_key,
+            args.output,
+            max_in_flight=args.concurrency,
+            on_update=report_job,
+            requests_per_second=args.rate,
+            postprocess=postprocess,
+            **options,
+        )
+    return BatchQueue(
+        api_key,
+        args.output,
+        max_in_flight=args.concurrency,
+        on_update=report_job,
+        postprocess=postprocess,
+        **options,
+    )
+
+
+def interrupt_queue(queue):
+    print("Cancelling remaining jobs...", file=sys.stderr)
+    queue.shutdown()
+    return 130
+
+
+def finish_queue(queue):
+    # Waits for the queue's jobs and prints a summary; the exit status
+    from imagegen.batch import DONE, FAILED
+
+    try:
+        queue.wait()
+    except KeyboardInterrupt:
+        return interrupt_queue(queue)
+    queue.shutdown()
+    counts = queue.counts()
+    coalesced = queue.coalesced()
+    print(
+        f"{counts[DONE]} done, {counts[FAILED]} failed"
+        + (f", {coalesced} shared an identical request" if coalesced else ""),
+        file=sys.stderr,
+    )
+    return 1 if counts[FAILED] else 0
+
+
+def cmd_generate(args, api_key):
+    from imagegen.batch import build_matrix, parse_seeds
+    from imagegen.template import TemplateError
+
+    lines = list(read_prompts(args.prompt_file))
+    if not lines:
+        print("No prompts found", file=sys.stderr)
+        return 1
+    try:
+        prompts = expand_prompts(args, lines)
+    except TemplateError as e:
+        print(e, file=sys.stderr)
+        return 2
+    if args.enhance:
+        from imagegen.enhance import enhance_lazily
+
+        prompts = enhance_lazily(
+            api_key,
+            prompts,
+            args.enhance_batch,
+            args.concurrency,
+            on_error=on_enhance_error,
+        )
+
+    queue = make_queue(args, api_key)
+    if queue is None:
+        return 2
+    jobs = build_matrix(prompts, args.size or [(1024, 1024)], parse_seeds(args.seeds))
+    try:
+        queue.submit_all(jobs)
+    except KeyboardInterrupt:
+        return interrupt_queue(queue)
+    return finish_queue(queue)
+
+
+def cmd_expand(args, api_key):
+    from imagegen.template import PromptTemplate, TemplateError
+
+    lines = list(read_prompts(args.prompt_file))
+    try:
+        if args.count:
+            print(PromptTemplate(lines, args.wildcards).count)
+            return 0
+        for prompt in expand_prompts(args, lines):
+            print(prompt)
+    except TemplateError as e:
+        print(e, file=sys.stderr)
+        return 2
+    return 0
+
+
+def cmd_run(args, api_key):
+    import os
+
+    from imagegen.manifest import JOURNAL_NAME, CheckpointJournal, run_manifest
+
+    if not os.path.isfile(args.manifest):
+        print(f"No such manifest: {args.manifest}", file=sys.stderr)
+        return 1
+    os.makedirs(args.output, exist_ok=True)
+    journal = CheckpointJournal(os.path.join(args.output, JOURNAL_NAME))
+    if len(journal):
+        print(f"Resuming: {len(journal)} jobs already done", file=sys.stderr)
+    queue = make_queue(args, api_key, journal=journal)
+    if queue is None:
+        return 2
+    bad_rows = []
+
+    def on_error(error):
+        bad_rows.append(error)
+        print(f"Skipping {error}", file=sys.stderr)
+
+    try:
+        submitted, skipped = run_manifest(queue, args.manifest, on_error=on_error)
+    except KeyboardInterrupt:
+        status = interrupt_queue(queue)
+        journal.close()
+        return status
+    print(
+        f"{submitted} jobs submitted, {skipped} skipped as already done",
+        file=sys.stderr,
+    )
+    status = finish_queue(queue)
+    journal.close()
+    return status or (1 if bad_rows else 0)
+
+
+def cmd_enhance(args, api_key):
+    prompts = list(read_prompts(args.prompt_file))
+    for variants in enhance_all(
+        api_key, prompts, args.concurrency, args.variants, args.enhance_batch
+    ):
+        for enhanced in variants:
+            print(enhanced.replace("\n", " "))
+    return 0
+
+
+def cmd_stats(args, api_key):
+    from imagegen.trace import get_trace_log
+
+    log = get_trace_log()
+    rows = log.summary()
+    if not rows:
+        print(f"No timings recorded yet in {log.path}")
+        return 0
+    print(
+        f"Requests saved: {log.saved['cached']} cache hits, "
+        f"{log.saved['coalesced']} joined an identical request in flight"
+    )
+    print(
+        f"{'kind':<10}{'phase':<14}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    )
+    for kind, name, count, p50, p95, p99 in rows:
+        print(f"{kind:<10}{name:<14}{count:>7}{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}")
+    return 0
+
+
+def cmd_history(args, api_key):
+    import time
+
+    from imagegen.history import FAILED, OK, get_history
+
+    store = get_history()
+    since = time.time() - args.days * 86400 if args.days else None
+    entries = store.search(
+        " ".join(args.text),
+        args.limit,
+        since=since,
+        size=args.size,
+        status=FAILED if args.failed else OK,
+    )
+    for entry in entries:
+        created = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry.created_at))
+        where = entry.error if args.failed else store.image_path(entry)
+        print(
+            f"{entry.id:>7}  {created}  {entry.width}x{entry.height}  "
+            f"{entry.prompt.replace(chr(10), ' ')[:60]}  {where}"
+        )
+    return 0
+
+
+def add_queue_arguments(parser):
+    from imagegen.export import FORMATS
+
+    parser.add_argument("-o", "--output", default="output", help="output folder")
+    parser.add_argument(
+        "-j", "--concurrency", type=int, default=4, help="requests kept in flight"
+    )
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="drive requests from one asyncio loop instead of a thread pool",
+    )
+    parser.add_argument(
+        "--rate", type=float, help="with --async, maximum requests per second"
+    )
+    parser.add_argument(
+        "--upscale",
+        type=float,
+        default=1.0,
+        metavar="FACTOR",
+        help="enlarge results locally by FACTOR (1-4) with Lanczos before saving",
+    )
+    parser.add_argument(
+        "--sharpen",
+        type=float,
+        default=0.0,
+        metavar="AMOUNT",
+        help="unsharp mask strength before saving, e.g. 1",
+    )
+    parser.add_argument(
+        "--format",
+        default="png",
+        choices=list(FORMATS),
+        help="file format of saved results (default png)",
+    )
+
+
+def add_enhance_batch_argument(parser):
+    from imagegen.enhance import DEFAULT_BATCH_SIZE
+
+    parser.add_argument(
+        "--enhance-batch",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        metavar="N",
+        help=f"prompts enhanced per request (default {DEFAULT_BATCH_SIZE}; "
+        "1 sends each on its own)",
+    )
+
+
+def add_template_arguments(parser):
+    parser.add_argument(
+        "--sample", type=int, metavar="N", help="N prompts drawn at random"
+    )
+    parser.add_argument(
+        "--sample-seed", type=int, help="makes --sample draw the same prompts"
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        default=(0, 1),
+        metavar="K/N",
+        help="only the K-th of N equal shares of the prompts, e.g. 2/8",
+    )
+    parser.add_argument("--limit", type=int, metavar="N", help="stop after N prompts")
+    parser.add_argument(
+        "--no-dedup",
+        dest="dedup",
+        action="store_false",
+        help="keep prompts that expand to one already produced",
+    )
+    parser.add_argument(
+        "--wildcards",
+        metavar="DIR",
+        help="folder of NAME.txt files for __NAME__ "
+        "(default ~/.ai_image_generator/wildcards)",
+    )
+
+
+def build_parser():
+    from imagegen.manifest import JOURNAL_NAME
+
+    parser = argparse.ArgumentParser(
+        prog="python -m imagegen",
+        description="Generate images, enhance prompts or inspect request "
+        "timings without the GUI.",
+    )
+    parser.add_argument(
+        "--api-key",
+        help="Nebius AI API key (default: $NEBIUS_API_KEY, then the keyring)",
+    )
+    parser.add_argument(
+        "--provider",
+        default="nebius",
+        help="image and prompt API: nebius (default), openai or mock",
+    )
+    parser.add_argument(
+        "--base-url", help="override the provider's endpoint, e.g. for a proxy"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="bypass the on-disk result and prompt caches",
+    )
+    parser.add_argument("--cache-dir", help="result cache folder")
+    parser.add_argument(
+        "--cache-size-mb", type=int, help="evict cached results above this size"
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        help="retry transient failures this many times (default 2)",
+    )
+    parser.add_argument(
+        "--hedge-after",
+        type=float,
+        metavar="SECONDS",
+        help="send a duplicate of any generation still unanswered after SECONDS "
+        "and keep the first result",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate = subparsers.add_parser(
+        "generate", help="generate images for every prompt in a file"
+    )
+    generate.add_argument(
+        "prompt_file",
+        help="file with one prompt or template per line, or -; {a|b} "
+        "expands to both alternatives and __NAME__ to each line of NAME.txt",
+    )
+    generate.add_argument(
+        "-s",
+        "--size",
+        type=parse_size,
+        action="append",
+        help="image size as WxH; repeat for several sizes (default 1024x1024)",
+    )
+    generate.add_argument(
+        "--seeds", default="", help="seeds such as 1,2,10-20 (default random)"
+    )
+    generate.add_argument(
+        "--enhance", action="store_true", help="enhance each prompt first"
+    )
+    add_enhance_batch_argument(generate)
+    add_template_arguments(generate)
+    add_queue_arguments(generate)
+    generate.set_defaults(func=cmd_generate)
+
+    expand = subparsers.add_parser(
+        "expand", help="print the prompts that prompt templates expand to"
+    )
+    expand.add_argument("prompt_file", help="file with one template per line, or -")
+    expand.add_argument(
+        "-c", "--count", action="store_true", help="only print how many there are"
+    )
+    add_template_arguments(expand)
+    expand.set_defaults(func=cmd_expand)
+
+    run = subparsers.add_parser(
+        "run",
+        help="run every job of a JSONL or CSV manifest; run it again to resume",
+        description="Run a manifest with one job per row: a prompt and "
+        "optionally size (WxH) or width and height, seed and steps. Finished "
+        f"jobs are recorded in {JOURNAL_NAME} in the output folder, so running "
+        "the same command again after a crash or Ctrl+C only does the rest.",
+    )
+    run.add_argument("manifest", help=".jsonl file, or .csv/.tsv with a header row")
+    add_queue_arguments(run)
+    run.set_defaults(func=cmd_run)
+
+    enhance = subparsers.add_parser(
+        "enhance", help="print an enhanced version of every prompt in a file"
+    )
+    enhance.add_argument("prompt_file", help="file with one prompt per line, or -")
+    enhance.add_argument(
+        "-j", "--concurrency", type=int, default=4, help="requests kept in flight"
+    )
+    enhance.add_argument(
+        "-n", "--variants", type=int, default=1, help="enhanced variants per prompt"
+    )
+    add_enhance_batch_argument(enhance)
+    enhance.set_defaults(func=cmd_enhance)
+
+    stats = subparsers.add_parser(
+        "stats", help="print p50/p95/p99 timings of recent requests by phase"
+    )
+    stats.set_defaults(func=cmd_stats)
+
+    history = subparsers.add_parser(
+        "history", help="search past generations, newest first"
+    )
+    history.add_argument("text", nargs="*", help="words the prompt must contain")
+    history.add_argument(
+        "-s", "--size", type=parse_size, help="only images of this size, as WxH"
+    )
+    history.add_argument(
+        "--days", type=float, help="only generations from the last DAYS days"
+    )
+    history.add_argument(
+        "--failed", action="store_true", help="list failed generations instead"
+    )
+    history.add_argument("-n", "--limit", type=int, default=20)
+    history.set_defaults(func=cmd_history)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.func in (cmd_stats, cmd_history, cmd_expand):
+        return args.func(args, None)  # Works offline, no key needed
+
+    from imagegen.providers import PROVIDERS, configure_provider
+
+    if args.provider not in PROVIDERS:
+        print(
+            f"Unknown provider {args.provider!r}; choose from {', '.join(PROVIDERS)}",
+            file=sys.stderr,
+        )
+        return 2
+    provider = configure_provider(args.provider, args.base_url)
+
+    api_key = args.api_key
+    if not api_key and provider.requires_key:
+        from imagegen.credentials import get_api_key
+
+        api_key = get_api_key()
+    if not api_key and provider.requires_key:
+        print(
+            "No API key: pass --api-key, set NEBIUS_API_KEY or save one in the GUI",
+            file=sys.stderr,
+        )
+        return 2
+    if args.no_cache or args.cache_dir or args.cache_size_mb:
+        from imagegen.cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, configure_cache
+
+        configure_cache(
+            args.cache_dir or DEFAULT_CACHE_DIR,
+            (
+                args.cache_size_mb * 1024 * 1024
+                if args.cache_size_mb
+                else DEFAULT_MAX_BYTES
+            ),
+            enabled=not args.no_cache,
+        )
+    if args.retries is not None or args.hedge_after:
+        from imagegen.retry import DEFAULT_MAX_ATTEMPTS, configure_retry_policy
+
+        configure_retry_policy(
+            (args.retries + 1 if args.retries is not None else DEFAULT_MAX_ATTEMPTS),
+            hedge_after=args.hedge_after,
+        )
+    if args.no_cache:
+        from imagegen.enhance import configure_memo
+
+        configure_memo(enabled=False)
+    return args.func(args, api_key)
@@ -0,0 +1,481 @@
+import contextvars
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from io import BytesIO
+
+from imagegen.cache import get_cache
+from imagegen.providers import (  # noqa: F401 (constants re-exported)
+    DEFAULT_NEGATIVE_PROMPT,
+    IMAGE_MODEL,
+    NEBIUS_BASE_URL,
+    get_provider,
+)
+from imagegen.retry import SAFE, UNSAFE, get_retry_policy, parse_retry_after
+from imagegen.session import (
+    CancelToken,
+    Cancelled,
+    cancellable,
+    ensure_pool_size,
+    get_session,
+    get_timeout,
+)
+from imagegen.singleflight import get_single_flight
+from imagegen.stream import STREAM_CHUNK_SIZE, ImageStreamParser, log_preview
+from imagegen.timing import get_estimator
+from imagegen.trace import Trace, current_trace, record_span, timed_chunks, tracing
+
+
+DEFAULT_NUM_INFERENCE_STEPS = 64
+CACHED_RESPONSE_TEXT = '{"cached": true}'
+
+# Quick low-resolution pass used to check a prompt before the full render
+PREVIEW_STEPS = 8
+PREVIEW_MAX_SIDE = 512
+
+
+def preview_size(width, height, max_side=PREVIEW_MAX_SIDE):
+    # Scales (width, height) down to fit max_side, keeping the aspect ratio
+    # and rounding to the multiples of 64 the model expects
+    scale = min(1.0, max_side / max(width, height))
+    return tuple(max(64, round(side * scale / 64) * 64) for side in (width, height))
+
+
+def build_headers(api_key):
+    headers = {"Content-Type": "application/json", "Accept": "*/*"}
+    if api_key:  # The mock server needs none
+        headers["Authorization"] = f"Bearer {api_key}"
+    return headers
+
+
+def build_payload(
+    prompt,
+    width,
+    height,
+    seed=None,
+    steps=DEFAULT_NUM_INFERENCE_STEPS,
+    count=1,
+    provider=None,
+):
+    # Generation payload in the format of `provider`, by default the
+    # configured one
+    provider = provider or get_provider()
+    return provider.build_payload(prompt, width, height, seed, steps, count)
+
+
+def _fetch_url(session, url, timeout):
+    try:
+        with session.get(url, timeout=timeout, stream=True) as img_response:
+            if img_response.status_code == 200:
+                return read_body(
+                    timed_chunks(img_response.iter_content(STREAM_CHUNK_SIZE))
+                )
+            print(f"Failed to download image from URL: {img_response.status_code}")
+    except Exception as e:
+        print(f"Failed to fetch URL: {e}")
+    return None
+
+
+def read_body(chunks):
+    buffer = BytesIO()
+    for chunk in chunks:
+        buffer.write(chunk)
+    return buffer.getvalue()
+
+
+def is_image_content(headers):
+    return headers.get("content-type", "").startswith("image/")
+
+
+def find_image_urls(response_json):
+    # Image URLs for responses that link instead of embedding
+    for field in ("data", "images"):
+        items = response_json.get(field) if isinstance(response_json, dict) else None
+        if items:
+            urls = [
+                item["url"]
+                for item in items
+                if isinstance(item, dict) and item.get("url")
+            ]
+            if urls:
+                return urls
+    return []
+
+
+def find_image_url(response_json):
+    # URL of the first image for responses that link instead of embedding
+    urls = find_image_urls(response_json)
+    return urls[0] if urls else None
+
+
+def finish_image_stream(parser):
+    # Returns (images, response_json, summary_text) for a fully fed
+    # ImageStreamParser; response_json is None when the body was not JSON
+    record_span("b64_decode", parser.decode_seconds)
+    summary_text = parser.skeleton_text()
+    # Kept with the job's timings rather than printed, so command line
+    # output stays clean; images are elided
+    trace = current_trace()
+    if trace is not None:
+        trace.attrs["response"] = log_preview(summary_text)
+    try:
+        response_json = parser.skeleton_json()
+    except json.JSONDecodeError:
+        print("Failed to parse JSON response")
+        response_json = None
+    return [sink.getvalue() for sink in parser.images], response_json, summary_text
+
+
+def parse_image_stream(chunks, parser=None):
+    parser = parser or ImageStreamParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    return finish_image_stream(parser)
+
+
+def extract_images(response, session, timeout, parser=None):
+    # Reads a streamed 200 response; returns (list_of_image_bytes, text)
+    # where text is the response body with any embedded images elided.
+    # Linked images are downloaded in parallel.
+    chunks = timed_chunks(response.iter_content(STREAM_CHUNK_SIZE))
+    if is_image_content(response.headers):
+        return [read_body(chunks)], ""
+
+    images, response_json, summary_text = parse_image_stream(chunks, parser)
+    if images:
+        return images, summary_text
+    image_urls = find_image_urls(response_json) if response_json else []
+    if len(image_urls) == 1:
+        image = _fetch_url(session, image_urls[0], timeout)
+        return [image] if image else [], summary_text
+    if image_urls:
+        fetched = _get_fetch_executor().map(
+            lambda url: _fetch_url(session, url, timeout), image_urls
+        )
+        return [image for image in fetched if image], summary_text
+    print("No valid image data found in response")
+    return [], summary_text
+
+
+def extract_image(response, session, timeout):
+    # Like extract_images, for callers that only want the first image
+    images, response_text = extract_images(response, session, timeout)
+    return (images[0] if images else None), response_text
+
+
+def classify_failure(error):
+    # SAFE when a requests exception means the request never reached the
+    # server, UNSAFE when it may have been processed, None otherwise
+    import requests
+    from urllib3.exceptions import NewConnectionError
+
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return SAFE
+    if isinstance(error, requests.exceptions.ConnectionError):
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return SAFE if isinstance(reason, NewConnectionError) else UNSAFE
+    if isinstance(
+        error, (requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError)
+    ):
+        return UNSAFE
+    return None
+
+
+def _post_image_request(url, headers, data, cancel_token, provider):
+    # One attempt; returns (status_code, response_text, images,
+    # retry_after) and raises on transport errors
+    session = get_session()
+    timeout = get_timeout()
+    trace = current_trace()
+    with cancellable(cancel_token):
+        connection_before = trace.connection_seconds() if trace else 0.0
+        request_started = time.perf_counter()
+        # Stream the body so embedded base64 images are decoded as they
+        # arrive
+        with session.post(
+            url, headers=headers, json=data, timeout=timeout, stream=True
+        ) as response:
+            if trace is not None:
+                # Headers are back; leave out any new connection's setup
+                connection = trace.connection_seconds() - connection_before
+                trace.add("ttfb", time.perf_counter() - request_started - connection)
+            retry_after = parse_retry_after(response.headers.get("retry-after"), None)
+            if response.status_code == 200:
+                images, response_text = extract_images(
+                    response, session, timeout, provider.new_parser()
+                )
+                return response.status_code, response_text, images, retry_after
+            response_text = response.text
+            print(
+                f"API request failed with status {response.status_code}: "
+                f"{log_preview(response_text)}"
+            )
+            return response.status_code, response_text, [], retry_after
+
+
+_hedge_executor = None
+_hedge_lock = threading.Lock()
+
+
+def _get_hedge_executor():
+    global _hedge_executor
+    with _hedge_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(thread_name_prefix="hedge")
+        return _hedge_executor
+
+
+_fetch_executor = None
+_fetch_lock = threading.Lock()
+
+
+def _get_fetch_executor():
+    # Downloads the images of multi-image responses that link to them
+    global _fetch_executor
+    with _fetch_lock:
+        if _fetch_executor is None:
+            _fetch_executor = ThreadPoolExecutor(thread_name_prefix="fetch")
+        return _fetch_executor
+
+
+def _traced_attempt(trace, attempt, token):
+    with tracing(trace):
+        return attempt(token)
+
+
+def _hedged(attempt, cancel_token, hedge_after, policy):
+    # Runs attempt(token) and, if it has not finished after hedge_after
+    # seconds, a duplicate alongside it. The first successful result wins
+    # and the other request is aborted; if neither succeeds, the first
+    # one's outcome is returned. Each copy times itself on its own Trace
+    # and only the winner's spans are kept.
+    executor = _get_hedge_executor()
+    copies = []  # (future, token, trace)
+
+    def launch():
+        token = cancel_token.child() if cancel_token else CancelToken()
+        trace = Trace("attempt")
+        future = executor.submit(_traced_attempt, trace, attempt, token)
+        copies.append((future, token, trace))
+
+    launch()
+    if not wait([copies[0][0]], timeout=hedge_after).done:
+        policy.count("hedges")
+        print(f"No response after {hedge_after:.1f}s, sending a hedged request")
+        launch()
+
+    winner = None
+    pending = {future for future, _, _ in copies}
+    while pending and winner is None:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future, _, _ in copies:
+            if future in done and winner is None and future.exception() is None:
+                status_code, _, images, _ = future.result()
+                if status_code == 200 and images:
+                    winner = future
+    for future, token, _ in copies:
+        if future is not winner:
+            token.cancel()
+
+    chosen = winner or copies[0][0]
+    trace = current_trace()
+    for index, (future, _, attempt_trace) in enumerate(copies):
+        if future is chosen:
+            if trace is not None:
+                for name, seconds in attempt_trace.spans.items():
+                    if name != "total":
+                        trace.add(name, seconds)
+                trace.attrs["hedged"] = len(copies) > 1
+            if index > 0:
+                policy.count("hedge_wins")
+    return chosen.result()
+
+
+def generate_images(
+    api_key,
+    prompt,
+    width=1024,
+    height=1024,
+    seed=None,
+    count=1,
+    use_cache=True,
+    steps=DEFAULT_NUM_INFERENCE_STEPS,
+    cancel_token=None,
+):
+    # Returns (status_code, response_text, images) where images is a list
+    # of up to `count` image byte strings from a single request; raises on
+    # transport errors so callers can report them separately. Results of
+    # requests with a seed are served from and stored in the shared result
+    # cache unless use_cache is False or the cache is disabled; without a
+    # seed every call asks for new images. Transient failures are retried, and
+    # slow requests hedged, as the shared RetryPolicy says. Calling cancel()
+    # on cancel_token from another thread aborts the request's socket and
+    # raises Cancelled here.
+    provider = get_provider()
+    url = provider.image_url
+    headers = build_headers(api_key)
+    data = provider.build_payload(prompt, width, height, seed, steps, count)
+
+    trace = current_trace()
+    # Only a seed makes the result repeatable, so only then is it cached
+    cache = get_cache() if use_cache and seed is not None else None
+    if count > 1:
+        # One entry per image so each can be evicted on its own
+        keys = [provider.cache_key({**data, "index": index}) for index in range(count)]
+    else:
+        keys = [provider.cache_key(data)]
+    if cache is not None:
+        cached = [cache.get(key) for key in keys]
+        if all(image is not None for image in cached):
+            if trace is not None:
+                trace.attrs["cached"] = True
+            return 200, CACHED_RESPONSE_TEXT, cached
+
+    def request():
+        # Generating creates nothing server-side, so the request is treated as
+        # idempotent: repeating or hedging it only costs another generation
+        policy = get_retry_policy()
+
+        def attempt(token):
+            return _post_image_request(url, headers, data, token, provider)
+
+        attempt_number = 1
+        while True:
+            started = time.monotonic()
+            try:
+                if policy.hedge_after:
+                    result = _hedged(attempt, cancel_token, policy.hedge_after, policy)
+                else:
+                    result = attempt(cancel_token)
+            except Exception as e:
+                if cancel_token is not None and cancel_token.cancelled:
+                    raise Cancelled() from e
+                if not policy.should_retry_failure(
+                    classify_failure(e), attempt_number, True
+                ):
+                    raise
+                delay = policy.delay(attempt_number)
+                print(f"Request failed ({e}), retrying in {delay:.1f}s")
+            else:
+                status_code, response_text, images, retry_after = result
+                if not policy.should_retry_status(status_code, attempt_number, True):
+                    break
+                delay = policy.delay(attempt_number, retry_after)
+                print(f"API returned {status_code}, retrying in {delay:.1f}s")
+            policy.count("retries")
+            attempt_number += 1
+            if cancel_token is not None:
+                if cancel_token.wait(delay):
+                    raise Cancelled()
+            else:
+                time.sleep(delay)
+
+        # An aborted socket can also look like a short, unparseable body
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        if trace is not None:
+            trace.attrs["attempts"] = attempt_number
+
+        if images:
+            get_estimator().observe(
+                width, height, steps, time.monotonic() - started, len(images)
+            )
+            if cache is not None and len(images) == len(keys):
+                for key, image_data in zip(keys, images):
+                    cache.put(key, image_data)
+        return status_code, response_text, images
+
+    if seed is None:
+        # Each caller expects images of its own, so nothing is shared
+        status_code, response_text, images = request()
+        return status_code, response_text, list(images)
+
+    # An identical request already in flight (a double-click, a duplicate
+    # batch line) is joined rather than sent again. The key and endpoint
+    # are part of it so no caller gets a result made with another's
+    # credentials, or another's authentication error.
+    flight_key = (api_key, url, *keys)
+    (status_code, response_text, images), shared = get_single_flight().do(
+        flight_key, request, cancel_token
+    )
+    if shared and trace is not None:
+        trace.attrs["coalesced"] = True
+    return status_code, response_text, list(images)
+
+
+def generate_image(
+    api_key,
+    prompt,
+    width=1024,
+    height=1024,
+    seed=None,
+    use_cache=True,
+    steps=DEFAULT_NUM_INFERENCE_STEPS,
+    cancel_token=None,
+):
+    # Single-image form of generate_images: returns (status_code,
+    # response_text, image_bytes_or_None)
+    status_code, response_text, images = generate_images(
+        api_key,
+        prompt,
+        width,
+        height,
+        seed,
+        use_cache=use_cache,
+        steps=steps,
+        cancel_token=cancel_token,
+    )
+    return status_code, response_text, (images[0] if images else None)
+
+
+def generate_seed_sweep(
+    api_key,
+    prompt,
+    width,
+    height,
+    seeds,
+    count=1,
+    use_cache=True,
+    steps=DEFAULT_NUM_INFERENCE_STEPS,
+    cancel_token=None,
+):
+    # Runs one generate_images request per seed, all at once, and returns
+    # [(seed, status_code, response_text, images)] in seed order. Requests
+    # that raise are reported with status_code None and the error message
+    # as response_text, except Cancelled, which is raised once every
+    # request has stopped. The caller's trace collects every request's
+    # spans.
+    seeds = list(seeds)
+    ensure_pool_size(len(seeds))
+
+    def run(seed, context):
+        return context.run(
+            generate_images,
+            api_key,
+            prompt,
+            width,
+            height,
+            seed,
+            count,
+            use_cache,
+            steps,
+            cancel_token,
+        )
+
+    results = []
+    with ThreadPoolExecutor(
+        max_workers=len(seeds) or 1, thread_name_prefix="sweep"
+    ) as executor:
+        futures = [
+            executor.submit(run, seed, contextvars.copy_context()) for seed in seeds
+        ]
+        for seed, future in zip(seeds, futures):
+            try:
+                results.append((seed, *future.result()))
+            except Cancelled:
+                raise
+            except Exception as e:
+                print(f"Sweep request for seed {seed} failed: {e}")
+                results.append((seed, None, str(e), []))
+    return results
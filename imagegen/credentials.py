@@ -0,0 +1,32 @@
+import os
+
+
+# Constants for keyring service and username
+KEYRING_SERVICE = "ai_image_generator"
+KEYRING_USERNAME = "api_key"
+API_KEY_ENV_VAR = "NEBIUS_API_KEY"
+
+
+def get_api_key(environment=True):
+    # The environment wins so headless servers need no keyring backend; the
+    # GUI passes environment=False to show only what it saved. Importing
+    # keyring costs tens of milliseconds and reading it can block on a
+    # locked desktop keyring, so callers with a UI should do this off their
+    # main thread.
+    if environment:
+        api_key = os.environ.get(API_KEY_ENV_VAR)
+        if api_key:
+            return api_key
+    import keyring
+
+    try:
+        return keyring.get_password(KEYRING_SERVICE, KEYRING_USERNAME)
+    except Exception as e:
+        print(f"Could not read API key from keyring: {e}")
+        return None
+
+
+def set_api_key(api_key):
+    import keyring
+
+    keyring.set_password(KEYRING_SERVICE, KEYRING_USERNAME, api_key)
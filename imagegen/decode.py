@@ -0,0 +1,59 @@
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+
+# Raw layouts matching Qt's native 32-bit formats (QImage.Format_RGB32 and
+# Format_ARGB32 are stored as native-endian 0xAARRGGBB words)
+if sys.byteorder == "little":
+    RGB32_RAW_MODE, ARGB32_RAW_MODE = "BGRX", "BGRA"
+else:
+    RGB32_RAW_MODE, ARGB32_RAW_MODE = "XRGB", "ARGB"
+
+
+def decode_pixels(image_data):
+    # Decodes encoded image bytes once and returns
+    # (pixels, width, height, has_alpha) with pixels laid out as 32-bit
+    # words a QImage can wrap without another conversion
+    from PIL import Image
+
+    pil_image = Image.open(BytesIO(image_data))
+    pil_image.draft("RGB", pil_image.size)  # Cheaper JPEG decode when possible
+    has_alpha = pil_image.mode in ("RGBA", "LA", "PA") or (
+        pil_image.mode == "P" and "transparency" in pil_image.info
+    )
+    if has_alpha:
+        if pil_image.mode != "RGBA":
+            pil_image = pil_image.convert("RGBA")
+        pixels = pil_image.tobytes("raw", ARGB32_RAW_MODE)
+    else:
+        if pil_image.mode != "RGB":
+            pil_image = pil_image.convert("RGB")
+        pixels = pil_image.tobytes("raw", RGB32_RAW_MODE)
+    return pixels, pil_image.width, pil_image.height, has_alpha
+
+
+_decode_executor = None
+_decode_lock = threading.Lock()
+
+
+def _get_decode_executor():
+    global _decode_executor
+    with _decode_lock:
+        if _decode_executor is None:
+            _decode_executor = ThreadPoolExecutor(
+                max_workers=os.cpu_count() or 4, thread_name_prefix="decode"
+            )
+        return _decode_executor
+
+
+def decode_all(images, decode=decode_pixels):
+    # decode() applied to every image at once on a shared pool, results in
+    # input order. PIL releases the GIL while decompressing, so several
+    # PNGs decode in roughly the time of the largest one.
+    images = list(images)
+    if len(images) <= 1:
+        return [decode(image_data) for image_data in images]
+    return list(_get_decode_executor().map(decode, images))
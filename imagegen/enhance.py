@@ -0,0 +1,413 @@
+import hashlib
+import itertools
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from imagegen.paths import DATA_DIR
+from imagegen.providers import ENHANCE_MODEL, get_provider  # noqa: F401
+from imagegen.session import Cancelled, abort_socket
+from imagegen.trace import current_trace, record_span
+
+
+ENHANCE_INSTRUCTION = (
+    "Rewrite the following image generation prompt to be more detailed, vivid, "
+    "and creative, while keeping its core idea. Respond only with the enhanced "
+    "prompt—no explanations, no headers, just the prompt. Limit the enhanced "
+    "prompt to 100 words:\n"
+)
+BATCH_ENHANCE_INSTRUCTION = (
+    "Rewrite each of the image generation prompts below to be more detailed, "
+    "vivid, and creative, while keeping its core idea. Limit each enhanced "
+    "prompt to 100 words. The prompts are a JSON array of objects with an "
+    '"id" and a "prompt". Respond only with a JSON object of the form '
+    '{"results": [{"id": <id>, "prompt": <enhanced prompt>}, ...]} holding '
+    "one enhanced prompt for every id, no explanations:\n"
+)
+DEFAULT_MEMO_PATH = DATA_DIR / "enhanced_prompts.sqlite3"
+DEFAULT_BATCH_SIZE = 16  # Prompts per batched enhancement request
+DEFAULT_BATCH_CONCURRENCY = 4  # Batched requests in flight at once
+WARM_UP_TIMEOUT = 10.0  # Seconds a warm-up request may take
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(api_key, base_url=None):
+    # One long-lived OpenAI client per key and endpoint so its connection
+    # pool is reused; base_url defaults to the configured provider's
+    base_url = base_url or get_provider().base_url
+    api_key = api_key or "unused"  # The client insists on one
+    with _clients_lock:
+        client = _clients.get((base_url, api_key))
+        if client is None:
+            # openai is heavy to import, so only load it when enhancing
+            from openai import OpenAI
+
+            client = OpenAI(base_url=base_url, api_key=api_key)
+            _clients[(base_url, api_key)] = client
+        return client
+
+
+def warm_up_client(api_key, base_url=None):
+    # Builds the client, importing openai, and makes one cheap request so
+    # its pool holds a live connection for the first enhancement. Whether
+    # the endpoint lists models does not matter; any answer will do.
+    client = get_client(api_key, base_url)
+    try:
+        client.with_options(timeout=WARM_UP_TIMEOUT, max_retries=0).models.list()
+    except Exception:
+        pass
+    return client
+
+
+def build_messages(original_prompt):
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": ENHANCE_INSTRUCTION + original_prompt}
+            ],
+        }
+    ]
+
+
+def build_batch_messages(prompts):
+    items = [{"id": index, "prompt": prompt} for index, prompt in enumerate(prompts)]
+    text = BATCH_ENHANCE_INSTRUCTION + json.dumps(items, ensure_ascii=False)
+    return [{"role": "user", "content": [{"type": "text", "text": text}]}]
+
+
+def parse_batch_response(content, count):
+    # The enhanced prompts of a batched reply by input position, None for
+    # any the reply leaves out or garbles. Tolerates code fences and text
+    # around the JSON, and a bare array in place of the object.
+    results = [None] * count
+    start = min(
+        (i for i in (content.find("{"), content.find("[")) if i >= 0), default=-1
+    )
+    end = max(content.rfind("}"), content.rfind("]"))
+    try:
+        data = json.loads(content[start : end + 1]) if start >= 0 else None
+    except ValueError:
+        return results
+    if isinstance(data, dict):
+        data = data.get("results")
+    if not isinstance(data, list):
+        return results
+    for position, item in enumerate(data):
+        if isinstance(item, dict):
+            index, enhanced = item.get("id"), item.get("prompt")
+        else:
+            index, enhanced = position, item
+        if (
+            isinstance(index, int)
+            and 0 <= index < count
+            and isinstance(enhanced, str)
+            and enhanced.strip()
+        ):
+            results[index] = enhanced.strip()
+    return results
+
+
+def memo_key(original_prompt, model=None):
+    # Changing the model or the instruction starts a fresh set of variants
+    model = model or get_provider().enhance_model
+    text = "\0".join([model, ENHANCE_INSTRUCTION, original_prompt])
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EnhanceMemo:
+    # Persistent original -> enhanced prompt memo. Each original prompt can
+    # hold several numbered variants.
+
+    def __init__(self, path=DEFAULT_MEMO_PATH, enabled=True):
+        self.path = path
+        self.enabled = enabled
+        self.stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self):
+        if self._db is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS enhanced_prompts ("
+                " key TEXT NOT NULL,"
+                " variant INTEGER NOT NULL,"
+                " original TEXT NOT NULL,"
+                " enhanced TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " PRIMARY KEY (key, variant))"
+            )
+            self._db.commit()
+        return self._db
+
+    def variants(self, original_prompt):
+        if not self.enabled:
+            return []
+        with self._lock:
+            rows = (
+                self._connect()
+                .execute(
+                    "SELECT enhanced FROM enhanced_prompts WHERE key = ?"
+                    " ORDER BY variant",
+                    (memo_key(original_prompt),),
+                )
+                .fetchall()
+            )
+        return [row[0] for row in rows]
+
+    def add(self, original_prompt, enhanced_prompts):
+        if not self.enabled or not enhanced_prompts:
+            return
+        key = memo_key(original_prompt)
+        with self._lock:
+            db = self._connect()
+            (count,) = db.execute(
+                "SELECT COUNT(*) FROM enhanced_prompts WHERE key = ?", (key,)
+            ).fetchone()
+            db.executemany(
+                "INSERT INTO enhanced_prompts VALUES (?, ?, ?, ?, ?)",
+                [
+                    (key, count + i, original_prompt, enhanced, time.time())
+                    for i, enhanced in enumerate(enhanced_prompts)
+                ],
+            )
+            db.commit()
+
+    def clear(self):
+        with self._lock:
+            db = self._connect()
+            db.execute("DELETE FROM enhanced_prompts")
+            db.commit()
+
+
+_memo = None
+_memo_lock = threading.Lock()
+
+
+def configure_memo(path=DEFAULT_MEMO_PATH, enabled=True):
+    global _memo
+    with _memo_lock:
+        _memo = EnhanceMemo(path, enabled)
+        return _memo
+
+
+def get_memo():
+    global _memo
+    with _memo_lock:
+        if _memo is None:
+            _memo = EnhanceMemo()
+        return _memo
+
+
+def request_enhancements(api_key, original_prompt, count=1):
+    # Asks the model for `count` fresh enhancements, bypassing the memo
+    extra = {"n": count} if count > 1 else {}
+    response = get_client(api_key).chat.completions.create(
+        model=get_provider().enhance_model,
+        messages=build_messages(original_prompt),
+        **extra,
+    )
+    return [choice.message.content.strip() for choice in response.choices]
+
+
+def enhance_variants(api_key, original_prompt, count=1, use_memo=True):
+    # Returns `count` enhanced variants, only asking the model for the ones
+    # the memo does not have yet
+    memo = get_memo() if use_memo else None
+    variants = memo.variants(original_prompt) if memo is not None else []
+    if memo is not None:
+        memo.stats["hits" if len(variants) >= count else "misses"] += 1
+        trace = current_trace()
+        if trace is not None and len(variants) >= count:
+            trace.attrs["cached"] = True
+    while len(variants) < count:
+        # Some OpenAI-compatible servers ignore `n`, so keep asking
+        fresh = request_enhancements(api_key, original_prompt, count - len(variants))
+        if not fresh:
+            break
+        if memo is not None:
+            memo.add(original_prompt, fresh)
+        variants.extend(fresh)
+    return variants[:count]
+
+
+def enhance_prompt(api_key, original_prompt, variant=0, use_memo=True):
+    return enhance_variants(api_key, original_prompt, variant + 1, use_memo)[variant]
+
+
+def stream_enhancement(api_key, original_prompt, cancel_token=None):
+    # Asks the model for one fresh enhancement with stream=True and yields
+    # its text piece by piece as it is written, bypassing the memo. The
+    # wait for the first piece goes to the current trace as "first_token".
+    # Raises Cancelled, and drops the connection, once `cancel_token` is
+    # cancelled, even while the model has yet to write the next piece.
+    client = get_client(api_key)
+    start = time.perf_counter()
+    stream = client.chat.completions.create(
+        model=get_provider().enhance_model,
+        messages=build_messages(original_prompt),
+        stream=True,
+    )
+    first = True
+    with stream:
+        remove = None
+        if cancel_token is not None:
+            remove = cancel_token.on_cancel(lambda: _abort_stream(stream))
+        try:
+            for chunk in stream:
+                if cancel_token is not None and cancel_token.cancelled:
+                    raise Cancelled()
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                if first:
+                    record_span("first_token", time.perf_counter() - start)
+                    first = False
+                yield chunk.choices[0].delta.content
+        except Exception as e:
+            if cancel_token is not None and cancel_token.cancelled:
+                raise Cancelled() from e  # The read failed because of it
+            raise
+        finally:
+            if remove is not None:
+                remove()
+
+
+def _abort_stream(stream):
+    # Called from another thread: wakes the thread reading `stream` by
+    # shutting its socket down, as closing the response would not
+    network_stream = stream.response.extensions.get("network_stream")
+    sock = network_stream.get_extra_info("socket") if network_stream else None
+    if sock is not None:
+        abort_socket(sock)
+    else:
+        stream.response.close()
+
+
+def enhance_prompt_stream(
+    api_key, original_prompt, variant=0, use_memo=True, cancel_token=None
+):
+    # enhance_prompt() that yields the enhanced prompt in pieces as the
+    # model writes it. A variant the memo has comes back as one piece;
+    # otherwise one fresh enhancement is streamed and added to the memo as
+    # the next variant.
+    memo = get_memo() if use_memo else None
+    variants = memo.variants(original_prompt) if memo is not None else []
+    if memo is not None:
+        memo.stats["hits" if len(variants) > variant else "misses"] += 1
+    if len(variants) > variant:
+        trace = current_trace()
+        if trace is not None:
+            trace.attrs["cached"] = True
+        yield variants[variant]
+        return
+    pieces = []
+    for piece in stream_enhancement(api_key, original_prompt, cancel_token):
+        pieces.append(piece)
+        yield piece
+    enhanced = "".join(pieces).strip()
+    if memo is not None and enhanced:
+        memo.add(original_prompt, [enhanced])
+
+
+def request_batch_enhancements(api_key, prompts):
+    # Asks the model to enhance all of `prompts` in one call with a JSON
+    # reply; returns one enhanced prompt or None (not in the reply) each
+    response = get_client(api_key).chat.completions.create(
+        model=get_provider().enhance_model,
+        messages=build_batch_messages(prompts),
+        response_format={"type": "json_object"},
+    )
+    return parse_batch_response(response.choices[0].message.content, len(prompts))
+
+
+def enhance_many(
+    api_key,
+    prompts,
+    batch_size=DEFAULT_BATCH_SIZE,
+    concurrency=DEFAULT_BATCH_CONCURRENCY,
+    use_memo=True,
+    on_error=None,
+):
+    # Enhances a list of prompts with `batch_size` of them per request and
+    # `concurrency` requests in flight, so a long list takes a handful of
+    # round trips instead of one each. Prompts already in the memo, and
+    # repeats, are not sent. A prompt the batched reply misses or garbles
+    # is enhanced on its own. If that fails too, on_error(prompt, error)
+    # gives the result, or the error is raised. Returns the enhanced
+    # prompts in order.
+    memo = get_memo() if use_memo else None
+    results = {}
+    for prompt in dict.fromkeys(prompts):
+        variants = memo.variants(prompt) if memo is not None else []
+        if variants:
+            memo.stats["hits"] += 1
+            results[prompt] = variants[0]
+    missing = [prompt for prompt in dict.fromkeys(prompts) if prompt not in results]
+    if memo is not None:
+        memo.stats["misses"] += len(missing)
+
+    def remember(prompt, enhanced):
+        if memo is not None:
+            memo.add(prompt, [enhanced])
+        return enhanced
+
+    def enhance_alone(prompt):
+        try:
+            fresh = request_enhancements(api_key, prompt)
+            if not fresh:
+                raise ValueError("the model returned no enhancement")
+        except Exception as e:
+            if on_error is None:
+                raise
+            return on_error(prompt, e)
+        return remember(prompt, fresh[0])
+
+    def enhance_batch(batch):
+        if len(batch) == 1:
+            return [enhance_alone(batch[0])]
+        try:
+            enhanced = request_batch_enhancements(api_key, batch)
+        except Exception as e:
+            print(f"Batched enhancement failed, enhancing one by one: {e}")
+            enhanced = [None] * len(batch)
+        return [
+            remember(prompt, text) if text is not None else enhance_alone(prompt)
+            for prompt, text in zip(batch, enhanced)
+        ]
+
+    batches = [
+        missing[start : start + batch_size]
+        for start in range(0, len(missing), batch_size)
+    ]
+    if batches:
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(batches))) as pool:
+            for batch, enhanced in zip(batches, pool.map(enhance_batch, batches)):
+                results.update(zip(batch, enhanced))
+    return [results[prompt] for prompt in prompts]
+
+
+def enhance_lazily(
+    api_key,
+    prompts,
+    batch_size=DEFAULT_BATCH_SIZE,
+    concurrency=DEFAULT_BATCH_CONCURRENCY,
+    use_memo=True,
+    on_error=None,
+):
+    # enhance_many() over an iterable of any length, such as an expanded
+    # template: yields enhanced prompts in order, taking in only enough
+    # prompts at a time to keep every request full and in flight
+    prompts = iter(prompts)
+    while True:
+        chunk = list(itertools.islice(prompts, batch_size * concurrency))
+        if not chunk:
+            return
+        yield from enhance_many(
+            api_key, chunk, batch_size, concurrency, use_memo, on_error
+        )
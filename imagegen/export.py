@@ -0,0 +1,148 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from io import BytesIO
+
+
+# name -> (label, extensions, PIL format, lossy); the first extension is
+# the one new files get
+FORMATS = {
+    "png": ("PNG", (".png",), "PNG", False),
+    "jpeg": ("JPEG", (".jpg", ".jpeg"), "JPEG", True),
+    "webp": ("WebP", (".webp",), "WEBP", True),
+    "avif": ("AVIF", (".avif",), "AVIF", True),
+}
+DEFAULT_QUALITY = 90  # For lossy formats, 1-100
+DEFAULT_PNG_COMPRESSION = 6  # zlib level 0-9; higher is smaller but slower
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def available_formats():
+    # Format names this Pillow build can write; AVIF needs libavif
+    from PIL import features
+
+    names = []
+    for name in FORMATS:
+        if name == "avif" and not features.check("avif"):
+            continue
+        if name == "webp" and not features.check("webp"):
+            continue
+        names.append(name)
+    return names
+
+
+def format_for_path(path, default="png"):
+    extension = os.path.splitext(path)[1].lower()
+    for name, (_, extensions, _, _) in FORMATS.items():
+        if extension in extensions:
+            return name
+    return default
+
+
+def with_extension(path, fmt):
+    # `path` with the format's extension unless it already has one of them
+    extensions = FORMATS[fmt][1]
+    if os.path.splitext(path)[1].lower() in extensions:
+        return path
+    return os.path.splitext(path)[0] + extensions[0]
+
+
+def encode_image(image_data, fmt="png", quality=DEFAULT_QUALITY, png_compression=None):
+    # Re-encodes image bytes as `fmt`. Without a png_compression level, PNG
+    # sources saved as PNG are returned untouched, so the common case costs
+    # no decode at all. Slow for large images, so call it off the GUI
+    # thread.
+    if (
+        fmt == "png"
+        and png_compression is None
+        and image_data.startswith(PNG_SIGNATURE)
+    ):
+        return image_data
+    from PIL import Image
+
+    return encode_pil_image(
+        Image.open(BytesIO(image_data)), fmt, quality, png_compression
+    )
+
+
+def encode_pil_image(image, fmt="png", quality=DEFAULT_QUALITY, png_compression=None):
+    # Encodes a decoded PIL image as `fmt` and returns the bytes
+    from PIL import Image
+
+    pil_format, lossy = FORMATS[fmt][2], FORMATS[fmt][3]
+    options = {}
+    if fmt == "png":
+        options["compress_level"] = (
+            DEFAULT_PNG_COMPRESSION if png_compression is None else png_compression
+        )
+    elif fmt == "jpeg":
+        # No alpha in JPEG: flatten transparent images onto white
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        options.update(optimize=True, progressive=True)
+    elif fmt == "webp":
+        options["method"] = 4  # Encoder effort 0-6; 4 is libwebp's default
+    if lossy:
+        options["quality"] = quality
+    buffer = BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def save_image(image_data, path, fmt=None, **options):
+    # Encodes and writes atomically: a half-written file never appears
+    # under the final name. fmt defaults to the one the extension names.
+    fmt = fmt or format_for_path(path)
+    encoded = encode_image(image_data, fmt, **options)
+    part = f"{path}.{threading.get_ident()}.part"
+    try:
+        with open(part, "wb") as f:
+            f.write(encoded)
+        os.replace(part, path)
+    except OSError:
+        try:
+            os.remove(part)
+        except OSError:
+            pass
+        raise
+    return path
+
+
+def export_many(
+    items, output_dir, fmt="png", max_workers=None, on_done=None, **options
+):
+    # Saves (name, image_data_or_loader) pairs to output_dir as `fmt`, in
+    # parallel; a loader is a callable returning the bytes, so large sets
+    # are not read into memory up front. Pillow releases the GIL while
+    # encoding, so threads scale with cores. on_done(name, path, error) is
+    # called from the worker threads as each one finishes. Returns
+    # {name: path or exception}.
+    os.makedirs(output_dir, exist_ok=True)
+
+    def export_one(name, source):
+        image_data = source() if callable(source) else source
+        path = with_extension(os.path.join(output_dir, name), fmt)
+        return save_image(image_data, path, fmt, **options)
+
+    results = {}
+    with ThreadPoolExecutor(
+        max_workers=max_workers or os.cpu_count() or 4, thread_name_prefix="export"
+    ) as executor:
+        futures = {
+            executor.submit(export_one, name, source): name for name, source in items
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+                error = None
+            except Exception as e:
+                results[name] = error = e
+            if on_done:
+                on_done(name, None if error else results[name], error)
+    return results
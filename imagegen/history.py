@@ -0,0 +1,448 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from io import BytesIO
+from pathlib import Path
+
+from imagegen.paths import DATA_DIR
+
+
+DEFAULT_HISTORY_DIR = DATA_DIR / "history"
+THUMBNAIL_SIZE = 160  # Longest side of a gallery thumbnail in pixels
+SCHEMA_VERSION = 2
+
+# Entry statuses; only OK entries have an image
+OK = "ok"
+FAILED = "failed"
+
+COLUMNS = (
+    "id",
+    "created_at",
+    "prompt",
+    "width",
+    "height",
+    "seed",
+    "steps",
+    "model",
+    "filename",
+    "size_bytes",
+    "original_prompt",
+    "sha256",
+    "duration_ms",
+    "timings",
+    "status",
+    "error",
+)
+
+# Columns added by schema version 2, with their SQL types
+V2_COLUMNS = (
+    ("original_prompt", "TEXT"),
+    ("sha256", "TEXT"),
+    ("duration_ms", "REAL"),
+    ("timings", "TEXT"),
+    ("status", f"TEXT NOT NULL DEFAULT '{OK}'"),
+    ("error", "TEXT"),
+)
+
+# Image file types recognised by their first bytes, for the stored name
+SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"RIFF", ".webp"),
+)
+
+
+def image_extension(image_data):
+    for signature, extension in SIGNATURES:
+        if image_data.startswith(signature):
+            return extension
+    return ".png"
+
+
+def shard_path(digest, extension):
+    # "ab/cd/abcd...png": two directory levels keep every folder small even
+    # with hundreds of thousands of images
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+
+def fts_query(text):
+    # Quotes every word so user input is matched literally; the last word
+    # also matches as a prefix, so results follow typing
+    words = [word.replace('"', '""') for word in text.split()]
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+class HistoryEntry:
+    def __init__(self, row):
+        for name, value in zip(COLUMNS, row):
+            setattr(self, name, value)
+
+    @property
+    def spans(self):
+        # Per-phase milliseconds recorded with the entry, if any
+        return json.loads(self.timings) if self.timings else {}
+
+
+class HistoryStore:
+    # Every generation with the prompt and parameters that made it. Images
+    # are stored once per content under <root>/images, named by their
+    # SHA-256 and sharded into two levels of folders, so identical results
+    # share a file. Metadata, including failed attempts, lives in a SQLite
+    # index with a full-text index over prompts and indexes by date and
+    # size. Small JPEG thumbnails are made on first request under
+    # <root>/thumbnails so the gallery never has to decode full images.
+    #
+    # Pages are fetched by id rather than OFFSET, so scrolling deep into a
+    # large history costs the same as the first page.
+
+    def __init__(self, root=DEFAULT_HISTORY_DIR, enabled=True):
+        self.root = Path(root)
+        self.enabled = enabled
+        self.has_fts = False
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self):
+        if self._db is None:
+            self.root.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(
+                str(self.root / "history.sqlite3"), check_same_thread=False
+            )
+            # WAL lets readers (the gallery) run while a batch writes
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._migrate(db)
+            self._db = db
+        return self._db
+
+    def _migrate(self, db):
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS generations ("
+            " id INTEGER PRIMARY KEY,"
+            " created_at REAL NOT NULL,"
+            " prompt TEXT NOT NULL,"
+            " width INTEGER NOT NULL,"
+            " height INTEGER NOT NULL,"
+            " seed INTEGER,"
+            " steps INTEGER,"
+            " model TEXT,"
+            " filename TEXT NOT NULL,"
+            " size_bytes INTEGER NOT NULL)"
+        )
+        (version,) = db.execute("PRAGMA user_version").fetchone()
+        if version < 2:
+            existing = {row[1] for row in db.execute("PRAGMA table_info(generations)")}
+            for name, sql_type in V2_COLUMNS:
+                if name not in existing:
+                    db.execute(f"ALTER TABLE generations ADD COLUMN {name} {sql_type}")
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS generations_status"
+                " ON generations (status, id)"
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS generations_created"
+                " ON generations (created_at)"
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS generations_size"
+                " ON generations (width, height)"
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS generations_sha256"
+                " ON generations (sha256)"
+            )
+        try:
+            self._create_fts(db, rebuild=version < 2)
+            self.has_fts = True
+        except sqlite3.OperationalError as e:
+            # SQLite built without FTS5; searches fall back to LIKE
+            print(f"Full-text search unavailable: {e}")
+        db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        db.commit()
+
+    def _create_fts(self, db, rebuild):
+        db.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS generations_fts USING fts5("
+            " prompt, original_prompt,"
+            " content='generations', content_rowid='id')"
+        )
+        db.execute(
+            "CREATE TRIGGER IF NOT EXISTS generations_fts_insert"
+            " AFTER INSERT ON generations BEGIN"
+            " INSERT INTO generations_fts (rowid, prompt, original_prompt)"
+            " VALUES (new.id, new.prompt, new.original_prompt);"
+            " END"
+        )
+        db.execute(
+            "CREATE TRIGGER IF NOT EXISTS generations_fts_delete"
+            " AFTER DELETE ON generations BEGIN"
+            " INSERT INTO generations_fts"
+            " (generations_fts, rowid, prompt, original_prompt)"
+            " VALUES ('delete', old.id, old.prompt, old.original_prompt);"
+            " END"
+        )
+        if rebuild:
+            # Index rows written before the full-text index existed
+            db.execute(
+                "INSERT INTO generations_fts (generations_fts) VALUES ('rebuild')"
+            )
+
+    def image_path(self, entry):
+        return self.root / "images" / entry.filename
+
+    def thumbnail_path(self, entry):
+        return self.root / "thumbnails" / f"{entry.id}.jpg"
+
+    def _store_image(self, image_data):
+        # Writes the image under its content hash unless an identical one
+        # is already stored; returns (filename, sha256)
+        digest = hashlib.sha256(image_data).hexdigest()
+        filename = shard_path(digest, image_extension(image_data))
+        path = self.root / "images" / filename
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            part = path.with_name(f"{path.name}.{threading.get_ident()}.part")
+            with open(part, "wb") as f:
+                f.write(image_data)
+            os.replace(part, path)
+        return filename, digest
+
+    def add(
+        self,
+        image_data,
+        prompt,
+        width,
+        height,
+        seed=None,
+        steps=None,
+        model=None,
+        original_prompt=None,
+        duration=None,
+        timings=None,
+        status=OK,
+        error=None,
+    ):
+        # Records a generation and returns its entry, or None when history
+        # is disabled or the image could not be written. `duration` is in
+        # seconds and `timings` maps phase names to seconds. Failed
+        # generations are recorded with status FAILED and no image.
+        if not self.enabled or (status == OK and not image_data):
+            return None
+        filename, digest, size_bytes = "", None, 0
+        if image_data:
+            try:
+                filename, digest = self._store_image(image_data)
+            except OSError as e:
+                print(f"Failed to save history image: {e}")
+                return None
+            size_bytes = len(image_data)
+        if original_prompt == prompt:
+            original_prompt = None
+        timings_json = (
+            json.dumps(
+                {name: round(seconds * 1000, 3) for name, seconds in timings.items()}
+            )
+            if timings
+            else None
+        )
+        row = (
+            time.time(),
+            prompt,
+            width,
+            height,
+            seed,
+            steps,
+            model,
+            filename,
+            size_bytes,
+            original_prompt,
+            digest,
+            None if duration is None else round(duration * 1000, 3),
+            timings_json,
+            status,
+            error,
+        )
+        with self._lock:
+            # delete() may have removed an identical image, which it does
+            # while holding the lock, between the write above and here
+            if filename and not (self.root / "images" / filename).exists():
+                try:
+                    self._store_image(image_data)
+                except OSError as e:
+                    print(f"Failed to save history image: {e}")
+                    return None
+            db = self._connect()
+            cursor = db.execute(
+                f"INSERT INTO generations ({', '.join(COLUMNS[1:])})"
+                f" VALUES ({', '.join('?' * len(row))})",
+                row,
+            )
+            db.commit()
+        return HistoryEntry((cursor.lastrowid,) + row)
+
+    def _where(self, search=None, since=None, until=None, size=None, status=OK):
+        # SQL conditions and parameters for the query filters: full-text
+        # `search` over prompts, created_at between `since` and `until`
+        # (timestamps), `size` as (width, height), and `status` (None for
+        # every status)
+        conditions, params = [], []
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        if search:
+            if self.has_fts:
+                query = fts_query(search)
+                if query:
+                    conditions.append(
+                        "id IN (SELECT rowid FROM generations_fts"
+                        " WHERE generations_fts MATCH ?)"
+                    )
+                    params.append(query)
+            else:
+                conditions.append("(prompt LIKE ? OR original_prompt LIKE ?)")
+                params.extend([f"%{search}%"] * 2)
+        if since is not None:
+            conditions.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("created_at < ?")
+            params.append(until)
+        if size is not None:
+            conditions.append("width = ? AND height = ?")
+            params.extend(size)
+        return conditions, params
+
+    def count(self, **filters):
+        conditions, params = self._where(**filters)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            (count,) = (
+                self._connect()
+                .execute(f"SELECT COUNT(*) FROM generations{where}", params)
+                .fetchone()
+            )
+        return count
+
+    def page(self, limit, before_id=None, **filters):
+        # Newest first: the `limit` entries older than `before_id`, so the
+        # gallery can page in rows as it scrolls. Takes the same filters as
+        # count().
+        conditions, params = self._where(**filters)
+        if before_id is not None:
+            conditions.append("id < ?")
+            params.append(before_id)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            rows = (
+                self._connect()
+                .execute(
+                    f"SELECT {', '.join(COLUMNS)} FROM generations{where}"
+                    " ORDER BY id DESC LIMIT ?",
+                    params + [limit],
+                )
+                .fetchall()
+            )
+        return [HistoryEntry(row) for row in rows]
+
+    def search(self, text=None, limit=100, **filters):
+        return self.page(limit, search=text, **filters)
+
+    def get(self, entry_id):
+        with self._lock:
+            row = (
+                self._connect()
+                .execute(
+                    f"SELECT {', '.join(COLUMNS)} FROM generations WHERE id = ?",
+                    (entry_id,),
+                )
+                .fetchone()
+            )
+        return HistoryEntry(row) if row else None
+
+    def read_image(self, entry):
+        return self.image_path(entry).read_bytes()
+
+    def thumbnail(self, entry, size=THUMBNAIL_SIZE):
+        # Path of the entry's thumbnail, made from the full image on first
+        # use. Slow the first time, so call it off the GUI thread.
+        path = self.thumbnail_path(entry)
+        if path.exists():
+            return path
+        from PIL import Image
+
+        with Image.open(self.image_path(entry)) as image:
+            image.draft("RGB", (size, size))
+            image = image.convert("RGB")
+            image.thumbnail((size, size))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        buffer = BytesIO()
+        image.save(buffer, format="JPEG", quality=85)
+        part = path.with_name(f"{path.name}.{threading.get_ident()}.part")
+        part.write_bytes(buffer.getvalue())
+        os.replace(part, path)
+        return path
+
+    def delete(self, entry_ids):
+        entries = [entry for entry in map(self.get, entry_ids) if entry]
+        if not entries:
+            return
+        with self._lock:
+            db = self._connect()
+            db.executemany(
+                "DELETE FROM generations WHERE id = ?",
+                [(entry.id,) for entry in entries],
+            )
+            db.commit()
+            # Image files are shared by entries with identical content. The
+            # check and the removal both happen under the lock, which add()
+            # also holds to record an entry, so no new entry can come to
+            # use a file in between.
+            still_used = {
+                filename
+                for (filename,) in db.execute(
+                    "SELECT DISTINCT filename FROM generations WHERE filename IN"
+                    f" ({', '.join('?' * len(entries))})",
+                    [entry.filename for entry in entries],
+                )
+            }
+            unused = {
+                entry.filename
+                for entry in entries
+                if entry.filename and entry.filename not in still_used
+            }
+            for filename in unused:
+                try:
+                    (self.root / "images" / filename).unlink()
+                except OSError:
+                    pass
+        for entry in entries:
+            try:
+                self.thumbnail_path(entry).unlink()
+            except OSError:
+                pass
+
+
+_history = None
+_history_lock = threading.Lock()
+
+
+def configure_history(root=DEFAULT_HISTORY_DIR, enabled=True):
+    global _history
+    with _history_lock:
+        _history = HistoryStore(root, enabled)
+        return _history
+
+
+def get_history():
+    global _history
+    with _history_lock:
+        if _history is None:
+            _history = HistoryStore()
+        return _history
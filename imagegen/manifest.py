@@ -0,0 +1,202 @@
+import csv
+import hashlib
+import json
+import os
+import threading
+import time
+
+from imagegen.client import DEFAULT_NUM_INFERENCE_STEPS
+
+
+MIN_SIDE, MAX_SIDE = 64, 2048
+DEFAULT_SIZE = (1024, 1024)
+JOURNAL_NAME = "checkpoint.jsonl"  # Kept in the batch's output folder
+CSV_EXTENSIONS = (".csv", ".tsv")
+
+
+class ManifestError(ValueError):
+    def __init__(self, line, message):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+
+
+class ManifestEntry:
+    # One job of a manifest. `index` counts data rows from 0, bad ones
+    # included, so it stays put when a manifest is re-read.
+    def __init__(self, index, line, prompt, width, height, seed=None, steps=None):
+        self.index = index
+        self.line = line
+        self.prompt = prompt
+        self.width = width
+        self.height = height
+        self.seed = seed
+        self.steps = steps or DEFAULT_NUM_INFERENCE_STEPS
+
+    @property
+    def key(self):
+        # Names the job in the checkpoint journal. The parameters are part
+        # of it so editing a row of a half-finished manifest reruns it.
+        fields = [self.prompt, self.width, self.height, self.seed, self.steps]
+        digest = hashlib.sha256(json.dumps(fields).encode("utf-8")).hexdigest()
+        return f"{self.index}:{digest[:16]}"
+
+
+def _optional_int(row, name, line):
+    value = row.get(name)
+    if value is None or str(value).strip() == "":
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ManifestError(line, f"{name} must be a whole number, not {value!r}")
+
+
+def parse_row(row, index, line):
+    # A ManifestEntry from a JSON object or CSV row with a "prompt" and
+    # optionally "size" ("WxH") or "width" and "height", "seed" and "steps"
+    if not isinstance(row, dict):
+        raise ManifestError(line, "expected an object")
+    prompt = str(row.get("prompt") or "").strip()
+    if not prompt:
+        raise ManifestError(line, "missing prompt")
+    if row.get("size"):
+        try:
+            width, height = map(int, str(row["size"]).lower().split("x"))
+        except ValueError:
+            raise ManifestError(line, f"invalid size {row['size']!r}, expected WxH")
+    else:
+        width = _optional_int(row, "width", line) or DEFAULT_SIZE[0]
+        height = _optional_int(row, "height", line) or DEFAULT_SIZE[1]
+    if not (MIN_SIDE <= width <= MAX_SIDE and MIN_SIDE <= height <= MAX_SIDE):
+        raise ManifestError(
+            line,
+            f"size must be between {MIN_SIDE}x{MIN_SIDE} and {MAX_SIDE}x{MAX_SIDE}",
+        )
+    steps = _optional_int(row, "steps", line)
+    if steps is not None and steps < 1:
+        raise ManifestError(line, "steps must be positive")
+    return ManifestEntry(
+        index, line, prompt, width, height, _optional_int(row, "seed", line), steps
+    )
+
+
+def _jsonl_rows(f):
+    for line_number, line in enumerate(f, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, ManifestError(line_number, f"invalid JSON: {e}")
+
+
+def _csv_rows(f, delimiter):
+    reader = csv.DictReader(f, delimiter=delimiter)
+    for row in reader:
+        if not any((value or "").strip() for value in row.values()):
+            continue
+        yield reader.line_num, row
+
+
+def read_manifest(path, on_error=None):
+    # Yields a ManifestEntry per row of a JSON lines (one object per line)
+    # or CSV (header row first; .tsv for tabs) manifest, one line at a time
+    # so a manifest of any length costs no memory. Bad rows raise
+    # ManifestError, or are passed to on_error(error) and skipped.
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if extension in CSV_EXTENSIONS:
+            rows = _csv_rows(f, "\t" if extension == ".tsv" else ",")
+        else:
+            rows = _jsonl_rows(f)
+        for index, (line_number, row) in enumerate(rows):
+            try:
+                if isinstance(row, ManifestError):
+                    raise row
+                entry = parse_row(row, index, line_number)
+            except ManifestError as e:
+                if on_error is None:
+                    raise
+                on_error(e)
+                continue
+            yield entry
+
+
+class CheckpointJournal:
+    # Append-only log of finished manifest jobs, one JSON line per job,
+    # flushed to disk before the job counts as done. Reopening it on the
+    # same output folder recovers the set of finished jobs, so an
+    # interrupted run resumes where it stopped.
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self._lock = threading.Lock()
+        torn = self._load()
+        self._file = open(path, "a", encoding="utf-8")
+        if torn:
+            self._file.write("\n")  # Never append to a half-written line
+
+    def _load(self):
+        # Reads finished keys; True if the file ends mid-line
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return False
+        for line in data.splitlines():
+            try:
+                self.done.add(json.loads(line)["key"])
+            except (ValueError, KeyError, TypeError):
+                continue  # Cut short by a crash
+        return bool(data) and not data.endswith(b"\n")
+
+    def __contains__(self, key):
+        return key in self.done
+
+    def __len__(self):
+        return len(self.done)
+
+    def record(self, key, output_path=None):
+        line = json.dumps({"key": key, "output": output_path, "ts": time.time()})
+        with self._lock:
+            if self._file.closed:
+                return  # A cancelled job finishing late; it is simply rerun
+            self._file.write(line + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.done.add(key)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def run_manifest(queue, path, window=None, on_error=None):
+    # Streams the manifest's jobs into `queue` (a BatchQueue) with
+    # BatchQueue.submit_all(), skipping those its journal lists as
+    # finished. Returns (submitted, skipped); stops early if the queue is
+    # shut down. Call queue.wait() afterwards to let the last jobs finish.
+    journal = queue.journal
+    skipped = 0
+
+    def jobs():
+        nonlocal skipped
+        for entry in read_manifest(path, on_error):
+            key = entry.key
+            if journal is not None and key in journal:
+                skipped += 1
+                continue
+            yield (
+                entry.prompt,
+                entry.width,
+                entry.height,
+                entry.seed,
+                entry.steps,
+                key,
+                entry.index,
+            )
+
+    submitted = queue.submit_all(jobs(), window)
+    return submitted, skipped
@@ -0,0 +1,346 @@
+# Local stand-in for the image and chat endpoints, for trying the client
+# pipeline and load-testing it without network access or API spend.
+# Generations return synthetic PNGs after a configurable delay, and a
+# configurable share of requests fail with 429/503 or 500.
+#
+#     python -m imagegen.mockserver --latency 2 --jitter 0.5 --error-rate 0.05
+#
+# Then pick "Local mock server" as the provider in Settings, or pass
+# --provider mock to python -m imagegen.
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+from imagegen.providers import MOCK_PORT
+
+
+PALETTE_SIZE = 8  # Distinct tints, so repeated requests reuse encoded PNGs
+PNG_CACHE_SIZE = 64
+
+
+class MockConfig:
+    def __init__(
+        self,
+        latency=1.0,
+        jitter=0.0,
+        image_scale=1.0,
+        error_rate=0.0,
+        rate_limit_rate=0.0,
+        enhance_latency=0.2,
+        enhance_item_latency=0.0,
+        enhance_token_latency=0.0,
+    ):
+        self.latency = latency  # Mean seconds before an image response
+        self.jitter = jitter  # +/- seconds added uniformly at random
+        self.image_scale = image_scale  # Returned size / requested size
+        self.error_rate = error_rate  # Share of requests answered with 500
+        self.rate_limit_rate = rate_limit_rate  # Share answered with 429
+        self.enhance_latency = enhance_latency
+        # Extra seconds per prompt of a batched enhancement, which makes
+        # the model write that much more
+        self.enhance_item_latency = enhance_item_latency
+        # Seconds per word of an enhancement after the first: the gap
+        # between streamed pieces, or added to a whole reply's latency
+        self.enhance_token_latency = enhance_token_latency
+
+
+def synthetic_png(width, height, tint):
+    # A gradient PNG; fast to make and compresses like a flat photo would
+    from PIL import Image
+
+    gradient = Image.linear_gradient("L").resize((width, height))
+    red = gradient.point(lambda v: (v + tint * 31) % 256)
+    green = gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+    blue = Image.new("L", (width, height), (tint * 97) % 256)
+    buffer = BytesIO()
+    Image.merge("RGB", (red, green, blue)).save(buffer, "PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Allow keep-alive like the real API
+    config = MockConfig()
+    stats = {"images": 0, "enhancements": 0, "errors": 0}
+    _pngs = OrderedDict()
+    _lock = threading.Lock()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self.send_json(400, {"error": {"message": "Invalid JSON"}})
+            return
+        if self.path.endswith("/images/generations"):
+            self.generate(payload)
+        elif self.path.endswith("/chat/completions"):
+            self.enhance(payload)
+        else:
+            self.send_json(404, {"error": {"message": f"No route {self.path}"}})
+
+    def do_GET(self):
+        # Only the model list, which clients fetch to warm up a connection
+        if self.path.endswith("/models"):
+            self.send_json(
+                200,
+                {
+                    "object": "list",
+                    "data": [
+                        {"id": "mock/image", "object": "model", "owned_by": "mock"},
+                        {"id": "mock/chat", "object": "model", "owned_by": "mock"},
+                    ],
+                },
+            )
+        else:
+            self.send_json(404, {"error": {"message": f"No route {self.path}"}})
+
+    def generate(self, payload):
+        config = self.config
+        roll = random.random()
+        if roll < config.rate_limit_rate:
+            self.count("errors")
+            self.send_json(
+                429, {"error": {"message": "Rate limited"}}, {"Retry-After": "1"}
+            )
+            return
+        delay = config.latency + random.uniform(-config.jitter, config.jitter)
+        time.sleep(max(0.0, delay))
+        if roll < config.rate_limit_rate + config.error_rate:
+            self.count("errors")
+            self.send_json(500, {"error": {"message": "Synthetic failure"}})
+            return
+
+        width, height = self.requested_size(payload)
+        width = max(1, round(width * config.image_scale))
+        height = max(1, round(height * config.image_scale))
+        seed = payload.get("seed")
+        images = []
+        for index in range(max(1, int(payload.get("n", 1)))):
+            tint = hash((payload.get("prompt"), seed, index)) % PALETTE_SIZE
+            png = self.png(width, height, tint)
+            images.append({"b64_json": base64.b64encode(png).decode("ascii")})
+        self.count("images", len(images))
+        self.send_json(200, {"created": int(time.time()), "data": images})
+
+    def enhance(self, payload):
+        content = payload["messages"][-1]["content"]
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content)
+        prompt = content.rsplit("\n", 1)[-1]
+        if (payload.get("response_format") or {}).get("type") == "json_object":
+            # A batched request: the prompts are a JSON array on the last line
+            items = json.loads(prompt)
+            time.sleep(
+                self.config.enhance_latency
+                + self.config.enhance_item_latency * len(items)
+            )
+            results = [
+                {"id": item["id"], "prompt": f"{item['prompt']}, highly detailed"}
+                for item in items
+            ]
+            replies = [json.dumps({"results": results})]
+        elif payload.get("stream"):
+            self.stream_enhancement(payload, f"{prompt}, highly detailed, variant 1")
+            return
+        else:
+            replies = [
+                f"{prompt}, highly detailed, variant {index + 1}"
+                for index in range(max(1, int(payload.get("n", 1))))
+            ]
+            words = len(replies[0].split())
+            time.sleep(
+                self.config.enhance_latency
+                + self.config.enhance_token_latency * (words - 1)
+            )
+        choices = [
+            {
+                "index": index,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": reply},
+            }
+            for index, reply in enumerate(replies)
+        ]
+        self.count("enhancements")
+        self.send_json(
+            200,
+            {
+                "id": "mock",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": payload.get("model", "mock/chat"),
+                "choices": choices,
+            },
+        )
+
+    def stream_enhancement(self, payload, reply):
+        # Server-sent events, one word per chunk, as stream=True returns
+        time.sleep(self.config.enhance_latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        words = reply.split(" ")
+        try:
+            self.send_words(payload, words)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # The client stopped reading
+            return
+        self.count("enhancements")
+
+    def send_words(self, payload, words):
+        for index, word in enumerate(words):
+            if index:
+                time.sleep(self.config.enhance_token_latency)
+            chunk = {
+                "id": "mock",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": payload.get("model", "mock/chat"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {"content": word if not index else " " + word},
+                        "finish_reason": "stop" if index == len(words) - 1 else None,
+                    }
+                ],
+            }
+            self.send_chunk(f"data: {json.dumps(chunk)}\n\n")
+        self.send_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def send_chunk(self, text):
+        data = text.encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    @staticmethod
+    def requested_size(payload):
+        if "size" in payload:
+            width, height = map(int, str(payload["size"]).lower().split("x"))
+            return width, height
+        return int(payload.get("width", 1024)), int(payload.get("height", 1024))
+
+    @classmethod
+    def png(cls, width, height, tint):
+        key = (width, height, tint)
+        with cls._lock:
+            png = cls._pngs.pop(key, None)
+        if png is None:
+            png = synthetic_png(width, height, tint)
+        with cls._lock:
+            cls._pngs[key] = png
+            while len(cls._pngs) > PNG_CACHE_SIZE:
+                cls._pngs.popitem(last=False)
+        return png
+
+    @classmethod
+    def count(cls, name, amount=1):
+        with cls._lock:
+            cls.stats[name] += amount
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_mock_server(config=None, host="127.0.0.1", port=0):
+    # Serves on a daemon thread and returns the server; its base URL is
+    # f"http://{host}:{server.server_address[1]}/v1". Port 0 picks a free one.
+    handler = type("ConfiguredMockHandler", (MockHandler,), {})
+    handler.config = config or MockConfig()
+    handler.stats = {"images": 0, "enhancements": 0, "errors": 0}
+    handler._pngs = OrderedDict()
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m imagegen.mockserver",
+        description="Serve synthetic images and prompt enhancements locally.",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=MOCK_PORT)
+    parser.add_argument(
+        "--latency", type=float, default=1.0, help="seconds per generation"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.0, help="random +/- seconds per generation"
+    )
+    parser.add_argument(
+        "--image-scale",
+        type=float,
+        default=1.0,
+        help="returned image size as a fraction of the requested size",
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="share of 500 responses"
+    )
+    parser.add_argument(
+        "--rate-limit-rate", type=float, default=0.0, help="share of 429 responses"
+    )
+    parser.add_argument(
+        "--enhance-latency",
+        type=float,
+        default=0.2,
+        help="seconds per prompt enhancement",
+    )
+    parser.add_argument(
+        "--enhance-item-latency",
+        type=float,
+        default=0.0,
+        help="extra seconds per prompt of a batched enhancement",
+    )
+    parser.add_argument(
+        "--enhance-token-latency",
+        type=float,
+        default=0.0,
+        help="seconds per word of an enhancement, streamed or not",
+    )
+    args = parser.parse_args(argv)
+
+    config = MockConfig(
+        args.latency,
+        args.jitter,
+        args.image_scale,
+        args.error_rate,
+        args.rate_limit_rate,
+        args.enhance_latency,
+        args.enhance_item_latency,
+        args.enhance_token_latency,
+    )
+    server = start_mock_server(config, args.host, args.port)
+    print(f"Mock API on http://{args.host}:{server.server_address[1]}/v1")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    server.shutdown()
+    stats = server.RequestHandlerClass.stats
+    print(
+        f"{stats['images']} images, {stats['enhancements']} enhancements, "
+        f"{stats['errors']} errors"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,5 @@
+from pathlib import Path
+
+
+# Per-user folder for caches and other app data
+DATA_DIR = Path.home() / ".ai_image_generator"
@@ -0,0 +1,242 @@
+import math
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, wait
+from io import BytesIO
+
+from imagegen.export import DEFAULT_QUALITY, FORMATS, encode_pil_image
+
+
+UPSCALE_FACTORS = (1.0, 1.5, 2.0, 3.0, 4.0)
+MAX_SCALE = 4.0
+MAX_OUTPUT_SIDE = 8192
+DEFAULT_TILE_SIZE = 1024  # Output pixels per tile side
+SHARPEN_RADIUS = 2.0  # Unsharp mask radius in output pixels
+SHARPEN_THRESHOLD = 3
+LANCZOS_SUPPORT = 3  # Lanczos-3 reads three source pixels either side
+# Images no larger than this many output pixels are processed in the
+# calling process; below it a pool round trip costs more than it saves
+POOL_THRESHOLD = DEFAULT_TILE_SIZE * DEFAULT_TILE_SIZE
+
+
+class PostProcess:
+    # Local processing applied to generated images: Lanczos upscale by
+    # `scale`, then unsharp-mask sharpening of `sharpen` strength (0 off,
+    # 1 moderate, 2 strong), then encoding as `fmt` (a key of
+    # imagegen.export.FORMATS). Upscaling here is far cheaper than asking
+    # the API for a larger render, and goes past its 2048 px limit.
+
+    def __init__(
+        self,
+        scale=1.0,
+        sharpen=0.0,
+        fmt="png",
+        quality=DEFAULT_QUALITY,
+        png_compression=None,
+        tile_size=DEFAULT_TILE_SIZE,
+    ):
+        if not 1.0 <= scale <= MAX_SCALE:
+            raise ValueError(f"scale must be between 1 and {MAX_SCALE:g}")
+        if sharpen < 0:
+            raise ValueError("sharpen must not be negative")
+        if fmt not in FORMATS:
+            raise ValueError(f"unknown format {fmt!r}")
+        self.scale = scale
+        self.sharpen = sharpen
+        self.fmt = fmt
+        self.quality = quality
+        self.png_compression = png_compression
+        self.tile_size = tile_size
+
+    @property
+    def is_noop(self):
+        # True when apply() would hand back PNG bytes unchanged
+        return self.scale == 1.0 and not self.sharpen and self.fmt == "png"
+
+    @property
+    def extension(self):
+        return FORMATS[self.fmt][1][0]
+
+    def output_size(self, width, height):
+        return (
+            min(MAX_OUTPUT_SIDE, round(width * self.scale)),
+            min(MAX_OUTPUT_SIDE, round(height * self.scale)),
+        )
+
+    def apply(self, image_data, executor=None):
+        # Returns the processed image encoded as self.fmt. Slow for large
+        # outputs, so call it off the GUI thread. Big images are cut into
+        # tiles that run on `executor` (the shared process pool by
+        # default), so peak memory is the output plus a few tiles rather
+        # than several full-size intermediates.
+        if self.is_noop:
+            return image_data
+        from PIL import Image
+
+        source = Image.open(BytesIO(image_data))
+        if source.mode not in ("RGB", "RGBA"):
+            source = source.convert("RGBA" if "A" in source.getbands() else "RGB")
+        width, height = self.output_size(*source.size)
+        if (width, height) != source.size or self.sharpen:
+            if width * height <= POOL_THRESHOLD:
+                image = process_region(source, (width, height), self.sharpen)
+            else:
+                image = resize_tiled(
+                    source,
+                    (width, height),
+                    self.sharpen,
+                    self.tile_size,
+                    executor or get_process_pool(),
+                )
+        else:
+            image = source
+        return encode_pil_image(image, self.fmt, self.quality, self.png_compression)
+
+
+def sharpen_margin(sharpen):
+    # Output pixels either side of a tile that its unsharp mask reads
+    return math.ceil(SHARPEN_RADIUS * 3) + 1 if sharpen else 0
+
+
+def process_region(source, size, sharpen, box=None, region=None):
+    # Resizes `source` (a PIL image) to `size` output pixels with Lanczos,
+    # optionally only the part of the output inside `region` = (left, top,
+    # right, bottom), reading the source pixels inside `box`. Returns a PIL
+    # image of the region, sharpened when `sharpen` is set.
+    from PIL import Image, ImageFilter
+
+    region = region or (0, 0, *size)
+    box = box or (0, 0, *source.size)
+    image = source.resize(
+        (region[2] - region[0], region[3] - region[1]), Image.LANCZOS, box=box
+    )
+    if sharpen:
+        image = image.filter(
+            ImageFilter.UnsharpMask(
+                SHARPEN_RADIUS, round(sharpen * 100), SHARPEN_THRESHOLD
+            )
+        )
+    return image
+
+
+def _process_tile(mode, crop_size, crop_pixels, box, region, trim, sharpen):
+    # Runs in a pool worker: rebuilds the source crop, resizes and sharpens
+    # the tile plus its margin, and returns the tile without the margin as
+    # raw pixels
+    from PIL import Image
+
+    crop = Image.frombytes(mode, crop_size, crop_pixels)
+    tile = process_region(crop, None, sharpen, box, region)
+    left, top, right, bottom = trim
+    return tile.crop((left, top, tile.width - right, tile.height - bottom)).tobytes()
+
+
+def _tiles(width, height, tile_size):
+    for top in range(0, height, tile_size):
+        for left in range(0, width, tile_size):
+            yield left, top, min(left + tile_size, width), min(top + tile_size, height)
+
+
+def resize_tiled(source, size, sharpen, tile_size, executor):
+    # process_region() for the whole image, one output tile per task. Each
+    # task gets only the source pixels its tile reads (Lanczos support plus
+    # the sharpening margin), and at most two tasks per worker are in
+    # flight, so neither the workers nor the queue ever hold a full-size
+    # copy. Matches the untiled result up to rounding at tile seams.
+    from PIL import Image
+
+    width, height = size
+    scale_x, scale_y = width / source.width, height / source.height
+    margin = sharpen_margin(sharpen)
+    output = Image.new(source.mode, size)
+
+    def task(tile):
+        left, top, right, bottom = tile
+        # The tile grown by the sharpening margin, within the image
+        region = (
+            max(0, left - margin),
+            max(0, top - margin),
+            min(width, right + margin),
+            min(height, bottom + margin),
+        )
+        box = (
+            region[0] / scale_x,
+            region[1] / scale_y,
+            region[2] / scale_x,
+            region[3] / scale_y,
+        )
+        # Source pixels the Lanczos kernel reads for that box
+        support_x = LANCZOS_SUPPORT * max(1.0, 1 / scale_x) + 1
+        support_y = LANCZOS_SUPPORT * max(1.0, 1 / scale_y) + 1
+        crop = (
+            max(0, math.floor(box[0] - support_x)),
+            max(0, math.floor(box[1] - support_y)),
+            min(source.width, math.ceil(box[2] + support_x)),
+            min(source.height, math.ceil(box[3] + support_y)),
+        )
+        pixels = source.crop(crop)
+        local_box = (
+            box[0] - crop[0],
+            box[1] - crop[1],
+            box[2] - crop[0],
+            box[3] - crop[1],
+        )
+        local_region = (0, 0, region[2] - region[0], region[3] - region[1])
+        trim = (
+            left - region[0],
+            top - region[1],
+            region[2] - right,
+            region[3] - bottom,
+        )
+        return executor.submit(
+            _process_tile,
+            source.mode,
+            pixels.size,
+            pixels.tobytes(),
+            local_box,
+            local_region,
+            trim,
+            sharpen,
+        )
+
+    max_pending = 2 * (getattr(executor, "_max_workers", None) or 1)
+    pending = {}
+    tiles = iter(_tiles(width, height, tile_size))
+    while True:
+        for tile in tiles:
+            pending[task(tile)] = tile
+            if len(pending) >= max_pending:
+                break
+        if not pending:
+            return output
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            left, top, right, bottom = pending.pop(future)
+            output.paste(
+                Image.frombytes(
+                    source.mode, (right - left, bottom - top), future.result()
+                ),
+                (left, top),
+            )
+
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def get_process_pool():
+    # Shared pool for CPU-heavy image work, which keeps its large
+    # temporary buffers out of the calling process. Workers are spawned
+    # rather than forked: forking a process that runs Qt or other threads
+    # is unsafe.
+    global _process_pool
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 4,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _process_pool
@@ -0,0 +1,163 @@
+import threading
+
+from imagegen.cache import cache_key
+from imagegen.stream import IMAGE_ARRAY_KEYS, IMAGE_KEYS, ImageStreamParser
+
+
+NEBIUS_BASE_URL = "https://api.studio.nebius.com/v1"
+IMAGE_MODEL = "black-forest-labs/flux-dev"
+ENHANCE_MODEL = "microsoft/phi-4"
+DEFAULT_NEGATIVE_PROMPT = "blurry, distorted"
+MOCK_PORT = 8765  # Where `python -m imagegen.mockserver` listens by default
+DEFAULT_PROVIDER = "nebius"
+
+
+def nebius_payload(provider, prompt, width, height, seed, steps, count):
+    data = {
+        "model": provider.image_model,
+        "prompt": prompt,
+        "width": width,
+        "height": height,
+        "response_extension": "png",
+        "num_inference_steps": steps,
+        "negative_prompt": DEFAULT_NEGATIVE_PROMPT,
+    }
+    if seed is not None:
+        data["seed"] = seed
+    if count > 1:
+        # Left out for single images so existing cache keys stay valid
+        data["n"] = count
+    return data
+
+
+def openai_payload(provider, prompt, width, height, seed, steps, count):
+    # OpenAI's images API takes a size string and has no seed or step count
+    data = {
+        "model": provider.image_model,
+        "prompt": prompt,
+        "size": f"{width}x{height}",
+    }
+    if count > 1:
+        data["n"] = count
+    return data
+
+
+class Provider:
+    # Everything that differs between image APIs: where requests go, which
+    # models they name, how the generation payload is built and which JSON
+    # fields hold the images in the response. Image requests go to
+    # <base_url>/images/generations and enhancement to the OpenAI-compatible
+    # <base_url>/chat/completions.
+
+    def __init__(
+        self,
+        name,
+        label,
+        base_url,
+        image_model,
+        enhance_model,
+        payload_builder=nebius_payload,
+        image_keys=IMAGE_KEYS,
+        image_array_keys=IMAGE_ARRAY_KEYS,
+        requires_key=True,
+    ):
+        self.name = name
+        self.label = label
+        self.base_url = base_url.rstrip("/")
+        self.image_model = image_model
+        self.enhance_model = enhance_model
+        self.payload_builder = payload_builder
+        self.image_keys = image_keys
+        self.image_array_keys = image_array_keys
+        self.requires_key = requires_key
+
+    @property
+    def image_url(self):
+        return f"{self.base_url}/images/generations"
+
+    def build_payload(self, prompt, width, height, seed=None, steps=None, count=1):
+        return self.payload_builder(self, prompt, width, height, seed, steps, count)
+
+    def new_parser(self):
+        return ImageStreamParser(
+            image_keys=self.image_keys, image_array_keys=self.image_array_keys
+        )
+
+    def cache_key(self, payload):
+        # Nebius keys predate providers and are kept as they were; any other
+        # provider's results are kept apart even when model names collide
+        if self.name == DEFAULT_PROVIDER:
+            return cache_key(payload)
+        return cache_key({**payload, "provider": self.name, "url": self.base_url})
+
+    def with_overrides(self, base_url=None, image_model=None, enhance_model=None):
+        # Copy of this provider with any non-empty setting replaced
+        return Provider(
+            self.name,
+            self.label,
+            base_url or self.base_url,
+            image_model or self.image_model,
+            enhance_model or self.enhance_model,
+            self.payload_builder,
+            self.image_keys,
+            self.image_array_keys,
+            self.requires_key,
+        )
+
+
+PROVIDERS = {}
+
+
+def register_provider(provider):
+    # Adds or replaces a provider by name
+    PROVIDERS[provider.name] = provider
+    return provider
+
+
+register_provider(
+    Provider("nebius", "Nebius AI Studio", NEBIUS_BASE_URL, IMAGE_MODEL, ENHANCE_MODEL)
+)
+register_provider(
+    Provider(
+        "openai",
+        "OpenAI-compatible",
+        "https://api.openai.com/v1",
+        "gpt-image-1",
+        "gpt-4o-mini",
+        payload_builder=openai_payload,
+    )
+)
+register_provider(
+    Provider(
+        "mock",
+        "Local mock server",
+        f"http://127.0.0.1:{MOCK_PORT}/v1",
+        "mock/image",
+        "mock/chat",
+        requires_key=False,
+    )
+)
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def configure_provider(
+    name=DEFAULT_PROVIDER, base_url=None, image_model=None, enhance_model=None
+):
+    # Makes the named provider, with any overrides, the one every request
+    # uses; raises KeyError for an unknown name
+    global _provider
+    provider = PROVIDERS[name].with_overrides(base_url, image_model, enhance_model)
+    with _provider_lock:
+        _provider = provider
+        return _provider
+
+
+def get_provider():
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = PROVIDERS[DEFAULT_PROVIDER]
+        return _provider
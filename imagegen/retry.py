@@ -0,0 +1,109 @@
+import random
+import threading
+import time
+
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 30.0
+DEFAULT_RETRY_AFTER = 1.0  # Used when a 429 carries no usable Retry-After
+# Statuses worth another try: rate limiting and server-side hiccups
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+# Of those, the ones where the server did not start working on the request,
+# so repeating it is safe even when it is not idempotent
+SAFE_RETRY_STATUSES = frozenset({429, 503})
+
+# Failure kinds reported by the transport-specific classifiers
+SAFE = "safe"  # The request never reached the server, e.g. connect failed
+UNSAFE = "unsafe"  # It may have been processed, e.g. a read timeout
+
+
+def parse_retry_after(value, default=DEFAULT_RETRY_AFTER):
+    # Retry-After is either a number of seconds or an HTTP date
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    import email.utils  # Slow to import and rarely needed
+
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class RetryPolicy:
+    # Decides whether and when to repeat a failed request. Delays grow
+    # exponentially from base_delay up to max_delay with "full jitter"
+    # (a random delay between zero and the cap) so that clients failing
+    # together do not retry together. Failures that happen after the
+    # request may have been processed are only retried for idempotent
+    # requests.
+    #
+    # hedge_after (seconds) enables hedged requests: when an idempotent
+    # request has not answered by then, a duplicate is sent and whichever
+    # finishes first wins.
+
+    def __init__(
+        self,
+        max_attempts=DEFAULT_MAX_ATTEMPTS,
+        base_delay=DEFAULT_BASE_DELAY,
+        max_delay=DEFAULT_MAX_DELAY,
+        hedge_after=None,
+    ):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_after = hedge_after or None
+        self.stats = {"retries": 0, "hedges": 0, "hedge_wins": 0}
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def delay(self, attempt, retry_after=None):
+        # Seconds to wait before retry number `attempt` (1 for the first)
+        cap = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        delay = random.uniform(0, cap)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def should_retry_status(self, status_code, attempt, idempotent):
+        if attempt >= self.max_attempts or status_code not in RETRY_STATUSES:
+            return False
+        return idempotent or status_code in SAFE_RETRY_STATUSES
+
+    def should_retry_failure(self, kind, attempt, idempotent):
+        # `kind` is SAFE, UNSAFE or None for errors that will not go away
+        if attempt >= self.max_attempts or kind is None:
+            return False
+        return kind == SAFE or idempotent
+
+
+_policy = None
+_policy_lock = threading.Lock()
+
+
+def configure_retry_policy(
+    max_attempts=DEFAULT_MAX_ATTEMPTS,
+    base_delay=DEFAULT_BASE_DELAY,
+    max_delay=DEFAULT_MAX_DELAY,
+    hedge_after=None,
+):
+    global _policy
+    with _policy_lock:
+        _policy = RetryPolicy(max_attempts, base_delay, max_delay, hedge_after)
+        return _policy
+
+
+def get_retry_policy():
+    global _policy
+    with _policy_lock:
+        if _policy is None:
+            _policy = RetryPolicy()
+        return _policy
@@ -0,0 +1,327 @@
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from imagegen.trace import current_trace
+
+
+# Defaults for the process-wide HTTP session
+DEFAULT_POOL_CONNECTIONS = 4  # Number of distinct hosts kept in the pool
+DEFAULT_POOL_MAXSIZE = 16  # Keep-alive connections kept per host
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 300.0  # Large renders can take minutes server-side
+
+_lock = threading.Lock()
+_session = None
+_pool_config = (DEFAULT_POOL_CONNECTIONS, DEFAULT_POOL_MAXSIZE)
+_timeout = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)
+_local = threading.local()
+_adapter_class = None
+
+
+class Cancelled(Exception):
+    pass
+
+
+class CancelToken:
+    # Cancels the requests made inside `with cancellable(token):` on the
+    # shared session. cancel() may be called from any thread; it shuts down
+    # the sockets those requests are using, so a blocked read fails at once
+    # instead of waiting for the server.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._connections = set()
+        self._children = []
+        self._callbacks = []
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled = True
+            connections = list(self._connections)
+            children = list(self._children)
+            callbacks, self._callbacks = self._callbacks, []
+        self._event.set()
+        for conn in connections:
+            _abort_connection(conn)
+        for child in children:
+            child.cancel()
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback):
+        # Calls callback() from cancel(), or at once if already cancelled,
+        # for work this token cannot abort by itself. Returns a function
+        # that unregisters it.
+        with self._lock:
+            cancelled = self._cancelled
+            if not cancelled:
+                self._callbacks.append(callback)
+        if cancelled:
+            callback()
+
+        def remove():
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+
+        return remove
+
+    def child(self):
+        # A token of its own that is also cancelled along with this one
+        child = CancelToken()
+        with self._lock:
+            self._children.append(child)
+            cancelled = self._cancelled
+        if cancelled:
+            child.cancel()
+        return child
+
+    def wait(self, timeout):
+        # Sleeps up to `timeout` seconds; True if cancelled meanwhile
+        return self._event.wait(timeout)
+
+    def raise_if_cancelled(self):
+        if self._cancelled:
+            raise Cancelled()
+
+    def _attach(self, conn):
+        with self._lock:
+            self._connections.add(conn)
+            cancelled = self._cancelled
+        if cancelled:
+            _abort_connection(conn)
+
+    def _detach(self, conn):
+        with self._lock:
+            self._connections.discard(conn)
+
+
+def _abort_connection(conn):
+    sock = getattr(conn, "sock", None)
+    if sock is None:
+        return  # Not connected yet; the connect hook checks the token
+    abort_socket(sock)
+
+
+def abort_socket(sock):
+    # Shutting down, unlike closing, also wakes a thread blocked reading it
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+@contextmanager
+def cancellable(token):
+    # Requests made by this thread inside the block can be aborted through
+    # `token`. A None token makes the block a no-op.
+    previous = getattr(_local, "token", None)
+    _local.token = token
+    try:
+        yield token
+    finally:
+        _local.token = previous
+
+
+def _get_adapter_class():
+    # Built on first use so importing this module does not import requests
+    global _adapter_class
+    if _adapter_class is not None:
+        return _adapter_class
+
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+    from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+    from urllib3.util.connection import allowed_gai_family
+
+    def tracked_connection(base):
+        uses_tls = issubclass(base, HTTPSConnection)
+
+        class TrackedConnection(base):
+            _cancel_token = None
+            _socket_seconds = 0.0
+
+            def _new_conn(self):
+                trace = current_trace()
+                if trace is None:
+                    return super()._new_conn()
+                # Resolve the host here to time DNS, then connect to the
+                # addresses found in turn, as urllib3 would. Numeric
+                # addresses need no second lookup, so what remains is the
+                # TCP handshake.
+                start = time.perf_counter()
+                try:
+                    addresses = socket.getaddrinfo(
+                        self._dns_host,
+                        self.port,
+                        allowed_gai_family(),
+                        socket.SOCK_STREAM,
+                    )
+                except OSError:
+                    return super()._new_conn()  # Reports the failure properly
+                resolved = time.perf_counter()
+                trace.add("dns", resolved - start)
+                host = self._dns_host
+                try:
+                    for index, address in enumerate(addresses):
+                        # Only for the socket: self.host, which TLS checks
+                        # the certificate against, reads _dns_host too
+                        self._dns_host = address[4][0]
+                        try:
+                            sock = super()._new_conn()
+                            break
+                        except (ConnectTimeoutError, NewConnectionError):
+                            if index == len(addresses) - 1:
+                                raise
+                finally:
+                    self._dns_host = host
+                connected = time.perf_counter()
+                trace.add("connect", connected - resolved)
+                self._socket_seconds = connected - start
+                return sock
+
+            def connect(self):
+                start = time.perf_counter()
+                super().connect()
+                trace = current_trace()
+                if trace is not None and uses_tls:
+                    trace.add("tls", time.perf_counter() - start - self._socket_seconds)
+                token = self._cancel_token
+                if token is not None and token.cancelled:
+                    _abort_connection(self)
+
+        return TrackedConnection
+
+    def tracked_pool(base):
+        class TrackedPool(base):
+            ConnectionCls = tracked_connection(base.ConnectionCls)
+
+            def _get_conn(self, timeout=None):
+                conn = super()._get_conn(timeout)
+                token = getattr(_local, "token", None)
+                conn._cancel_token = token
+                if token is not None:
+                    token._attach(conn)
+                return conn
+
+            def _put_conn(self, conn):
+                token = getattr(conn, "_cancel_token", None)
+                if token is not None:
+                    token._detach(conn)
+                    conn._cancel_token = None
+                super()._put_conn(conn)
+
+        return TrackedPool
+
+    http_pool = tracked_pool(HTTPConnectionPool)
+    https_pool = tracked_pool(HTTPSConnectionPool)
+
+    class CancellableAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                "http": http_pool,
+                "https": https_pool,
+            }
+
+    _adapter_class = CancellableAdapter
+    return _adapter_class
+
+
+def _build_session(pool_connections, pool_maxsize):
+    # Imported here so headless tools only pay for requests when they use it
+    import requests
+
+    session = requests.Session()
+    adapter = _get_adapter_class()(
+        pool_connections=pool_connections, pool_maxsize=pool_maxsize
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Connection"] = "keep-alive"
+    return session
+
+
+def configure_session(
+    pool_connections=DEFAULT_POOL_CONNECTIONS,
+    pool_maxsize=DEFAULT_POOL_MAXSIZE,
+    connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+    read_timeout=DEFAULT_READ_TIMEOUT,
+):
+    # Swap in a freshly configured session. Requests already running on the
+    # old session finish normally; its idle connections are closed.
+    global _session, _pool_config, _timeout
+    session = _build_session(pool_connections, pool_maxsize)
+    with _lock:
+        old_session, _session = _session, session
+        _pool_config = (pool_connections, pool_maxsize)
+        _timeout = (connect_timeout, read_timeout)
+    if old_session is not None:
+        old_session.close()
+    return session
+
+
+def get_session():
+    global _session
+    with _lock:
+        if _session is None:
+            _session = _build_session(*_pool_config)
+        return _session
+
+
+def ensure_pool_size(pool_maxsize):
+    # Grow the per-host pool so `pool_maxsize` concurrent requests can all
+    # reuse keep-alive connections; never shrinks and keeps the timeouts.
+    pool_connections, current_maxsize = _pool_config
+    if pool_maxsize > current_maxsize:
+        configure_session(pool_connections, pool_maxsize, *_timeout)
+
+
+def preconnect(url):
+    # Opens a keep-alive connection to the host of `url` and leaves it idle
+    # in the shared session's pool, so the first real request to it skips
+    # DNS, TCP and TLS setup. Returns False if the pool already had one.
+    import requests
+
+    session = get_session()
+    settings = session.merge_environment_settings(url, {}, None, None, None)
+    request = requests.Request("POST", url).prepare()
+    # The pool requests itself would pick for this URL, TLS settings and
+    # proxy included; any other pool's connections would never be used
+    pool = session.get_adapter(url).get_connection_with_tls_context(
+        request, settings["verify"], settings["proxies"], settings["cert"]
+    )
+    conn = pool._get_conn(timeout=_timeout[0])
+    try:
+        if conn.is_connected:
+            return False
+        conn.timeout = _timeout[0]
+        conn.connect()
+    except BaseException:
+        conn.close()
+        raise
+    finally:
+        pool._put_conn(conn)
+    return True
+
+
+def get_timeout():
+    # (connect, read) tuple suitable for the requests `timeout` argument
+    return _timeout
+
+
+def close_session():
+    global _session
+    with _lock:
+        old_session, _session = _session, None
+    if old_session is not None:
+        old_session.close()
@@ -0,0 +1,78 @@
+import threading
+
+from imagegen.session import Cancelled
+
+
+WAIT_POLL_INTERVAL = 0.1  # Seconds between a waiter's cancellation checks
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    # Coalesces concurrent identical work: while a call for a key is running,
+    # callers with the same key wait for it and all receive its result
+    # instead of starting their own. The first caller (the leader) runs the
+    # function on its own thread. Nothing is remembered afterwards; the
+    # result cache does that.
+    #
+    # A waiter that cancels stops waiting at once. If the leader is
+    # cancelled, its waiters start over and one of them leads a new call.
+
+    def __init__(self):
+        self.stats = {"calls": 0, "coalesced": 0}
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def do(self, key, function, cancel_token=None):
+        # Returns (result, shared) where shared is True if another caller's
+        # call produced the result
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                    self.stats["calls"] += 1
+            if leader:
+                try:
+                    call.result = function()
+                except BaseException as e:
+                    call.error = e
+                    raise
+                finally:
+                    with self._lock:
+                        del self._calls[key]
+                    call.done.set()
+                return call.result, False
+
+            while not call.done.wait(WAIT_POLL_INTERVAL):
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+            if isinstance(call.error, Cancelled):
+                continue  # Only the leader gave up; try again
+            if call.error is not None:
+                raise call.error
+            with self._lock:
+                self.stats["coalesced"] += 1
+            return call.result, True
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight():
+    global _single_flight
+    with _single_flight_lock:
+        if _single_flight is None:
+            _single_flight = SingleFlight()
+        return _single_flight
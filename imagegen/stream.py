@@ -0,0 +1,200 @@
+import base64
+import binascii
+import json
+import time
+from io import BytesIO
+
+
+STREAM_CHUNK_SIZE = 64 * 1024
+LOG_LIMIT = 2000  # Characters of a response body worth printing
+
+# String values decoded as images: {"b64_json": ...}, {"image": ...} and
+# every string inside an "images" array
+IMAGE_KEYS = {"b64_json", "image"}
+IMAGE_ARRAY_KEYS = {"images"}
+
+# Escapes that can appear inside a base64 string in JSON
+_B64_ESCAPES = {ord("/"): b"/", ord("n"): b"", ord("r"): b"", ord("t"): b""}
+_PREFIX_PROBE = 256  # Bytes buffered to spot a data:image/...;base64, prefix
+
+
+def log_preview(text, limit=LOG_LIMIT):
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... ({len(text) - limit} more characters)"
+
+
+class _Container:
+    def __init__(self, kind, key):
+        self.kind = kind  # "{" or "["
+        self.key = key  # Current key in an object, parent key for an array
+        self.expect_key = kind == "{"
+
+
+class ImageStreamParser:
+    # Incremental JSON scanner for image responses. Image strings are
+    # base64-decoded in chunks straight into sinks as bytes arrive, so they
+    # are never held whole in memory; everything else is kept as a small
+    # "skeleton" document in which each image is replaced by a placeholder.
+    #
+    #     parser = ImageStreamParser()
+    #     for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+    #         parser.feed(chunk)
+    #     parser.images  # one sink (BytesIO by default) per image string
+
+    def __init__(
+        self,
+        sink_factory=BytesIO,
+        image_keys=IMAGE_KEYS,
+        image_array_keys=IMAGE_ARRAY_KEYS,
+    ):
+        self.sink_factory = sink_factory
+        self.image_keys = image_keys
+        self.image_array_keys = image_array_keys
+        self.images = []
+        self.bytes_received = 0
+        self.decode_seconds = 0.0  # Time spent in base64 decoding
+        self._skeleton = bytearray()
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._role = None  # "key", "value" or "image" for the open string
+        self._string = bytearray()
+        self._b64 = bytearray()
+        self._prefix_checked = False
+        self._sink = None
+        self._decoded = 0
+        self._failed = False
+
+    def feed(self, chunk):
+        self.bytes_received += len(chunk)
+        i, n = 0, len(chunk)
+        while i < n:
+            if self._in_string:
+                i = self._feed_string(chunk, i, n)
+                continue
+            c = chunk[i]
+            i += 1
+            if c == 0x22:  # "
+                self._start_string()
+                continue
+            top = self._stack[-1] if self._stack else None
+            if c == 0x7B or c == 0x5B:  # { [
+                key = top.key if top else None
+                self._stack.append(_Container(chr(c), key))
+            elif c == 0x7D or c == 0x5D:  # } ]
+                if self._stack:
+                    self._stack.pop()
+            elif c == 0x2C and top and top.kind == "{":  # ,
+                top.expect_key = True
+            self._skeleton.append(c)
+
+    def _start_string(self):
+        self._in_string = True
+        top = self._stack[-1] if self._stack else None
+        self._string.clear()
+        if top and top.kind == "{" and top.expect_key:
+            self._role = "key"
+        elif top and (
+            (top.kind == "{" and top.key in self.image_keys)
+            or (top.kind == "[" and top.key in self.image_array_keys)
+        ):
+            self._role = "image"
+            self._b64.clear()
+            self._prefix_checked = False
+            self._decoded = 0
+            self._failed = False
+            self._sink = self.sink_factory()
+        else:
+            self._role = "value"
+
+    def _feed_string(self, chunk, i, n):
+        if self._escape:
+            self._escape = False
+            c = chunk[i]
+            if self._role == "image":
+                self._write_b64(_B64_ESCAPES.get(c, bytes((c,))))
+            else:
+                self._string += b"\\" + bytes((c,))
+            return i + 1
+
+        quote = chunk.find(b'"', i)
+        backslash = chunk.find(b"\\", i, quote if quote != -1 else n)
+        end = backslash if backslash != -1 else quote if quote != -1 else n
+        if self._role == "image":
+            self._write_b64(chunk[i:end])
+        else:
+            self._string += chunk[i:end]
+        if end == n:
+            return n
+        if end == backslash:
+            self._escape = True
+        else:
+            self._end_string()
+        return end + 1
+
+    def _end_string(self):
+        self._in_string = False
+        top = self._stack[-1] if self._stack else None
+        if self._role == "image":
+            self._finish_image()
+            placeholder = f"<{self._decoded} image bytes>"
+            self._skeleton += json.dumps(placeholder).encode()
+            return
+        self._skeleton += b'"' + self._string + b'"'
+        if self._role == "key":
+            top.key = json.loads(b'"' + self._string + b'"')
+            top.expect_key = False
+
+    def _write_b64(self, data):
+        if self._failed:
+            return
+        self._b64 += data
+        if not self._prefix_checked:
+            if len(self._b64) < _PREFIX_PROBE:
+                return
+            self._strip_data_uri_prefix()
+        usable = len(self._b64) - len(self._b64) % 4
+        if usable:
+            self._decode(self._b64[:usable])
+            del self._b64[:usable]
+
+    def _strip_data_uri_prefix(self):
+        self._prefix_checked = True
+        if self._b64.startswith(b"data:"):
+            comma = self._b64.find(b",")
+            if comma != -1:
+                del self._b64[: comma + 1]
+
+    def _decode(self, data):
+        start = time.perf_counter()
+        try:
+            decoded = base64.b64decode(bytes(data))
+        except (binascii.Error, ValueError) as e:
+            print(f"Failed to decode image field: {e}")
+            self._failed = True
+            return
+        finally:
+            self.decode_seconds += time.perf_counter() - start
+        self._sink.write(decoded)
+        self._decoded += len(decoded)
+
+    def _finish_image(self):
+        if not self._prefix_checked:
+            self._strip_data_uri_prefix()
+        if self._b64 and not self._failed:
+            # Tolerate missing padding on the final group
+            self._decode(self._b64 + b"=" * (-len(self._b64) % 4))
+        self._b64.clear()
+        if not self._failed and self._decoded:
+            self.images.append(self._sink)
+        elif hasattr(self._sink, "close"):
+            self._sink.close()
+        self._sink = None
+
+    def skeleton_text(self):
+        return self._skeleton.decode("utf-8", errors="replace")
+
+    def skeleton_json(self):
+        # Raises json.JSONDecodeError when the body was not JSON
+        return json.loads(self._skeleton)
@@ -0,0 +1,243 @@
+import bisect
+import hashlib
+import os
+import random
+import re
+
+from imagegen.paths import DATA_DIR
+
+
+DEFAULT_WILDCARD_DIR = DATA_DIR / "wildcards"
+MAX_WILDCARD_DEPTH = 8  # Wildcard files may use wildcards, this deep
+WILDCARD_PATTERN = re.compile(r"__([\w./-]+?)__")
+
+
+class TemplateError(ValueError):
+    pass
+
+
+# A parsed template is a tree of three kinds of node, each of which knows
+# how many prompts it expands to and can render the i-th of them without
+# producing the others. That is what lets a template with millions of
+# combinations be counted, sampled and sharded in constant memory.
+
+
+class _Literal:
+    count = 1
+
+    def __init__(self, text):
+        self.text = text
+
+    def render(self, index):
+        return self.text
+
+
+class _Sequence:
+    # Parts one after another; the last part varies fastest
+    def __init__(self, parts):
+        self.parts = parts
+        self.count = 1
+        for part in parts:
+            self.count *= part.count
+
+    def render(self, index):
+        pieces = []
+        for part in reversed(self.parts):
+            index, part_index = divmod(index, part.count)
+            pieces.append(part.render(part_index))
+        return "".join(reversed(pieces))
+
+
+class _Choice:
+    # One of several options, each of which may expand further
+    def __init__(self, options):
+        self.options = options
+        self.offsets = []
+        self.count = 0
+        for option in options:
+            self.offsets.append(self.count)
+            self.count += option.count
+
+    def render(self, index):
+        position = bisect.bisect_right(self.offsets, index) - 1
+        return self.options[position].render(index - self.offsets[position])
+
+
+_wildcard_cache = {}  # Path -> (mtime, options)
+
+
+def _read_wildcard(name, wildcard_dir, stack):
+    # The options of wildcard `name`: one per line of <wildcard_dir>/name.txt,
+    # blank lines and "#" comments skipped, each itself a template
+    if name in stack:
+        raise TemplateError(f"wildcard __{name}__ includes itself")
+    if len(stack) >= MAX_WILDCARD_DEPTH:
+        raise TemplateError(f"wildcards nested more than {MAX_WILDCARD_DEPTH} deep")
+    path = os.path.join(wildcard_dir, name + ".txt")
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        raise TemplateError(f"no wildcard file for __{name}__ at {path}")
+    cached = _wildcard_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, encoding="utf-8") as f:
+            lines = [
+                line.strip()
+                for line in f
+                if line.strip() and not line.lstrip().startswith("#")
+            ]
+        cached = _wildcard_cache[path] = (mtime, lines)
+    lines = cached[1]
+    if not lines:
+        raise TemplateError(f"wildcard file {path} is empty")
+    return _Choice([_parse(line, wildcard_dir, stack + (name,)) for line in lines])
+
+
+def _parse(text, wildcard_dir, stack=()):
+    # Recursive descent over "{a|b}" groups, "__name__" wildcards and
+    # backslash escapes
+    position = 0
+
+    def sequence(depth):
+        nonlocal position
+        parts = []
+        literal = []
+
+        def flush():
+            if literal:
+                parts.append(_Literal("".join(literal)))
+                literal.clear()
+
+        while position < len(text):
+            char = text[position]
+            if char == "\\" and position + 1 < len(text):
+                literal.append(text[position + 1])
+                position += 2
+            elif char == "{":
+                flush()
+                position += 1
+                options = [sequence(depth + 1)]
+                while position < len(text) and text[position] == "|":
+                    position += 1
+                    options.append(sequence(depth + 1))
+                if position >= len(text):
+                    raise TemplateError(f"unclosed '{{' in {text!r}")
+                position += 1  # The "}"
+                parts.append(_Choice(options))
+            elif char in "|}" and depth:
+                break  # Ends this option; the caller handles it
+            elif char == "}":
+                raise TemplateError(f"unmatched '}}' in {text!r}")
+            elif char == "_" and (match := WILDCARD_PATTERN.match(text, position)):
+                flush()
+                parts.append(_read_wildcard(match.group(1), wildcard_dir, stack))
+                position = match.end()
+            else:
+                literal.append(char)
+                position += 1
+        flush()
+        return parts[0] if len(parts) == 1 else _Sequence(parts)
+
+    return sequence(0)
+
+
+def is_template(text):
+    # True if `text` uses any template syntax, so plain prompts can skip
+    # parsing (and never fail it)
+    return any(char in text for char in "{}\\") or bool(WILDCARD_PATTERN.search(text))
+
+
+def normalize_prompt(text):
+    # Collapses the runs of spaces an empty option leaves behind
+    return " ".join(text.split())
+
+
+class PromptTemplate:
+    # One or more template lines, each expanding to every combination of
+    # its "{a|b|c}" alternatives and "__name__" wildcards (each line of
+    # name.txt in `wildcard_dir`); groups nest. Prompts are numbered from 0
+    # to count - 1, line by line, and rendered on demand.
+
+    def __init__(self, lines, wildcard_dir=None):
+        if isinstance(lines, str):
+            lines = [lines]
+        self.wildcard_dir = str(wildcard_dir or DEFAULT_WILDCARD_DIR)
+        self._root = _Choice(
+            [
+                _parse(line, self.wildcard_dir) if is_template(line) else _Literal(line)
+                for line in lines
+            ]
+        )
+
+    @property
+    def count(self):
+        # Number of prompts; may be far too many to list
+        return self._root.count
+
+    def prompt_at(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return normalize_prompt(self._root.render(index))
+
+    def random_prompt(self, rng=random):
+        return self.prompt_at(rng.randrange(self.count))
+
+    def __iter__(self):
+        return (self.prompt_at(index) for index in range(self.count))
+
+    def expand(self, limit=None, sample=None, shard=(0, 1), seed=None, dedup=True):
+        # Yields prompts lazily: all of them in order, or `sample` of them
+        # drawn at random (reproducibly for a given `seed`). `shard` =
+        # (index, total) keeps every total-th prompt starting at index, so
+        # `total` machines can split one template; samples of different
+        # shards never overlap. With `dedup` a prompt that has already been
+        # yielded, e.g. from two options that render the same, is dropped.
+        # Stops after `limit` prompts.
+        shard_index, shard_total = shard
+        if not 0 <= shard_index < shard_total:
+            raise ValueError(f"invalid shard {shard_index + 1}/{shard_total}")
+        size = max(0, -(-(self.count - shard_index) // shard_total))
+        if sample is None:
+            positions = range(size)
+        else:
+            positions = _sample_positions(random.Random(seed), size, sample)
+        seen = set()
+        produced = 0
+        for position in positions:
+            if limit is not None and produced >= limit:
+                return
+            prompt = self.prompt_at(shard_index + position * shard_total)
+            if dedup:
+                # 8 bytes per prompt however long the prompts are
+                digest = hashlib.blake2b(prompt.encode("utf-8"), digest_size=8).digest()
+                if digest in seen:
+                    continue
+                seen.add(digest)
+            produced += 1
+            yield prompt
+
+
+def _sample_positions(rng, size, count):
+    # `count` distinct random positions below `size` without listing them
+    # all, which `size` may well be too large for
+    count = min(count, size)
+    if 2 * count > size:
+        yield from rng.sample(range(size), count)
+        return
+    chosen = set()
+    while len(chosen) < count:
+        position = rng.randrange(size)
+        if position not in chosen:
+            chosen.add(position)
+            yield position
+
+
+def parse_shard(text):
+    # "2/8" -> (1, 8): the second of eight shards
+    try:
+        number, total = map(int, text.split("/"))
+    except ValueError:
+        raise ValueError(f"invalid shard {text!r}, expected K/N")
+    if not 1 <= number <= total:
+        raise ValueError(f"invalid shard {text!r}, K must be between 1 and N")
+    return number - 1, total
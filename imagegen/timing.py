@@ -0,0 +1,79 @@
+import json
+import os
+import threading
+
+from imagegen.paths import DATA_DIR
+
+
+DEFAULT_TIMINGS_PATH = DATA_DIR / "timings.json"
+# Starting guess before any generation has been timed: about 6.5s for a
+# 1024x1024 image at 64 steps
+DEFAULT_SECONDS_PER_UNIT = 0.1
+SMOOTHING = 0.3  # Weight of the newest sample in the moving average
+
+
+def work_units(width, height, steps, count=1):
+    # Generation time grows roughly with pixel count times inference steps,
+    # and with the number of images rendered by one request
+    return width * height / 1e6 * steps * count
+
+
+class DurationEstimator:
+    # Learns how long generations take as an exponential moving average of
+    # seconds per megapixel-step, so the GUI and batch queue can show an ETA.
+    # The average is kept in a small JSON file across runs.
+
+    def __init__(self, path=DEFAULT_TIMINGS_PATH):
+        self.path = path
+        self.seconds_per_unit = DEFAULT_SECONDS_PER_UNIT
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.seconds_per_unit = float(data["seconds_per_unit"])
+            self.samples = int(data.get("samples", 0))
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def _save(self):
+        data = {"seconds_per_unit": self.seconds_per_unit, "samples": self.samples}
+        part = f"{self.path}.{threading.get_ident()}.part"
+        try:
+            os.makedirs(os.path.dirname(part), exist_ok=True)
+            with open(part, "w") as f:
+                json.dump(data, f)
+            os.replace(part, self.path)
+        except OSError as e:
+            print(f"Failed to save timings: {e}")
+
+    def estimate(self, width, height, steps, count=1):
+        return work_units(width, height, steps, count) * self.seconds_per_unit
+
+    def observe(self, width, height, steps, seconds, count=1):
+        units = work_units(width, height, steps, count)
+        if units <= 0 or seconds <= 0:
+            return
+        with self._lock:
+            sample = seconds / units
+            if self.samples:
+                self.seconds_per_unit += SMOOTHING * (sample - self.seconds_per_unit)
+            else:
+                self.seconds_per_unit = sample
+            self.samples += 1
+            self._save()
+
+
+_estimator = None
+_estimator_lock = threading.Lock()
+
+
+def get_estimator():
+    global _estimator
+    with _estimator_lock:
+        if _estimator is None:
+            _estimator = DurationEstimator()
+        return _estimator
@@ -0,0 +1,270 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from imagegen.paths import DATA_DIR
+
+
+DEFAULT_TRACE_PATH = DATA_DIR / "traces.jsonl"
+SAMPLES_KEPT = 1000  # Per kind and span, for the percentile summary
+TAIL_BYTES = 1024**2  # How much of an existing log to read back on start
+
+# Spans in request order:
+#   dns           name lookup for a new connection
+#   connect       TCP handshake (DNS included on the asyncio engine)
+#   tls           TLS handshake
+#   ttfb          request sent until response headers, i.e. server time
+#   first_token   streamed enhancement: request sent until the first text
+#   download      waiting on the network for body bytes
+#   b64_decode    decoding base64 image fields out of a JSON body
+#   image_decode  PNG/JPEG -> pixels
+#   display       pixels -> pixmap on screen
+#   save          writing a batch result to disk
+#   total         the whole job as seen by its caller
+SPANS = (
+    "dns",
+    "connect",
+    "tls",
+    "ttfb",
+    "first_token",
+    "download",
+    "b64_decode",
+    "image_decode",
+    "display",
+    "save",
+    "total",
+)
+CONNECTION_SPANS = ("dns", "connect", "tls")
+
+_current = contextvars.ContextVar("imagegen_trace", default=None)
+
+
+class Trace:
+    # Timings for one job. Code deep in the request path adds spans to the
+    # trace of the current thread or task (see tracing()); the owner calls
+    # finish() once to write it to the log.
+
+    def __init__(self, kind, **attrs):
+        self.kind = kind
+        self.attrs = attrs
+        self.spans = {}
+        self.timestamp = time.time()
+        self._started = time.perf_counter()
+        self._finished = False
+        self._lock = threading.Lock()  # Seed sweeps add from several threads
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def elapsed(self):
+        return time.perf_counter() - self._started
+
+    def connection_seconds(self):
+        return sum(self.spans.get(name, 0.0) for name in CONNECTION_SPANS)
+
+    def to_dict(self):
+        return {
+            "kind": self.kind,
+            "ts": self.timestamp,
+            "spans_ms": {
+                name: round(seconds * 1000, 3) for name, seconds in self.spans.items()
+            },
+            **self.attrs,
+        }
+
+    def finish(self, log=None, **attrs):
+        # Records the total and writes the trace; later calls are ignored
+        if self._finished:
+            return
+        self._finished = True
+        self.attrs.update(attrs)
+        self.spans.setdefault("total", time.perf_counter() - self._started)
+        (log or get_trace_log()).record(self)
+
+
+def current_trace():
+    return _current.get()
+
+
+@contextmanager
+def tracing(trace):
+    # Spans recorded by this thread or task inside the block go to `trace`
+    reset = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(reset)
+
+
+def record_span(name, seconds):
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+def timed_chunks(chunks, name="download"):
+    # Passes chunks through, adding the time spent waiting for each one to
+    # the current trace
+    trace = _current.get()
+    if trace is None:
+        yield from chunks
+        return
+    iterator = iter(chunks)
+    while True:
+        start = time.perf_counter()
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            trace.add(name, time.perf_counter() - start)
+            return
+        trace.add(name, time.perf_counter() - start)
+        yield chunk
+
+
+async def timed_achunks(chunks, name="download"):
+    trace = _current.get()
+    iterator = chunks.__aiter__()
+    while True:
+        start = time.perf_counter()
+        try:
+            chunk = await iterator.__anext__()
+        except StopAsyncIteration:
+            if trace is not None:
+                trace.add(name, time.perf_counter() - start)
+            return
+        if trace is not None:
+            trace.add(name, time.perf_counter() - start)
+        yield chunk
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    rank = max(1, round(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class TraceLog:
+    # Appends finished traces to a JSON lines file and keeps the most recent
+    # span durations in memory for percentile summaries. The tail of an
+    # existing log is read back so the summary covers earlier sessions too.
+
+    def __init__(self, path=DEFAULT_TRACE_PATH, enabled=True):
+        self.path = path
+        self.enabled = enabled
+        self._samples = {}  # (kind, span) -> deque of milliseconds
+        # Jobs answered without a request of their own: from the result
+        # cache, or by joining an identical request already in flight
+        self.saved = {"cached": 0, "coalesced": 0}
+        self._lock = threading.Lock()
+        self._load_tail()
+
+    def _load_tail(self):
+        try:
+            with open(self.path, "rb") as f:
+                size = f.seek(0, os.SEEK_END)
+                f.seek(max(0, size - TAIL_BYTES))
+                lines = f.read().splitlines()
+        except OSError:
+            return
+        if size > TAIL_BYTES:
+            lines = lines[1:]  # Most likely cut short by the seek
+        for line in lines:
+            try:
+                event = json.loads(line)
+                self._add_samples(event["kind"], event["spans_ms"], event)
+            except (ValueError, KeyError, TypeError):
+                continue
+
+    def _add_samples(self, kind, spans_ms, attrs):
+        for reason in self.saved:
+            if attrs.get(reason):
+                self.saved[reason] += 1
+        if (
+            attrs.get("cached")
+            or attrs.get("coalesced")
+            or attrs.get("status", "ok") != "ok"
+        ):
+            # Shared results and cut-short jobs would skew the percentiles
+            return
+        for name, ms in spans_ms.items():
+            samples = self._samples.get((kind, name))
+            if samples is None:
+                samples = self._samples[(kind, name)] = deque(maxlen=SAMPLES_KEPT)
+            samples.append(ms)
+
+    def record(self, trace):
+        event = trace.to_dict()
+        with self._lock:
+            self._add_samples(trace.kind, event["spans_ms"], trace.attrs)
+            if not self.enabled:
+                return
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(event) + "\n")
+            except OSError as e:
+                print(f"Failed to write trace: {e}")
+
+    def summary(self):
+        # [(kind, span, count, p50, p95, p99)] in milliseconds
+        with self._lock:
+            samples = {key: sorted(values) for key, values in self._samples.items()}
+        order = {name: i for i, name in enumerate(SPANS)}
+        rows = []
+        for (kind, name), values in sorted(
+            samples.items(), key=lambda item: (item[0][0], order.get(item[0][1], 99))
+        ):
+            rows.append(
+                (
+                    kind,
+                    name,
+                    len(values),
+                    percentile(values, 0.50),
+                    percentile(values, 0.95),
+                    percentile(values, 0.99),
+                )
+            )
+        return rows
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+            self.saved = dict.fromkeys(self.saved, 0)
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+_trace_log = None
+_trace_log_lock = threading.Lock()
+
+
+def configure_trace_log(path=DEFAULT_TRACE_PATH, enabled=True):
+    global _trace_log
+    with _trace_log_lock:
+        _trace_log = TraceLog(path, enabled)
+        return _trace_log
+
+
+def get_trace_log():
+    global _trace_log
+    with _trace_log_lock:
+        if _trace_log is None:
+            _trace_log = TraceLog()
+        return _trace_log
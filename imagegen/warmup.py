@@ -0,0 +1,51 @@
+import threading
+import time
+
+from imagegen.providers import get_provider
+from imagegen.trace import Trace, tracing
+
+
+WARM_INTERVAL = 30.0  # Seconds before the same endpoint is warmed again
+
+_warmed = {}  # (base_url, api_key, enhance) -> time.monotonic() of the last one
+_lock = threading.Lock()
+
+
+def _warm(provider, api_key, enhance):
+    # Imported here: warming is what pays for requests and openai
+    from imagegen.enhance import warm_up_client
+    from imagegen.session import preconnect
+
+    trace = Trace("warmup", provider=provider.name)
+    status = "ok"
+    with tracing(trace):
+        try:
+            preconnect(provider.image_url)
+        except Exception as e:
+            status = "error"
+            print(f"Could not pre-connect to {provider.image_url}: {e}")
+        if enhance:
+            warm_up_client(api_key, provider.base_url)
+    trace.finish(status=status)
+
+
+def prewarm(api_key, enhance=True, force=False):
+    # Gets the configured provider's connections ready on a background
+    # thread before anything is requested: a keep-alive connection for
+    # image requests and, with `enhance`, the OpenAI client with one of its
+    # own. Repeated calls for the same endpoint and key within
+    # WARM_INTERVAL do nothing unless `force`. Returns the thread, or None
+    # if skipped.
+    provider = get_provider()
+    key = (provider.base_url, api_key, enhance)
+    now = time.monotonic()
+    with _lock:
+        last = _warmed.get(key)
+        if not force and last is not None and now - last < WARM_INTERVAL:
+            return None
+        _warmed[key] = now
+    thread = threading.Thread(
+        target=_warm, args=(provider, api_key, enhance), name="prewarm", daemon=True
+    )
+    thread.start()
+    return thread
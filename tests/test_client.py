@@ -0,0 +1,96 @@
+import asyncio
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from imagegen.aio import AsyncEngine
+from imagegen.cache import configure_cache
+from imagegen.client import CACHED_RESPONSE_TEXT, generate_image
+from imagegen.mockserver import MockConfig, start_mock_server
+from imagegen.providers import configure_provider
+
+
+class ResultCacheTest(unittest.TestCase):
+    # Only requests with a seed are repeatable, so only they may be answered
+    # from the result cache
+
+    def setUp(self):
+        self.server = start_mock_server(MockConfig(latency=0.0))
+        configure_provider(
+            "mock", base_url=f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        )
+        self.cache_dir = tempfile.TemporaryDirectory()
+        configure_cache(self.cache_dir.name)
+        self.stats = self.server.RequestHandlerClass.stats
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        configure_cache(enabled=False)
+        self.cache_dir.cleanup()
+        configure_provider()
+
+    def test_seedless_requests_reach_the_server(self):
+        for _ in range(2):
+            status_code, response_text, _ = generate_image("", "a fox", 64, 64)
+            self.assertEqual(status_code, 200)
+            self.assertNotEqual(response_text, CACHED_RESPONSE_TEXT)
+        self.assertEqual(self.stats["images"], 2)
+
+    def test_seeded_requests_are_cached(self):
+        generate_image("", "a fox", 64, 64, seed=7)
+        status_code, response_text, _ = generate_image("", "a fox", 64, 64, seed=7)
+        self.assertEqual(response_text, CACHED_RESPONSE_TEXT)
+        self.assertEqual(self.stats["images"], 1)
+
+    def test_seedless_requests_reach_the_server_async(self):
+        async def generate_twice():
+            engine = AsyncEngine("")
+            try:
+                return [await engine.generate("a fox", 64, 64) for _ in range(2)]
+            finally:
+                await engine.aclose()
+
+        results = asyncio.run(generate_twice())
+        self.assertTrue(all(result[1] != CACHED_RESPONSE_TEXT for result in results))
+        self.assertEqual(self.stats["images"], 2)
+
+
+class CoalescingTest(unittest.TestCase):
+    # Concurrent identical requests share one call only when they would get
+    # the same image with the same credentials
+
+    def setUp(self):
+        self.server = start_mock_server(MockConfig(latency=0.3))
+        configure_provider(
+            "mock", base_url=f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        )
+        configure_cache(enabled=False)
+        self.stats = self.server.RequestHandlerClass.stats
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        configure_provider()
+
+    def generate_concurrently(self, calls):
+        with ThreadPoolExecutor(max_workers=len(calls)) as pool:
+            return list(pool.map(lambda call: generate_image(*call), calls))
+
+    def test_identical_seeded_requests_share_one_call(self):
+        self.generate_concurrently([("key", "a fox", 64, 64, 7)] * 3)
+        self.assertEqual(self.stats["images"], 1)
+
+    def test_seedless_requests_are_not_shared(self):
+        self.generate_concurrently([("key", "a fox", 64, 64)] * 3)
+        self.assertEqual(self.stats["images"], 3)
+
+    def test_requests_with_different_keys_are_not_shared(self):
+        self.generate_concurrently(
+            [("key one", "a fox", 64, 64, 7), ("key two", "a fox", 64, 64, 7)]
+        )
+        self.assertEqual(self.stats["images"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import tempfile
+import unittest
+
+from imagegen.history import HistoryStore
+from imagegen.mockserver import synthetic_png
+
+
+class SharedImageTest(unittest.TestCase):
+    # Entries with identical images share one file, which is removed only
+    # once no entry uses it
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.store = HistoryStore(self.root.name)
+        self.image = synthetic_png(32, 32, 1)
+
+    def tearDown(self):
+        self.root.cleanup()
+
+    def test_file_kept_while_another_entry_uses_it(self):
+        first = self.store.add(self.image, "a fox", 32, 32)
+        second = self.store.add(self.image, "a fox", 32, 32)
+        self.store.delete([first.id])
+        self.assertTrue(self.store.image_path(second).exists())
+        self.store.delete([second.id])
+        self.assertFalse(self.store.image_path(second).exists())
+
+    def test_delete_while_adding_the_same_image(self):
+        first = self.store.add(self.image, "a fox", 32, 32)
+        store_image = self.store._store_image
+
+        def store_then_delete(image_data):
+            # The old entry goes after the new one's image is written but
+            # before it is recorded
+            self.store._store_image = store_image
+            stored = store_image(image_data)
+            self.store.delete([first.id])
+            return stored
+
+        self.store._store_image = store_then_delete
+        second = self.store.add(self.image, "a fox", 32, 32)
+        self.assertTrue(self.store.image_path(second).exists())
+
+
+if __name__ == "__main__":
+    unittest.main()